@@ -0,0 +1,246 @@
+import datetime
+import json
+import os
+import threading
+
+from history_binary import BinaryHistory, MAGIC, RECORD
+from state_log import atomic_write_json
+
+try:
+    import numpy as np
+except ImportError:  # aggregates fall back to plain Python loops
+    np = None
+
+ROLLUP_FILE = "analytics_rollups.json"
+SCAN_BATCH = 20000
+
+# Grouping dimensions and the history field each one is read from ('hour' is the hour of booking)
+DIMENSIONS = {
+    'route': 'name',
+    'destination': 'destination',
+    'provider': 'payment_method',
+    'hour': 'date',
+}
+# Per group: [tickets, revenue, luggage revenue, loyalty/group discount cost]
+MEASURES = ('tickets', 'revenue', 'luggage_revenue', 'discount_cost')
+
+
+def booking_hour(date):
+    try:
+        return f"{int(date[11:13]):02d}:00"
+    except ValueError:
+        return "??:00"
+
+
+def dimension_value(entry, dimension):
+    value = entry[DIMENSIONS[dimension]]
+    return booking_hour(value) if dimension == 'hour' else value
+
+
+class BookingColumns:
+    # Booking history as columns: one integer code array per dimension (with its labels),
+    # the prices, and a booked flag. Arrays are numpy when available, else lists.
+    def __init__(self, codes, labels, total, luggage, base, booked):
+        self.codes = codes
+        self.labels = labels
+        self.total = total
+        self.luggage = luggage
+        self.base = base
+        self.booked = booked
+
+    def __len__(self):
+        return len(self.total)
+
+    @classmethod
+    def from_entries(cls, entries):
+        # Later records for a ticket (cancellations) replace earlier ones
+        rows = {}
+        untracked = []
+        for entry in entries:
+            if entry.get('ticket_id'):
+                rows[entry['ticket_id']] = entry
+            else:
+                untracked.append(entry)
+        entries = untracked + list(rows.values())
+
+        codes = {}
+        labels = {}
+        for dimension in DIMENSIONS:
+            index = {}
+            column = [index.setdefault(dimension_value(entry, dimension), len(index)) for entry in entries]
+            codes[dimension] = column
+            labels[dimension] = list(index)
+        total = [entry['total_price'] for entry in entries]
+        luggage = [entry.get('luggage_price', 0) for entry in entries]
+        base = [entry['base_price'] for entry in entries]
+        booked = [entry.get('status', 'booked') == 'booked' for entry in entries]
+        if np is not None:
+            codes = {dimension: np.array(column, dtype=np.int64) for dimension, column in codes.items()}
+            total, luggage, base = (np.array(column, dtype=np.int64) for column in (total, luggage, base))
+            booked = np.array(booked, dtype=bool)
+        return cls(codes, labels, total, luggage, base, booked)
+
+    @classmethod
+    def from_binary(cls, history):
+        # Zero-copy view of the record file: string IDs are already dictionary codes
+        buffer, count, strings = history.record_buffer()
+        fields = ['name', 'destination', 'departure', 'base_price', 'luggage_price', 'total_price',
+                  'payment_method', 'date', 'user', 'seat', 'status']
+        dtype = np.dtype([(field, '<u4' if i not in (3, 4, 5) else '<i4') for i, field in enumerate(fields)]
+                         + [('ticket_id', 'S16'), ('flags', 'u1'), ('pad', 'V3')])
+        assert dtype.itemsize == RECORD.size
+        records = np.frombuffer(buffer, dtype=dtype, count=count, offset=len(MAGIC))
+        records = records[records['flags'] == 0]
+        labels = {}
+        codes = {}
+        for dimension, field in DIMENSIONS.items():
+            if dimension == 'hour':
+                hours = sorted({booking_hour(s) for s in strings}) or ["??:00"]
+                position = {hour: i for i, hour in enumerate(hours)}
+                lookup = np.array([position[booking_hour(s)] for s in strings] or [0], dtype=np.int64)
+                codes[dimension] = lookup[records['date'].astype(np.int64)]
+                labels[dimension] = hours
+            else:
+                codes[dimension] = records[field].astype(np.int64)
+                labels[dimension] = strings
+        booked_id = strings.index('booked') if 'booked' in strings else -1
+        return cls(codes, labels, records['total_price'].astype(np.int64), records['luggage_price'].astype(np.int64),
+                   records['base_price'].astype(np.int64), records['status'] == booked_id)
+
+    @classmethod
+    def load(cls, history):
+        if np is not None and isinstance(history, BinaryHistory):
+            return cls.from_binary(history)
+        entries = []
+        for _, batch in history.scan(None, SCAN_BATCH):
+            entries.extend(batch)
+        return cls.from_entries(entries)
+
+    def aggregate(self, dimension):
+        # {label: [tickets, revenue, luggage_revenue, discount_cost]} over booked tickets
+        codes = self.codes[dimension]
+        labels = self.labels[dimension]
+        if np is not None:
+            booked = self.booked
+            codes = codes[booked]
+            total = self.total[booked]
+            luggage = self.luggage[booked]
+            discount = self.base[booked] + luggage - total
+            size = len(labels)
+            sums = [np.bincount(codes, minlength=size),
+                    np.bincount(codes, weights=total, minlength=size),
+                    np.bincount(codes, weights=luggage, minlength=size),
+                    np.bincount(codes, weights=discount, minlength=size)]
+            present = np.nonzero(sums[0])[0]
+            return {labels[i]: [int(column[i]) for column in sums] for i in present}
+        result = {}
+        for i, code in enumerate(codes):
+            if not self.booked[i]:
+                continue
+            item = result.get(code)
+            if item is None:
+                item = result[code] = [0, 0, 0, 0]
+            item[0] += 1
+            item[1] += self.total[i]
+            item[2] += self.luggage[i]
+            item[3] += self.base[i] + self.luggage[i] - self.total[i]
+        return {labels[code]: item for code, item in result.items()}
+
+
+def merge_groups(target, groups):
+    for key, values in groups.items():
+        item = target.get(key)
+        if item is None:
+            target[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                item[i] += value
+
+
+class Analytics:
+    # Daily rollups of every dimension, kept on disk with the history position they cover.
+    # refresh() folds in only what the history backend wrote since then (the same scan cursor the
+    # CSV exporter uses); a day with a cancellation in it is recomputed from that day's bookings.
+    def __init__(self, history, path=ROLLUP_FILE):
+        self.history = history
+        self.path = path
+        self.days = {}
+        self.mark = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def refresh(self):
+        with self._lock:
+            origin = self.history.scan_origin()
+            if self.mark is None or self.mark.get('origin') != origin:
+                self.days = {}
+                position = None
+            else:
+                position = self.mark['position']
+            try:
+                position = self._fold(position)
+            except ValueError:
+                # The history was rewritten under the mark; start over
+                self.days = {}
+                position = self._fold(None)
+            self.mark = {'origin': origin, 'position': position}
+            self._save()
+
+    def totals(self, dimension, start_day=None, end_day=None):
+        # Sums daily rollups for days in [start_day, end_day); days are "YYYY-MM-DD"
+        result = {}
+        with self._lock:
+            for day, rollup in self.days.items():
+                if (start_day is None or day >= start_day) and (end_day is None or day < end_day):
+                    merge_groups(result, rollup.get(dimension, {}))
+        return result
+
+    def today(self, dimension):
+        today = datetime.date.today()
+        return self.totals(dimension, today.isoformat(), (today + datetime.timedelta(days=1)).isoformat())
+
+    def _fold(self, position):
+        recompute = set()
+        for position, batch in self.history.scan(position, SCAN_BATCH):
+            fresh = []
+            for entry in batch:
+                if entry.get('status', 'booked') != 'booked':
+                    recompute.add(entry['date'][:10])
+                else:
+                    fresh.append(entry)
+            by_day = {}
+            for entry in fresh:
+                by_day.setdefault(entry['date'][:10], []).append(entry)
+            for day, entries in by_day.items():
+                if day in recompute:
+                    continue
+                self._add_day(day, BookingColumns.from_entries(entries))
+        for day in recompute:
+            entries = self.history.between(day, day + "~")
+            self.days.pop(day, None)
+            self._add_day(day, BookingColumns.from_entries(entries))
+        return position
+
+    def _add_day(self, day, columns):
+        if not len(columns):
+            return
+        rollup = self.days.setdefault(day, {})
+        for dimension in DIMENSIONS:
+            merge_groups(rollup.setdefault(dimension, {}), columns.aggregate(dimension))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+            self.days = saved['days']
+            self.mark = saved['mark']
+        except Exception as e:
+            print(f"Error loading analytics rollups: {e}")
+
+    def _save(self):
+        try:
+            atomic_write_json(self.path, {'mark': self.mark, 'days': self.days})
+        except Exception as e:
+            print(f"Error saving analytics rollups: {e}")
@@ -0,0 +1,414 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import booking_engine
+from booking_engine import BookingEngine, HISTORY_BACKEND, HISTORY_FILE, open_history
+from booking_journal import format_entry
+from history_export import CsvExporter
+from payment_simulator import PaymentSimulator, SimulatorSettings
+from payments import HttpGateway, PaymentPipeline, PAYMENT_WORKERS
+from route_catalog import save_catalog
+
+GUI_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "illuminado.full.py")
+
+DEFAULT_HISTORY_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_ROUTE_COUNTS = [10, 100, 1000, 10_000]
+DESTINATIONS = ["East", "South", "West", "North", "Kigali"]
+PROVIDERS = list(booking_engine.MOBILE_MONEY_PROVIDERS)
+USERS = 500
+BOOKINGS_TIMED = 200
+GENERATE_CHUNK = 100_000
+
+
+# --- Synthetic data ------------------------------------------------------
+
+def route_catalog(count):
+    routes = []
+    for i in range(count):
+        routes.append({
+            'name': f"Route {i:05d}",
+            'start_time': f"{4 + i % 4:02d}:{i % 4 * 15:02d}",
+            'price': 500 + i % 40 * 100,
+            'type': 'illuminado' if i % 25 == 0 else 'normal',
+            'destination': DESTINATIONS[i % len(DESTINATIONS)]
+        })
+    return routes
+
+
+def write_history(path, size, routes):
+    # Pipe-delimited journal lines in the same format the engine writes; unique ticket IDs, spread over users and days
+    start = datetime.date.today().toordinal() - 365
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk_start in range(0, size, GENERATE_CHUNK):
+            lines = []
+            for i in range(chunk_start, min(chunk_start + GENERATE_CHUNK, size)):
+                option = routes[i % len(routes)]
+                day = datetime.date.fromordinal(start + i * 365 // size).isoformat()
+                lines.append(format_entry({
+                    'name': option['name'],
+                    'destination': option['destination'],
+                    'departure': f"{day} {option['start_time']}",
+                    'base_price': option['price'],
+                    'luggage_price': 0,
+                    'total_price': option['price'],
+                    'payment_method': PROVIDERS[i % len(PROVIDERS)],
+                    'date': f"{day} 12:00",
+                    'user': f"user{i % USERS}",
+                    'seat': i % 20 + 1,
+                    'ticket_id': f"B{i:011X}",
+                    'status': 'booked'
+                }))
+            f.write("".join(lines))
+
+
+# --- Timing --------------------------------------------------------------
+
+def timed(func, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def result(case, params, samples, **extra):
+    entry = {
+        'case': case,
+        'params': params,
+        'runs': len(samples),
+        'min_s': min(samples),
+        'median_s': statistics.median(samples),
+    }
+    entry.update(extra)
+    return entry
+
+
+class Workdir:
+    # Every case runs in its own empty directory, since the engine and GUI use cwd-relative data files
+    def __init__(self, root):
+        self.root = root
+        self.path = None
+        self.previous = None
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp(prefix="illuminado-bench-", dir=self.root)
+        self.previous = os.getcwd()
+        os.chdir(self.path)
+        return self.path
+
+    def __exit__(self, *exc):
+        os.chdir(self.previous)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+# --- Engine and persistence cases -----------------------------------------
+
+def bench_history(size, routes, workroot, repeat, backend=HISTORY_BACKEND):
+    results = []
+    with Workdir(workroot):
+        start = time.perf_counter()
+        write_history(HISTORY_FILE, size, routes)
+        params = {'history': size, 'routes': len(routes), 'backend': backend,
+                  'file_bytes': os.path.getsize(HISTORY_FILE)}
+        print(f"history {size:,}: generated in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        if backend != "journal":
+            # The first open imports the text file; that one-off conversion is timed separately
+            history = open_history(backend)
+            results.append(result('import_history', params, timed(history.load)))
+            history.close()
+
+        engines = []
+
+        def startup():
+            engine = BookingEngine(routes=routes, history=open_history(backend))
+            engine.load()
+            engines.append(engine)
+
+        results.append(result('startup', params, timed(startup, repeat)))
+        for engine in engines[:-1]:
+            engine.close()
+        engine = engines[-1]
+
+        load_all = getattr(engine.history, 'load_all', None)
+        if load_all is None:
+            load_all = lambda: sum(1 for _ in engine.history.iter_all())
+        results.append(result('load_history_all', params, timed(load_all)))
+        results.append(result('user_history', params, timed(lambda: engine.user_history("user7", 20), repeat)))
+
+        names = [option['name'] for option in routes]
+        latencies = []
+        for i in range(BOOKINGS_TIMED):
+            name = names[i % len(names)]
+            latencies.extend(timed(lambda: engine.book(name, f"user{i % USERS}", PROVIDERS[0])))
+        results.append(result('book_single', params, latencies,
+                              p95_s=sorted(latencies)[int(len(latencies) * 0.95) - 1]))
+
+        results.append(result('save_state', params, timed(engine.save, repeat)))
+
+        exporter = CsvExporter(engine.history)
+        results.append(result('export_full', params, timed(lambda: exporter.export(incremental=False))))
+        engine.book(names[0], "user1", PROVIDERS[0])
+        results.append(result('export_incremental', params, timed(lambda: exporter.export(incremental=True))))
+        engine.close()
+    return results
+
+
+def bench_routes(count, workroot, repeat):
+    routes = route_catalog(count)
+    params = {'routes': count}
+    results = []
+    with Workdir(workroot):
+        engine = BookingEngine(routes=routes)
+        results.append(result('startup_routes', params, timed(engine.load)))
+        for i in range(min(count, 1000)):
+            engine.book(routes[i]['name'], f"user{i % USERS}", PROVIDERS[0])
+
+        def refresh():
+            engine._refreshed_at = None
+            engine.refresh_departures()
+
+        results.append(result('refresh_departures', params, timed(refresh, repeat)))
+        results.append(result('save_state_routes', params, timed(engine.save, repeat)))
+
+        def search():
+            # 100 searches per sample
+            for _ in range(100):
+                engine.find_routes("East", max_price=3000, window=("06:00", "07:00"), with_seats=True)
+
+        results.append(result('find_routes_compound', params, timed(search, repeat),
+                              matches=len(engine.find_routes("East", max_price=3000, window=("06:00", "07:00"),
+                                                             with_seats=True))))
+        engine.close()
+    return results
+
+
+# --- Payment pipeline ---------------------------------------------------------
+
+def bench_payments(count, latency, workers):
+    # Throughput against the local provider simulator at a given provider latency
+    settings = SimulatorSettings(latency=latency, jitter=latency / 4, decline_rate=0.1, error_rate=0.05)
+    simulator = PaymentSimulator(settings, port=0).start()
+    pipeline = PaymentPipeline(HttpGateway(simulator.url), workers=workers, backoff=0.05)
+    try:
+        start = time.perf_counter()
+        futures = [pipeline.submit(PROVIDERS[i % len(PROVIDERS)], 1000) for i in range(count)]
+        outcomes = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+    finally:
+        pipeline.close()
+        simulator.stop()
+    seconds = sorted(outcome['seconds'] for outcome in outcomes)
+    statuses = {}
+    for outcome in outcomes:
+        statuses[outcome['status']] = statuses.get(outcome['status'], 0) + 1
+    params = {'payments': count, 'provider_latency_s': latency, 'workers': workers}
+    return result('payments', params, [elapsed],
+                  payments_per_s=count / elapsed,
+                  p50_payment_s=seconds[len(seconds) // 2],
+                  p95_payment_s=seconds[int(len(seconds) * 0.95) - 1],
+                  outcomes=statuses)
+
+
+# --- Tk cases --------------------------------------------------------------
+
+def start_virtual_display():
+    # Returns (process, reason). Uses the existing display if there is one, else starts Xvfb.
+    if os.environ.get("DISPLAY"):
+        return None, None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        return None, "no DISPLAY and Xvfb is not installed"
+    display = f":{100 + os.getpid() % 400}"
+    process = subprocess.Popen([xvfb, display, "-screen", "0", "1600x1200x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    if process.poll() is not None:
+        return None, "Xvfb failed to start"
+    os.environ["DISPLAY"] = display
+    return process, None
+
+
+def load_gui():
+    spec = importlib.util.spec_from_file_location("illuminado_gui", GUI_MODULE)
+    gui = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui)
+    # The app asks for a username and may pop a weather alert on startup; answer them without blocking
+    gui.simpledialog.askstring = lambda *args, **kwargs: "bench"
+    for name in ("showinfo", "showwarning", "showerror"):
+        setattr(gui.messagebox, name, lambda *args, **kwargs: "ok")
+    gui.messagebox.askyesno = lambda *args, **kwargs: False
+    return gui
+
+
+def bench_tk(count, history, workroot, repeat):
+    gui = load_gui()
+    routes = route_catalog(count)
+    params = {'routes': count, 'history': history}
+    results = []
+    with Workdir(workroot):
+        # The app reads its routes from the catalog file in the working directory
+        save_catalog(routes)
+        write_history(HISTORY_FILE, history, routes)
+        apps = []
+        board = []
+
+        def startup():
+            start = time.perf_counter()
+            root = gui.tk.Tk()
+            root.withdraw()  # off-screen: widgets are laid out and drawn without mapping the window
+            apps.append(gui.TransportApp(root))
+            # Startup stages are stamped against the GUI module's own clock
+            board.append(gui.STARTED + apps[-1].startup['board'] - start)
+            # The board is up; bookings open once the background load is done
+            while not apps[-1].ready:
+                root.update()
+                time.sleep(0.005)
+
+        # The first start has no board cache; the second draws from the one the first wrote on close
+        for case in ('tk_startup_cold', 'tk_startup_cached'):
+            results.append(result(case, params, timed(startup), board_s=board[-1]))
+            if case == 'tk_startup_cold':
+                apps[-1].on_close()
+        app = apps[-1]
+
+        def cold_refresh():
+            app.tree.delete(*app.tree.get_children())
+            app.row_cache.clear()
+            app.visible_rows.clear()
+            app.refresh_treeview()
+            app.root.update()
+
+        results.append(result('tk_refresh_cold', params, timed(cold_refresh, repeat)))
+
+        def warm_refresh():
+            app.refresh_treeview()
+            app.root.update()
+
+        results.append(result('tk_refresh_unchanged', params, timed(warm_refresh, repeat)))
+
+        def filter_switch():
+            for destination in ["East", "All"]:
+                app.destination_var.set(destination)
+                app.refresh_treeview()
+                app.root.update()
+
+        results.append(result('tk_filter_switch', params, timed(filter_switch, repeat)))
+
+        def compound_filter():
+            for price, window, with_seats in [("Under 3,000", "06:00–07:00", True), ("Any price", "Any time", False)]:
+                app.price_var.set(price)
+                app.window_var.set(window)
+                app.with_seats_var.set(with_seats)
+                app.refresh_treeview()
+                app.root.update()
+
+        app.destination_var.set("East")
+        results.append(result('tk_filter_compound', params, timed(compound_filter, repeat)))
+        app.destination_var.set("All")
+
+        def book_and_refresh():
+            app.engine.book(routes[0]['name'], "bench", PROVIDERS[0])
+            app.refresh_treeview()
+            app.root.update()
+
+        results.append(result('tk_book_refresh', params, timed(book_and_refresh, repeat)))
+        app.engine.close()
+        app.root.destroy()
+    return results
+
+
+# --- Driver -------------------------------------------------------------------
+
+def compare(results, baseline_path):
+    # Adds median ratios against a previous run's JSON so regressions stand out
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    previous = {(r['case'], json.dumps(r['params'], sort_keys=True)): r for r in baseline['results']}
+    for entry in results:
+        old = previous.get((entry['case'], json.dumps(entry['params'], sort_keys=True)))
+        if old and old['median_s'] > 0:
+            entry['baseline_median_s'] = old['median_s']
+            entry['ratio'] = entry['median_s'] / old['median_s']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Illuminado benchmarks; prints results as JSON")
+    parser.add_argument("--history", type=int, nargs="*", default=DEFAULT_HISTORY_SIZES,
+                        help="history sizes in bookings (up to 10000000)")
+    parser.add_argument("--routes", type=int, nargs="*", default=DEFAULT_ROUTE_COUNTS,
+                        help="route catalog sizes")
+    parser.add_argument("--backend", choices=["journal", "sqlite", "binary"], nargs="*", default=[HISTORY_BACKEND],
+                        help="history backends to run the history cases against")
+    parser.add_argument("--history-routes", type=int, default=100,
+                        help="catalog size used for the history cases")
+    parser.add_argument("--tk-history", type=int, default=10_000,
+                        help="history size loaded for the Tk cases")
+    parser.add_argument("--payments", type=int, default=200, help="payments per latency; 0 skips")
+    parser.add_argument("--payment-latency", type=float, nargs="*", default=[0.05, 0.5],
+                        help="simulated provider latencies in seconds")
+    parser.add_argument("--payment-workers", type=int, default=PAYMENT_WORKERS)
+    parser.add_argument("--no-tk", action="store_true", help="skip the Tk cases")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workdir", default=None, help="where temporary data files go")
+    parser.add_argument("--baseline", default=None, help="previous JSON output to compare against")
+    parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        'started': datetime.datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [],
+        'skipped': []
+    }
+    results = report['results']
+
+    history_routes = route_catalog(args.history_routes)
+    for backend in args.backend:
+        for size in args.history:
+            results.extend(bench_history(size, history_routes, args.workdir, args.repeat, backend))
+    for count in args.routes:
+        results.extend(bench_routes(count, args.workdir, args.repeat))
+    if args.payments:
+        for latency in args.payment_latency:
+            results.append(bench_payments(args.payments, latency, args.payment_workers))
+
+    if args.no_tk:
+        report['skipped'].append({'cases': 'tk', 'reason': "--no-tk"})
+    else:
+        display, reason = start_virtual_display()
+        try:
+            if reason is not None:
+                report['skipped'].append({'cases': 'tk', 'reason': reason})
+            else:
+                for count in args.routes:
+                    results.extend(bench_tk(count, args.tk_history, args.workdir, args.repeat))
+        finally:
+            if display is not None:
+                display.terminate()
+                display.wait()
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,972 @@
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+
+from booking_journal import BookingJournal
+from booking_store import BookingStore
+from history_binary import BinaryHistory
+from loyalty import LoyaltyProgram, points_for
+from profile_store import ProfileStore
+from route_catalog import CATALOG_FILE, RouteIndex, load_catalog
+from metrics import counter, histogram
+from seat_holds import HOLD_TTL, ExpiryHeap
+from seat_map import SeatMap
+from write_behind import WriteBehind
+from timetable import Timetable, departure_key, minute_of, parse_departure_key
+from state_log import StateLog, atomic_write_json
+
+# Rwanda Transportation Routes, used when there is no CATALOG_FILE
+transport_options = [
+    {'name': 'Illuminado Express', 'start_time': '05:00', 'price': 3500, 'type': 'illuminado', 'destination': 'All Major Cities'},
+    {'name': 'Express A - Kayonza', 'start_time': '05:30', 'price': 2500, 'type': 'normal', 'destination': 'East'},
+    {'name': 'Express B - Rwamagana', 'start_time': '06:00', 'price': 2000, 'type': 'normal', 'destination': 'East'},
+    {'name': 'Express C - Nyagatare', 'start_time': '06:30', 'price': 3000, 'type': 'normal', 'destination': 'East'},
+    {'name': 'Express D - Kirehe', 'start_time': '07:00', 'price': 2800, 'type': 'normal', 'destination': 'East'},
+    {'name': 'Express F - Huye', 'start_time': '05:45', 'price': 2200, 'type': 'normal', 'destination': 'South'},
+    {'name': 'Express G - Muhanga', 'start_time': '06:15', 'price': 1800, 'type': 'normal', 'destination': 'South'},
+    {'name': 'Express K - Rubavu', 'start_time': '05:15', 'price': 3200, 'type': 'normal', 'destination': 'West'},
+    {'name': 'Express L - Karongi', 'start_time': '05:45', 'price': 2900, 'type': 'normal', 'destination': 'West'},
+    {'name': 'Express P - Musanze', 'start_time': '05:20', 'price': 2800, 'type': 'normal', 'destination': 'North'},
+    {'name': 'Express Z - Kigali CBD Shuttle', 'start_time': '04:30', 'price': 500, 'type': 'normal', 'destination': 'Kigali'},
+]
+
+# Configuration files
+STATE_FILE = "transport_state.json"
+HISTORY_FILE = "booking_history.txt"
+CSV_FILE = "booking_history.csv"
+USER_PROFILES_FILE = "user_profiles.json"
+PROFILES_DB = "user_profiles.db"
+HISTORY_DB = "booking_history.db"
+HISTORY_BIN = "booking_history.bin"
+STATE_LOG_FILE = "transport_state.log"
+BOARD_FILE = "departure_board.json"
+
+# Upcoming departures per route written to BOARD_FILE with each snapshot, so a display can
+# draw the board before the state is loaded
+BOARD_DEPARTURES = 4
+
+# Seat and profile changes go to STATE_LOG_FILE; after this many records the state and
+# profile files are rewritten as a fresh snapshot and the log starts over
+SNAPSHOT_EVERY = 1000
+
+# "sqlite" uses the indexed HISTORY_DB, so per-user, per-route and date queries never scan the
+# whole history; "journal" keeps history in memory, appended to HISTORY_FILE; "binary" uses
+# fixed-width records in HISTORY_BIN (an existing HISTORY_FILE is imported the first time either is created)
+HISTORY_BACKEND = "sqlite"
+
+# "sqlite" keeps one row per passenger in PROFILES_DB (importing an existing USER_PROFILES_FILE
+# the first time); "json" keeps every profile in USER_PROFILES_FILE, rewritten on each snapshot
+PROFILE_BACKEND = "sqlite"
+
+# Seats on each departure, unless a route sets its own 'capacity'
+SEATS_PER_ROUTE = 20
+
+# Rwanda Mobile Money Providers
+MOBILE_MONEY_PROVIDERS = {
+    'MTN Mobile Money': "*182*6*1*1*078xxxxxx*{amount}#",
+    'Airtel Money': "*182*1*1*078xxxxxx*{amount}#",
+    'Tigo Cash': "*188*1*1*078xxxxxx*{amount}#"
+}
+
+# Luggage options with prices
+LUGGAGE_OPTIONS = {
+    'small': {"name": "Small Bag", "price": 0, "emoji": "🎒"},
+    'medium': {"name": "Medium Bag", "price": 500, "emoji": "🛄"},
+    'large': {"name": "Large Bag", "price": 1000, "emoji": "🧳"},
+    'extra': {"name": "Extra Luggage", "price": 2000, "emoji": "📦"}
+}
+
+# Loyalty program tiers
+LOYALTY_TIERS = {
+    'bronze': {"min_rides": 0, "discount": 0, "name": "Bronze"},
+    'silver': {"min_rides": 10, "discount": 5, "name": "Silver"},
+    'gold': {"min_rides": 25, "discount": 10, "name": "Gold"},
+    'platinum': {"min_rides": 50, "discount": 15, "name": "Platinum"}
+}
+
+# Group pricing: (minimum passengers, percent off each ticket), largest group first.
+# A group gets this or the booker's loyalty discount, whichever is larger.
+GROUP_DISCOUNTS = [(40, 20), (20, 15), (10, 10)]
+MAX_GROUP_SIZE = 200
+
+
+def open_history(backend=HISTORY_BACKEND, history_file=HISTORY_FILE, history_db=HISTORY_DB, history_bin=HISTORY_BIN):
+    if backend == "binary":
+        return BinaryHistory(history_bin, legacy_history=history_file)
+    if backend == "sqlite":
+        return BookingStore(history_db, legacy_history=history_file)
+    if backend == "journal":
+        return BookingJournal(history_file)
+    raise ValueError(f"Unknown history backend: {backend}")
+
+
+def open_profiles(backend=PROFILE_BACKEND, profiles_file=USER_PROFILES_FILE, profiles_db=PROFILES_DB):
+    # None means profiles live in the engine's dict and are persisted through the state log
+    if backend == "sqlite":
+        return ProfileStore(profiles_db, legacy_profiles=profiles_file)
+    if backend == "json":
+        return None
+    raise ValueError(f"Unknown profile backend: {backend}")
+
+
+def open_catalog(path=CATALOG_FILE):
+    # A broken catalog file must not take the booking system down; the built-in routes stand in
+    try:
+        return load_catalog(path, transport_options)
+    except Exception as e:
+        print(f"Error loading route catalog: {e}")
+        return transport_options
+
+
+PERSIST_SECONDS = histogram("illuminado_persistence_seconds", "Time spent in persistence calls.", ["op"])
+BOOKING_SECONDS = histogram("illuminado_booking_phase_seconds", "Time spent in each booking phase.", ["phase"])
+BOOKINGS = counter("illuminado_bookings_total", "Booking attempts by outcome.", ["result"])
+CANCELLATIONS = counter("illuminado_cancellations_total", "Tickets cancelled.")
+HOLDS = counter("illuminado_seat_holds_total", "Seat holds by how they ended.", ["result"])
+
+
+def route_data(option):
+    # Live inventory for one route: seat maps for departures that have bookings, keyed by
+    # "YYYY-MM-DD HH:MM", plus the departure on sale now and its free seat count. Seats held for
+    # purchases in progress are taken in the seat map and also set in 'holds' (a bitmask per
+    # departure), which keeps them out of the saved state.
+    return {
+        'price': option['price'],
+        'type': option['type'],
+        'destination': option.get('destination', 'Unknown'),
+        'capacity': option.get('capacity', SEATS_PER_ROUTE),
+        'seat_maps': {},
+        'holds': {},
+        'next_departure': None,
+        'seats': 0
+    }
+
+
+def group_discount(passengers):
+    for minimum, percent in GROUP_DISCOUNTS:
+        if passengers >= minimum:
+            return percent
+    return 0
+
+
+def departure_seats(data, departure):
+    seats = data['seat_maps'].get(departure)
+    if seats is None:
+        seats = data['seat_maps'][departure] = SeatMap(data['capacity'])
+    return seats
+
+
+def load_board(path=BOARD_FILE, now=None):
+    # Board rows from the last snapshot, each pointed at its first departure that hasn't left:
+    # {name: {'destination', 'price', 'type', 'next_departure', 'seats'}}; {} when there is none
+    try:
+        with open(path, "r") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Error loading departure board: {e}")
+        return {}
+    departed = departure_key(now if now is not None else minute_of())
+    board = {}
+    for name, row in saved.items():
+        upcoming = [(departure, seats) for departure, seats in row['departures'] if departure >= departed]
+        departure, seats = upcoming[0] if upcoming else (None, 0)
+        board[name] = {'destination': row['destination'], 'price': row['price'], 'type': row['type'],
+                       'next_departure': departure, 'seats': seats}
+    return board
+
+
+def seat_number(seat):
+    try:
+        return int(seat)
+    except (TypeError, ValueError):
+        return None
+
+
+def new_profile():
+    return {
+        'loyalty_points': 0,
+        'total_rides': 0,
+        'preferred_language': 'en',
+        'preferred_payment': 'MTN Mobile Money'
+    }
+
+
+class BookingError(Exception):
+    pass
+
+
+class BookingEngine:
+    # Display-free booking logic shared by the tkinter app, scripts and servers.
+    # Every seat or profile change is one record in the state log; save() writes a snapshot.
+    # Safe to call from several threads: seat changes are serialized per route, profile
+    # changes by one profile lock, and the history backends lock their own writes.
+    def __init__(self, routes=None, state_file=STATE_FILE, history_file=HISTORY_FILE,
+                 profiles_file=USER_PROFILES_FILE, state_log_file=STATE_LOG_FILE, history=None, profile_store=None,
+                 board_file=BOARD_FILE):
+        self.routes = routes if routes is not None else open_catalog()
+        self.state_file = state_file
+        self.profiles_file = profiles_file
+        self.board_file = board_file
+        self.transport_data = {}
+        # With a profile store this only caches the passengers seen by this process
+        self.user_profiles = {}
+        self.profile_store = profile_store if profile_store is not None else open_profiles(profiles_file=profiles_file)
+        self.timetable = Timetable()
+        self.timetable.build(self.routes)
+        self.route_index = RouteIndex(self.routes, self.timetable)
+        self.loyalty = LoyaltyProgram(LOYALTY_TIERS)
+        self.history = history if history is not None else open_history(history_file=history_file)
+        self.state_log = StateLog(state_log_file)
+        # Profile changes and snapshots are coalesced off the booking path; seat changes are logged at once
+        self.write_behind = WriteBehind(self._flush_dirty)
+        # hold ID -> (route, departure, seat, user) for seats held during a purchase
+        self.holds = {}
+        self.hold_expiry = ExpiryHeap(self._expire_hold)
+        self._refreshed_at = None
+        self._route_locks = {}
+        self._profile_lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+
+    def load(self, on_progress=None):
+        # on_progress(done, total, stage) before each step and once at the end, for startup displays
+        steps = [("Loading seats", self.load_state), ("Loading profiles", self.load_user_profiles),
+                 ("Replaying changes", self.recover_state), ("Loading history", self.load_history)]
+        for done, (stage, step) in enumerate(steps):
+            if on_progress is not None:
+                on_progress(done, len(steps), stage)
+            step()
+        if on_progress is not None:
+            on_progress(len(steps), len(steps), "Ready")
+
+    def save(self):
+        # Snapshot: the live log is set aside first, so any change logged while the snapshot
+        # is written lands in the new log and is replayed on top of it after a crash
+        with self._snapshot_lock, PERSIST_SECONDS.time("snapshot"):
+            self.state_log.rotate()
+            try:
+                self.save_state()
+                self.save_user_profiles()
+            except Exception as e:
+                print(f"Error saving snapshot: {e}")
+                return
+            self.state_log.discard_rotated()
+            self.save_board()
+
+    def close(self):
+        self.hold_expiry.close()
+        self.write_behind.close()
+        self.save()
+        self.state_log.close()
+        self.history.close()
+        if self.profile_store is not None:
+            self.profile_store.close()
+
+    # --- Departures and pricing -------------------------------------------
+
+    def refresh_departures(self, now=None):
+        # Point every route at its next departure for the current minute and drop seat maps
+        # of departures that have left. Rebuilds the timetable when the day rolls over.
+        now = now if now is not None else minute_of()
+        if now == self._refreshed_at:
+            return
+        if not self.timetable.covers(now):
+            self.timetable.build(self.routes, now)
+            self.route_index.index_departures(self.timetable)
+        departed = departure_key(now)
+        for name, data in self.transport_data.items():
+            with self.route_lock(name):
+                self._point_at_next(name, data, now)
+                for departure in [d for d in data['seat_maps'] if d < departed]:
+                    del data['seat_maps'][departure]
+                    data['holds'].pop(departure, None)
+        self._refreshed_at = now
+
+    def _point_at_next(self, name, data, now):
+        minute = self.timetable.next_departure(name, now)
+        if minute is None:
+            data['next_departure'] = None
+            data['seats'] = 0
+            return
+        data['next_departure'] = departure_key(minute)
+        seats = data['seat_maps'].get(data['next_departure'])
+        data['seats'] = seats.free if seats is not None else data['capacity']
+
+    def upcoming_departures(self, name, limit=8):
+        self.route(name)
+        return [departure_key(minute) for minute in self.timetable.upcoming(name, minute_of(), limit)]
+
+    def list_departures(self, destination=None, **criteria):
+        # (name, data) for routes to destination ("All" or None for every one) that also match
+        # any other find_routes() criteria
+        names = self.find_routes(None if destination == "All" else destination, **criteria)
+        return [(name, self.transport_data[name]) for name in names if name in self.transport_data]
+
+    def find_routes(self, destination=None, route_type=None, min_price=None, max_price=None, window=None,
+                    with_seats=False, now=None):
+        # Names of the routes matching every given criterion, in catalog order, from the route
+        # index: prices in [min_price, max_price), a departure in the next ("HH:MM", "HH:MM")
+        # window, and with with_seats a free seat on the next departure (or one in the window)
+        now = now if now is not None else minute_of()
+        self.refresh_departures(now)
+        names = self.route_index.search(destination, route_type, min_price, max_price, window, now)
+        if not with_seats:
+            return names
+        if window is None:
+            return [name for name in names if name in self.transport_data and self.transport_data[name]['seats'] > 0]
+        low, high = self.route_index.window_range(window, now)
+        return [name for name in names if self._seats_between(name, low, high)]
+
+    def _seats_between(self, name, low, high):
+        data = self.transport_data.get(name)
+        if data is None:
+            return False
+        # Departures nobody has booked have no seat map yet
+        seat_maps = data['seat_maps']
+        for minute in self.timetable.between(name, low, high):
+            seats = seat_maps.get(departure_key(minute)) if seat_maps else None
+            if (seats.free if seats is not None else data['capacity']) > 0:
+                return True
+        return False
+
+    def route(self, name):
+        data = self.transport_data.get(name)
+        if data is None:
+            raise BookingError(f"Unknown route: {name}")
+        return data
+
+    def route_lock(self, name):
+        return self._route_locks.setdefault(name, threading.Lock())
+
+    def seat_map(self, name, departure=None):
+        data = self.route(name)
+        departure = departure or data['next_departure']
+        if departure is None:
+            return None
+        with self.route_lock(name):
+            return departure_seats(data, departure)
+
+    def loyalty_tier(self, username):
+        profile = self.user_profiles.get(username)
+        if profile is None:
+            profile = self.profile(username) or {}
+        return self.loyalty.tier(username, profile.get('total_rides', 0))
+
+    def recompute_loyalty(self, tiers=None, from_history=False):
+        # For a tier-table change: re-tiers every profile, and with from_history rebuilds
+        # rides and points from the booking history too. Returns the profiles whose tier changed.
+        with self._profile_lock:
+            bookings = self.history.iter_all() if from_history else None
+            if self.profile_store is None:
+                changed = self.loyalty.recompute(self.user_profiles, tiers, bookings)
+                if from_history:
+                    for username in self.user_profiles:
+                        self._mark_profile(username)
+                return changed
+            profiles = dict(self.profile_store.items())
+            changed = self.loyalty.recompute(profiles, tiers, bookings)
+            if from_history:
+                self.profile_store.put_many(profiles)
+                self.user_profiles = {username: profiles[username] for username in self.user_profiles
+                                      if username in profiles}
+        return changed
+
+    def loyalty_discount(self, username):
+        return self.loyalty_tier(username)['discount']
+
+    def quote(self, name, username, luggage='small'):
+        with BOOKING_SECONDS.time("quote"):
+            return self._quote(name, username, luggage)
+
+    def _quote(self, name, username, luggage):
+        self.refresh_departures()
+        data = self.route(name)
+        if luggage not in LUGGAGE_OPTIONS:
+            raise BookingError(f"Unknown luggage option: {luggage}")
+        luggage_price = LUGGAGE_OPTIONS[luggage]['price']
+        total_price = data['price'] + luggage_price
+        discount = self.loyalty_discount(username)
+        discount_amount = total_price * discount // 100
+        return {
+            'name': name,
+            'departure': data['next_departure'],
+            'base_price': data['price'],
+            'luggage': luggage,
+            'luggage_price': luggage_price,
+            'discount': discount,
+            'discount_amount': discount_amount,
+            'total_price': total_price - discount_amount
+        }
+
+    def group_quote(self, name, username, passengers, luggage='small'):
+        # Per-ticket prices as in quote(), with the group discount applied instead of loyalty when larger
+        if not 1 <= passengers <= MAX_GROUP_SIZE:
+            raise BookingError(f"A group booking is for 1 to {MAX_GROUP_SIZE} passengers.")
+        quote = self.quote(name, username, luggage)
+        group = group_discount(passengers)
+        if group > quote['discount']:
+            price = quote['base_price'] + quote['luggage_price']
+            quote['discount'] = group
+            quote['discount_amount'] = price * group // 100
+            quote['total_price'] = price - quote['discount_amount']
+        quote['passengers'] = passengers
+        quote['group_discount'] = group
+        quote['group_total'] = quote['total_price'] * passengers
+        return quote
+
+    # --- Users -----------------------------------------------------------
+
+    def login(self, username):
+        with self._profile_lock:
+            if self.profile_store is not None:
+                self.user_profiles[username] = self.profile_store.login(username, new_profile())
+            elif username not in self.user_profiles:
+                self.user_profiles[username] = new_profile()
+                self._mark_profile(username)
+            return self.user_profiles[username]
+
+    def profile(self, username):
+        # The passenger's current profile (re-read from the store, which other terminals share), or None
+        if self.profile_store is None:
+            return self.user_profiles.get(username)
+        profile = self.profile_store.get(username)
+        if profile is not None:
+            with self._profile_lock:
+                self.user_profiles[username] = profile
+        return profile
+
+    def _credit(self, username, points, rides):
+        # Adds points and rides to an existing profile (negative to take them back), never below zero
+        with self._profile_lock:
+            if self.profile_store is not None:
+                profile = self.profile_store.credit(username, points, rides)
+                if profile is not None:
+                    self.user_profiles[username] = profile
+                return
+            profile = self.user_profiles.get(username)
+            if profile is not None:
+                profile['loyalty_points'] = max(profile.get('loyalty_points', 0) + points, 0)
+                profile['total_rides'] = max(profile.get('total_rides', 0) + rides, 0)
+                self._mark_profile(username)
+
+    # --- Booking ---------------------------------------------------------
+
+    def book(self, name, username, provider, luggage='small', seat=None, quote=None, departure=None, hold=None):
+        # Sells the next departure, or a specific later one ("YYYY-MM-DD HH:MM") if it hasn't left yet.
+        # With a hold ID from hold(), the held seat is the one sold; if the hold has expired the
+        # sale falls back to seat and departure like any other.
+        start = time.perf_counter()
+        try:
+            entry = self._book(name, username, provider, luggage, seat, quote, departure, hold)
+        except BookingError:
+            BOOKINGS.inc("rejected")
+            raise
+        BOOKINGS.inc("booked")
+        BOOKING_SECONDS.observe(time.perf_counter() - start, "total")
+        return entry
+
+    def _book(self, name, username, provider, luggage, seat, quote, departure, hold):
+        data = self.route(name)
+        if quote is None:
+            quote = self.quote(name, username, luggage)
+
+        now = minute_of()
+        self.refresh_departures(now)
+        with BOOKING_SECONDS.time("seat"), self.route_lock(name):
+            held = self._claim_hold(name, username, data, hold) if hold is not None else None
+            if held is not None:
+                departure, seat = held
+            else:
+                departure = self._check_departure(name, data, departure, now)
+                seats = departure_seats(data, departure)
+                if seats.free <= 0:
+                    raise BookingError("No seats available.")
+                # Take the requested seat, or assign the lowest free one
+                taken = seats.take(seat_number(seat) if seat is not None else None)
+                if taken is None:
+                    raise BookingError(f"Seat {seat} is not available on the {departure} departure.")
+                seat = taken
+                if departure == data['next_departure']:
+                    data['seats'] = seats.free
+            self._log_route(name)
+
+        with BOOKING_SECONDS.time("profile"):
+            self._credit(username, points_for(quote['total_price']), 1)
+
+        entry = {
+            'name': name,
+            'destination': data.get('destination', 'Unknown'),
+            'departure': departure,
+            'base_price': data['price'],
+            'luggage_price': quote['luggage_price'],
+            'total_price': quote['total_price'],
+            'payment_method': provider,
+            'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+            'user': username,
+            'seat': seat,
+            'ticket_id': uuid.uuid4().hex[:12].upper(),
+            'status': 'booked'
+        }
+        self.save_history(entry)
+        return entry
+
+    # --- Seat holds ------------------------------------------------------
+
+    def hold(self, name, username, seat=None, departure=None, ttl=HOLD_TTL):
+        # Takes a seat off sale while the customer pays. book(..., hold=hold_id) turns it into the
+        # sale; release_hold(), or ttl seconds without either, puts it back on sale.
+        data = self.route(name)
+        now = minute_of()
+        self.refresh_departures(now)
+        with self.route_lock(name):
+            departure = self._check_departure(name, data, departure, now)
+            seats = departure_seats(data, departure)
+            if seats.free <= 0:
+                raise BookingError("No seats available.")
+            taken = seats.take(seat_number(seat) if seat is not None else None)
+            if taken is None:
+                raise BookingError(f"Seat {seat} is not available on the {departure} departure.")
+            data['holds'][departure] = data['holds'].get(departure, 0) | 1 << (taken - 1)
+            if departure == data['next_departure']:
+                data['seats'] = seats.free
+            hold_id = uuid.uuid4().hex[:12].upper()
+            self.holds[hold_id] = (name, departure, taken, username)
+        self.hold_expiry.schedule(hold_id, ttl)
+        HOLDS.inc("taken")
+        return {'hold_id': hold_id, 'name': name, 'departure': departure, 'seat': taken, 'ttl': ttl}
+
+    def release_hold(self, hold_id):
+        # Puts a held seat back on sale; False if the hold was already sold, released or expired
+        if self._drop_hold(hold_id):
+            HOLDS.inc("released")
+            return True
+        return False
+
+    def _expire_hold(self, hold_id):
+        if self._drop_hold(hold_id):
+            HOLDS.inc("expired")
+
+    def _drop_hold(self, hold_id):
+        held = self.holds.get(hold_id)
+        if held is None:
+            return False
+        name, departure, seat, _ = held
+        self.hold_expiry.cancel(hold_id)
+        with self.route_lock(name):
+            if self.holds.pop(hold_id, None) is None:
+                return False
+            data = self.transport_data.get(name)
+            mask = 1 << (seat - 1)
+            # The departure may have left, or seats been reset, since the hold was taken
+            if data is None or not data['holds'].get(departure, 0) & mask:
+                return False
+            data['holds'][departure] &= ~mask
+            seats = data['seat_maps'][departure]
+            seats.release(seat)
+            if departure == data['next_departure']:
+                data['seats'] = seats.free
+        return True
+
+    def _claim_hold(self, name, username, data, hold_id):
+        # Called under the route lock: the held seat stays taken and simply stops being a hold.
+        # Returns (departure, seat), or None when this passenger has no such hold on this route
+        # any more; someone else's hold is left alone.
+        held = self.holds.get(hold_id)
+        if held is None or held[0] != name or held[3] != username:
+            return None
+        _, departure, seat, _ = held
+        del self.holds[hold_id]
+        self.hold_expiry.cancel(hold_id)
+        mask = 1 << (seat - 1)
+        if not data['holds'].get(departure, 0) & mask:
+            return None
+        data['holds'][departure] &= ~mask
+        HOLDS.inc("sold")
+        return departure, seat
+
+    def hold_group(self, name, username, passengers, departure=None, spread=False, ttl=HOLD_TTL):
+        # Holds the seats book_group() would take, one hold per seat, all or none. Pass the
+        # returned hold_ids to book_group(..., holds=...) once the group is paid for.
+        if not 1 <= passengers <= MAX_GROUP_SIZE:
+            raise BookingError(f"A group booking is for 1 to {MAX_GROUP_SIZE} passengers.")
+        data = self.route(name)
+        now = minute_of()
+        self.refresh_departures(now)
+        held = []
+        with self.route_lock(name):
+            for key, count in self._plan_group(name, data, passengers, departure, spread, now):
+                seats = departure_seats(data, key)
+                for _ in range(count):
+                    taken = seats.take()
+                    data['holds'][key] = data['holds'].get(key, 0) | 1 << (taken - 1)
+                    hold_id = uuid.uuid4().hex[:12].upper()
+                    self.holds[hold_id] = (name, key, taken, username)
+                    held.append((hold_id, key, taken))
+            if data['next_departure'] in data['seat_maps']:
+                data['seats'] = data['seat_maps'][data['next_departure']].free
+        for hold_id, _, _ in held:
+            self.hold_expiry.schedule(hold_id, ttl)
+        HOLDS.inc("taken", amount=len(held))
+        return {'hold_ids': [hold_id for hold_id, _, _ in held], 'name': name, 'departure': held[0][1],
+                'seats': [[key, seat] for _, key, seat in held], 'ttl': ttl}
+
+    def book_group(self, name, username, provider, passengers, luggage='small', departure=None,
+                   spread=False, quote=None, holds=None):
+        # Books passengers seats in one step: all on one departure, or with spread=True filling
+        # that departure and then the following ones. Either every seat is taken or none is, and
+        # the whole group costs one state log record per route/profile and one history write.
+        # With hold IDs from hold_group(), the held seats are sold; any that lapsed are replaced
+        # as for a group without holds.
+        start = time.perf_counter()
+        try:
+            entries = self._book_group(name, username, provider, passengers, luggage, departure, spread, quote, holds)
+        except BookingError:
+            BOOKINGS.inc("rejected")
+            raise
+        BOOKINGS.inc("booked", amount=len(entries))
+        BOOKING_SECONDS.observe(time.perf_counter() - start, "group")
+        return entries
+
+    def _book_group(self, name, username, provider, passengers, luggage, departure, spread, quote, holds):
+        data = self.route(name)
+        if quote is None or quote.get('passengers') != passengers:
+            quote = self.group_quote(name, username, passengers, luggage)
+        if holds and len(holds) > passengers:
+            raise BookingError(f"{len(holds)} held seats for a group of {passengers}.")
+
+        now = minute_of()
+        self.refresh_departures(now)
+        with BOOKING_SECONDS.time("seat"), self.route_lock(name):
+            taken = [held for held in (self._claim_hold(name, username, data, hold_id) for hold_id in holds or ())
+                     if held is not None]
+            if len(taken) < passengers:
+                try:
+                    plan = self._plan_group(name, data, passengers - len(taken), departure, spread, now)
+                except BookingError:
+                    # Nothing is sold: the seats claimed from holds go back on sale
+                    for key, seat in taken:
+                        data['seat_maps'][key].release(seat)
+                    if data['next_departure'] in data['seat_maps']:
+                        data['seats'] = data['seat_maps'][data['next_departure']].free
+                    raise
+                for key, count in plan:
+                    seats = departure_seats(data, key)
+                    taken.extend((key, seats.take()) for _ in range(count))
+            if data['next_departure'] in data['seat_maps']:
+                data['seats'] = data['seat_maps'][data['next_departure']].free
+            self._log_route(name)
+
+        with BOOKING_SECONDS.time("profile"):
+            self._credit(username, points_for(quote['group_total']), passengers)
+
+        booked_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+        entries = [{
+            'name': name,
+            'destination': data.get('destination', 'Unknown'),
+            'departure': key,
+            'base_price': data['price'],
+            'luggage_price': quote['luggage_price'],
+            'total_price': quote['total_price'],
+            'payment_method': provider,
+            'date': booked_at,
+            'user': username,
+            'seat': seat,
+            'ticket_id': uuid.uuid4().hex[:12].upper(),
+            'status': 'booked'
+        } for key, seat in taken]
+        self.save_history_many(entries)
+        return entries
+
+    def _plan_group(self, name, data, passengers, departure, spread, now):
+        # Called under the route lock: [(departure, seats to take), ...] for the whole group,
+        # worked out before any seat map is touched
+        first = parse_departure_key(self._check_departure(name, data, departure, now))
+        candidates = [first]
+        if spread:
+            candidates = self.timetable.upcoming(name, first, len(self.timetable.departures.get(name, ())))
+        plan = []
+        remaining = passengers
+        for minute in candidates:
+            key = departure_key(minute)
+            seats = data['seat_maps'].get(key)
+            available = seats.free if seats is not None else data['capacity']
+            count = min(available, remaining)
+            if count:
+                plan.append((key, count))
+                remaining -= count
+            if not remaining:
+                break
+        if remaining:
+            if spread:
+                raise BookingError(f"Only {passengers - remaining} seats left on upcoming departures.")
+            raise BookingError(f"Only {passengers - remaining} seats left on the {departure_key(first)} departure.")
+        return plan
+
+    def _check_departure(self, name, data, departure, now):
+        # The departure to sell: the next one by default, else a later one that exists and hasn't left
+        if departure is None:
+            if data['next_departure'] is None:
+                raise BookingError("No more departures on this route.")
+            return data['next_departure']
+        try:
+            minute = parse_departure_key(departure)
+        except ValueError:
+            raise BookingError(f"Unknown departure: {departure}")
+        if minute < now:
+            raise BookingError(f"The {departure} departure has already left.")
+        if not self.timetable.is_departure(name, minute):
+            raise BookingError(f"{name} has no departure at {departure}.")
+        return departure
+
+    def cancel(self, ticket_id):
+        entry = self.history.get(ticket_id)
+        if entry is None:
+            raise BookingError(f"No active booking with ticket ID {ticket_id}")
+        # The status check and the cancellation record happen under the route lock,
+        # so two terminals cancelling the same ticket can't both return its seat
+        with self.route_lock(entry['name']):
+            entry = self.history.get(ticket_id)
+            if entry.get('status') != 'booked':
+                raise BookingError(f"No active booking with ticket ID {ticket_id}")
+            self._release_seat(entry['name'], entry['departure'], entry.get('seat'))
+            cancelled = dict(entry, status='cancelled')
+            self.save_history(cancelled)
+
+        self._credit(entry['user'], -points_for(entry['total_price']), -1)
+
+        CANCELLATIONS.inc()
+        return cancelled
+
+    def release_seat(self, name, departure, seat):
+        # Puts a sold seat back on sale; False if it was not taken. The shard router calls this on
+        # a route's shard for tickets sold before the route moved there (see sharding.rebalance).
+        self.route(name)
+        with self.route_lock(name):
+            return self._release_seat(name, departure, seat)
+
+    def _release_seat(self, name, departure, seat):
+        # Called under the route lock; a route this engine doesn't serve has no seats to release
+        data = self.transport_data.get(name)
+        seats = data['seat_maps'].get(departure) if data is not None else None
+        if seats is None or not seats.release(seat_number(seat)):
+            return False
+        if departure == data['next_departure']:
+            data['seats'] = seats.free
+        self._log_route(name)
+        return True
+
+    def user_history(self, username, limit=20):
+        return self.history.for_user(username, limit)
+
+    def find_ticket(self, ticket_id):
+        # The ticket's booking as it stands now, or None; may page in old history on the journal
+        with PERSIST_SECONDS.time("find_ticket"):
+            return self.history.get(ticket_id)
+
+    def search_history(self, filters, before=None, limit=None):
+        # A page of bookings matching filters (see booking_journal.search_filter), newest first,
+        # plus the cursor for the next older page
+        with PERSIST_SECONDS.time("search_history"):
+            if limit is None:
+                return self.history.search(filters, before)
+            return self.history.search(filters, before, limit)
+
+    def route_manifest(self, name, day=None):
+        return [entry for entry in self.history.for_route(name, day) if entry.get('status') == 'booked']
+
+    def reset_seats(self):
+        for hold_id in list(self.holds):
+            self.release_hold(hold_id)
+        for option in self.routes:
+            with self.route_lock(option['name']):
+                self.transport_data[option['name']] = route_data(option)
+                self._log_route(option['name'])
+        self._refreshed_at = None
+        self.refresh_departures()
+
+    # --- Persistence -----------------------------------------------------
+
+    def recover_state(self):
+        # Replay changes logged since the last snapshot, then fold them into a new one
+        try:
+            with PERSIST_SECONDS.time("replay_state_log"):
+                records = self.state_log.replay()
+        except Exception as e:
+            print(f"Error reading state log: {e}")
+            return
+        for record in records:
+            self.apply_state_record(record)
+        if records:
+            self.save()
+
+    def apply_state_record(self, record):
+        if record.get('op') == 'route':
+            data = self.transport_data.get(record['name'])
+            if data is None:
+                return
+            self.restore_route(record['name'], data, record)
+        elif record.get('op') == 'profile':
+            # Logged before the profile store was switched on; it becomes that user's row
+            if self.profile_store is not None:
+                self.profile_store.put(record['user'], record['profile'])
+            else:
+                self.user_profiles[record['user']] = record['profile']
+
+    def restore_route(self, name, data, saved):
+        occupied = saved.get('occupied')
+        today = departure_key(minute_of())[:10]
+        if occupied is not None:
+            data['seat_maps'] = {}
+            for departure, taken in occupied.items():
+                if len(departure) == 5:
+                    departure = f"{today} {departure}"  # keys from before dated departures were today's times
+                departure_seats(data, departure).load(taken)
+        self._point_at_next(name, data, minute_of())
+        if occupied is None and 'seats' in saved and data['next_departure'] is not None:
+            # Files from before per-seat inventory only kept a count; take that many seats on the next departure
+            seats = departure_seats(data, data['next_departure'])
+            for _ in range(max(seats.capacity - saved['seats'], 0)):
+                seats.take()
+            data['seats'] = seats.free
+
+    def route_state(self, data):
+        # Held seats are left out: after a restart they are simply on sale again
+        holds = data['holds']
+        occupied = {departure: seats.taken & ~holds.get(departure, 0) for departure, seats in data['seat_maps'].items()}
+        return {
+            'seats': data['seats'],
+            'occupied': {departure: taken for departure, taken in occupied.items() if taken}
+        }
+
+    def _log_route(self, name):
+        # Called under the route lock. A seat change is logged before the sale returns, like its
+        # history line, so a crash never leaves a sold ticket on a seat that comes back free
+        data = self.transport_data.get(name)
+        if data is not None:
+            self._log(dict(self.route_state(data), op='route', name=name))
+        self.write_behind.mark(('snapshot', None))
+
+    def _mark_profile(self, username):
+        self.write_behind.mark(('profile', username))
+
+    def _flush_dirty(self, dirty):
+        # One record per dirty profile, with its values as of now, however many changes were
+        # made to it since the last flush; then a snapshot if the log has grown long enough
+        with PERSIST_SECONDS.time("write_behind_flush"):
+            for kind, key in sorted(dirty):
+                if kind == 'profile':
+                    with self._profile_lock:
+                        profile = self.user_profiles.get(key)
+                        if profile is not None:
+                            self._log({'op': 'profile', 'user': key, 'profile': dict(profile)})
+        self._maybe_snapshot()
+
+    def _log(self, record):
+        try:
+            with PERSIST_SECONDS.time("state_log_append"):
+                self.state_log.append(record)
+        except Exception as e:
+            print(f"Error writing state log: {e}")
+
+    def _maybe_snapshot(self):
+        if self.state_log.records >= SNAPSHOT_EVERY and not self._snapshot_lock.locked():
+            self.save()
+
+    def save_history(self, entry):
+        try:
+            with PERSIST_SECONDS.time("save_history"):
+                self.history.append(entry)
+        except Exception as e:
+            print(f"Error saving history: {e}")
+
+    def save_history_many(self, entries):
+        try:
+            with PERSIST_SECONDS.time("save_history_many"):
+                self.history.append_many(entries)
+        except Exception as e:
+            print(f"Error saving history: {e}")
+
+    def load_history(self):
+        try:
+            with PERSIST_SECONDS.time("load_history"):
+                self.history.load()
+        except Exception as e:
+            print(f"Error loading history: {e}")
+
+    def load_all_history(self):
+        # Run off the UI thread after startup: the journal pages in its older lines and the binary
+        # file builds its ticket index; SQLite queries on demand
+        loader = getattr(self.history, 'load_all', None)
+        if loader is not None:
+            loader()
+
+    def save_user_profiles(self):
+        if self.profile_store is not None:
+            return  # every change is already committed to its row
+        with PERSIST_SECONDS.time("save_user_profiles"):
+            with self._profile_lock:
+                profiles = {user: dict(profile) for user, profile in self.user_profiles.items()}
+            atomic_write_json(self.profiles_file, profiles)
+
+    def load_user_profiles(self):
+        if self.profile_store is not None:
+            # Nothing is read up front; profiles are fetched by key on login
+            try:
+                with PERSIST_SECONDS.time("load_user_profiles"):
+                    self.profile_store.load()
+            except Exception as e:
+                print(f"Error opening profile store: {e}")
+            return
+        if not os.path.exists(self.profiles_file):
+            self.user_profiles = {}
+            return
+        try:
+            with open(self.profiles_file, "r") as f, PERSIST_SECONDS.time("load_user_profiles"):
+                self.user_profiles = json.load(f)
+        except Exception as e:
+            print(f"Error loading user profiles: {e}")
+            self.user_profiles = {}
+
+    def save_state(self):
+        with PERSIST_SECONDS.time("save_state"):
+            state = {}
+            for name, data in self.transport_data.items():
+                with self.route_lock(name):
+                    state[name] = self.route_state(data)
+            atomic_write_json(self.state_file, state)
+
+    def save_board(self):
+        now = minute_of()
+        board = {}
+        for name, data in self.transport_data.items():
+            with self.route_lock(name):
+                departures = []
+                for minute in self.timetable.upcoming(name, now, BOARD_DEPARTURES):
+                    seats = data['seat_maps'].get(departure_key(minute))
+                    departures.append([departure_key(minute), seats.free if seats is not None else data['capacity']])
+                board[name] = {'destination': data.get('destination', 'Unknown'), 'price': data['price'],
+                               'type': data['type'], 'departures': departures}
+        try:
+            atomic_write_json(self.board_file, board)
+        except Exception as e:
+            print(f"Error saving departure board: {e}")
+
+    def load_state(self):
+        state = {}
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, "r") as f, PERSIST_SECONDS.time("load_state"):
+                    state = json.load(f)
+            except Exception as e:
+                print(f"Error loading state: {e}")
+        for option in self.routes:
+            data = route_data(option)
+            if option['name'] in state:
+                self.restore_route(option['name'], data, state[option['name']])
+            self.transport_data[option['name']] = data
+        self._refreshed_at = None
+        self.refresh_departures()
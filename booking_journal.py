@@ -0,0 +1,487 @@
+import os
+import sys
+import threading
+import time
+
+# Field order of one pipe-delimited line in the booking history file
+HISTORY_FIELDS = ['name', 'destination', 'departure', 'base_price', 'luggage_price',
+                  'total_price', 'payment_method', 'date', 'user', 'seat', 'ticket_id', 'status']
+
+# Fields search() matches exactly; 'start' and 'end' bound the booking date as [start, end)
+SEARCH_FIELDS = ['user', 'name', 'payment_method', 'seat', 'status']
+# Bookings per search() page
+SEARCH_PAGE = 100
+
+# fsync after this many appends, or when this many seconds have passed since the last fsync
+SYNC_EVERY = 32
+SYNC_INTERVAL = 1.0
+
+# Lines read per history page at startup and for each older page, and the read-back block size
+PAGE_SIZE = 1000
+BLOCK_SIZE = 64 * 1024
+
+# Rewrite the journal on load once superseded or unreadable lines exceed this share of live entries
+COMPACT_RATIO = 0.25
+
+
+def format_entry(entry):
+    return f"{entry['name']}|{entry.get('destination', 'Unknown')}|{entry['departure']}|{entry['base_price']}|{entry.get('luggage_price', 0)}|{entry['total_price']}|{entry.get('payment_method', 'Unknown')}|{entry['date']}|{entry['user']}|{entry.get('seat', 'Any')}|{entry.get('ticket_id', '')}|{entry.get('status', 'booked')}\n"
+
+
+def search_filter(filters):
+    # Predicate for search(): every given field must match, and the date must be in range
+    wanted = [(field, str(filters[field])) for field in SEARCH_FIELDS if filters.get(field) is not None]
+    start = filters.get('start')
+    end = filters.get('end')
+
+    def match(booking):
+        for field, value in wanted:
+            if booking[field] != value:
+                return False
+        date = booking['date']
+        return (start is None or date >= start) and (end is None or date < end)
+    return match
+
+
+def parse_line(line):
+    parts = line.rstrip("\n").split("|")
+    if len(parts) < 9:
+        return None
+    try:
+        return {
+            'name': parts[0],
+            'destination': parts[1],
+            'departure': parts[2],
+            'base_price': int(parts[3]),
+            'luggage_price': int(parts[4]),
+            'total_price': int(parts[5]),
+            'payment_method': parts[6],
+            'date': parts[7],
+            'user': parts[8],
+            'seat': parts[9] if len(parts) > 9 else 'Any',
+            'ticket_id': parts[10] if len(parts) > 10 else '',
+            'status': parts[11] if len(parts) > 11 else 'booked'
+        }
+    except ValueError:
+        return None
+
+
+# Prices seen so far, so equal prices share one int object across millions of bookings
+_ints = {}
+
+
+def shared_int(value):
+    value = int(value)
+    return _ints.setdefault(value, value)
+
+
+class Booking:
+    # One history entry as a slotted object with interned strings and shared ints: a fraction
+    # of the memory of a dict with its own copy of every string. Only the ticket ID is unique.
+    __slots__ = tuple(HISTORY_FIELDS)
+
+    def __init__(self, name, destination, departure, base_price, luggage_price, total_price,
+                 payment_method, date, user, seat='Any', ticket_id='', status='booked'):
+        intern = sys.intern
+        self.name = intern(name)
+        self.destination = intern(destination)
+        self.departure = intern(departure)
+        self.base_price = shared_int(base_price)
+        self.luggage_price = shared_int(luggage_price)
+        self.total_price = shared_int(total_price)
+        self.payment_method = intern(payment_method)
+        self.date = intern(date)
+        self.user = intern(user)
+        self.seat = intern(str(seat))
+        self.ticket_id = ticket_id
+        self.status = intern(status)
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(entry['name'], entry.get('destination', 'Unknown'), entry['departure'], entry['base_price'],
+                   entry.get('luggage_price', 0), entry['total_price'], entry.get('payment_method', 'Unknown'),
+                   entry['date'], entry['user'], entry.get('seat', 'Any'), entry.get('ticket_id', ''),
+                   entry.get('status', 'booked'))
+
+    def update(self, entry):
+        fresh = Booking.from_entry(entry)
+        for field in HISTORY_FIELDS:
+            setattr(self, field, getattr(fresh, field))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in HISTORY_FIELDS}
+
+    # Enough of the mapping interface for format_entry and csv.DictWriter
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def keys(self):
+        return HISTORY_FIELDS
+
+
+def parse_booking(line):
+    parts = line.rstrip("\n").split("|")
+    if len(parts) < 9:
+        return None
+    try:
+        return Booking(*parts[:12])
+    except ValueError:
+        return None
+
+
+def trim_partial_line(path):
+    # A crash mid-append can leave a partial last line; cut it so the next write starts clean
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        pos = size
+        while pos > 0:
+            step = min(BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            idx = f.read(step).rfind(b"\n")
+            if idx != -1:
+                f.truncate(pos + idx + 1)
+                return
+        f.truncate(0)
+
+
+class BookingJournal:
+    # Append-only booking history. A sale costs one line write; fsync is batched.
+    # Startup reads only the newest page of lines from the end of the file; older pages
+    # are read on demand by queries that need them, or by load_all().
+    def __init__(self, path, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL, page_size=PAGE_SIZE):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.page_size = page_size
+        self.dead_lines = 0
+        self._pages = [[]]
+        self._tickets = {}
+        self._moved = {}
+        self._holes = 0
+        self._loaded_from = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    @property
+    def fully_loaded(self):
+        return self._loaded_from == 0
+
+    def load(self):
+        self.dead_lines = 0
+        self._pages = [[]]
+        self._tickets = {}
+        self._moved = {}
+        self._holes = 0
+        self._loaded_from = 0
+        if not os.path.exists(self.path):
+            return
+        self._repair_tail()
+        self._loaded_from = os.path.getsize(self.path)
+        self.load_older()
+
+    def load_older(self):
+        # Read the page of lines just before what is already loaded. A line for a ticket seen in
+        # this page already (e.g. a cancellation) updates that entry in place. One whose booking
+        # is in an older page is placed where it was read until that page turns up; the entry
+        # then moves back to its booking's place and leaves a hole (None), so page positions
+        # handed out as search cursors stay put.
+        with self._lock:
+            if self._loaded_from == 0:
+                return 0
+            start, lines = self._read_page_before(self._loaded_from)
+            page = []
+            seen = {}
+            for line in lines:
+                entry = parse_booking(line)
+                if entry is None:
+                    self.dead_lines += 1
+                    continue
+                ticket_id = entry['ticket_id']
+                if ticket_id in self._moved:
+                    newer = self._moved.pop(ticket_id)
+                    booking = self._tickets[ticket_id]
+                    newer[next(i for i, other in enumerate(newer) if other is booking)] = None
+                    self._holes += 1
+                    page.append(booking)
+                    self.dead_lines += 1
+                elif ticket_id in self._tickets:
+                    self.dead_lines += 1
+                elif ticket_id in seen:
+                    seen[ticket_id].update(entry)
+                    self.dead_lines += 1
+                else:
+                    if ticket_id:
+                        seen[ticket_id] = entry
+                    page.append(entry)
+            for ticket_id, entry in seen.items():
+                # Sales are written as 'booked', so any other first line may supersede one in an
+                # older page (or be the only line left for its ticket after a compaction)
+                if entry.status != 'booked' and start > 0:
+                    self._moved[ticket_id] = page
+            self._tickets.update(seen)
+            self._pages.insert(0, page)
+            self._loaded_from = start
+            if start == 0:
+                self._moved = {}
+            loaded = len(page)
+        if self.fully_loaded and self.dead_lines > self.count() * COMPACT_RATIO:
+            self.compact()
+        return loaded
+
+    def load_all(self):
+        while not self.fully_loaded:
+            self.load_older()
+
+    def append(self, entry):
+        self.append_many([entry])
+
+    def append_many(self, entries):
+        # One write and at most one fsync for the whole batch
+        data = "".join(format_entry(entry) for entry in entries)
+        with self._lock:
+            if self._file is None:
+                self._repair_tail()
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(data)
+            self._file.flush()
+            self._pending += len(entries)
+            if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync_locked()
+            for entry in entries:
+                existing = self._tickets.get(entry.get('ticket_id'))
+                if existing is not None:
+                    existing.update(entry)
+                    self.dead_lines += 1
+                else:
+                    booking = Booking.from_entry(entry)
+                    if booking.ticket_id:
+                        self._tickets[booking.ticket_id] = booking
+                    self._pages[-1].append(booking)
+
+    # --- Queries ---------------------------------------------------------
+
+    def count(self):
+        return sum(len(page) for page in self._pages) - self._holes
+
+    def get(self, ticket_id):
+        while ticket_id not in self._tickets and not self.fully_loaded:
+            self.load_older()
+        booking = self._tickets.get(ticket_id)
+        return booking.to_dict() if booking is not None else None
+
+    # Queries hand out plain dicts; the slotted bookings stay private to the journal
+
+    def recent(self, limit=20):
+        return self._newest_first(lambda booking: True, limit)
+
+    def for_user(self, user, limit=20):
+        return self._newest_first(lambda booking: booking.user == user, limit)
+
+    def for_route(self, name, day=None):
+        return [booking.to_dict() for booking in self._all_bookings()
+                if booking.name == name and (day is None or booking.date.startswith(day))]
+
+    def between(self, start, end):
+        return [booking.to_dict() for booking in self._all_bookings() if start <= booking.date < end]
+
+    def iter_all(self):
+        for booking in self._all_bookings():
+            yield booking.to_dict()
+
+    def search(self, filters, before=None, limit=SEARCH_PAGE):
+        # One page of matching bookings, newest first, and the cursor to pass as before for the
+        # next older page (None after the oldest). The cursor is (page counted from the newest,
+        # index in that page): appends only extend the newest page and older pages are inserted
+        # in front, so it stays valid while the journal grows.
+        match = search_filter(filters)
+        found = []
+        index, stop = before if before is not None else (0, None)
+        while True:
+            with self._lock:
+                available = index < len(self._pages)
+                if available:
+                    page = self._pages[-1 - index]
+                    page = page[:len(page) if stop is None else stop]
+            if not available:
+                if self.fully_loaded:
+                    return found, None
+                self.load_older()
+                continue
+            for position in range(len(page) - 1, -1, -1):
+                if page[position] is not None and match(page[position]):
+                    found.append(page[position].to_dict())
+                    if len(found) == limit:
+                        return found, (index, position)
+            index, stop = index + 1, None
+
+    def _all_bookings(self):
+        self.load_all()
+        with self._lock:
+            pages = [list(page) for page in self._pages]
+        for page in pages:
+            for booking in page:
+                if booking is not None:
+                    yield booking
+
+    def scan_origin(self):
+        # Compaction replaces the file, so positions from an older scan are only valid for the same inode
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return f"journal:{st.st_dev}:{st.st_ino}"
+
+    def scan(self, position=None, batch_size=1000, end=None):
+        # Yield (position, batch) of lines written after byte offset position (and before end), in file order
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            end = min(f.seek(0, os.SEEK_END), end if end is not None else float('inf'))
+            pos = position or 0
+            if pos > end:
+                raise ValueError(f"Position {pos} is past the end of {self.path}")
+            f.seek(pos)
+            batch = []
+            while pos < end:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                pos += len(line)
+                entry = parse_line(line.decode("utf-8", errors="replace"))
+                if entry is not None:
+                    batch.append(entry)
+                if len(batch) >= batch_size:
+                    yield pos, batch
+                    batch = []
+            if batch or pos != (position or 0):
+                yield pos, batch
+
+    def scan_live(self, batch_size=1000):
+        # Like scan() from the start, but with each ticket once: in the place it was booked, as its
+        # latest record (a cancellation replaces the booking). Two passes over the file, holding
+        # only the ticket IDs and the records that replace earlier ones.
+        unwritten = set()
+        updates = {}
+        end = None
+        for end, batch in self.scan(None, batch_size):
+            for entry in batch:
+                ticket_id = entry.get('ticket_id')
+                if not ticket_id:
+                    continue
+                if ticket_id in unwritten:
+                    updates[ticket_id] = entry
+                else:
+                    unwritten.add(ticket_id)
+        if end is None:
+            return
+        for position, batch in self.scan(None, batch_size, end):
+            live = []
+            for entry in batch:
+                ticket_id = entry.get('ticket_id')
+                if ticket_id:
+                    if ticket_id not in unwritten:
+                        continue
+                    unwritten.discard(ticket_id)
+                    entry = updates.get(ticket_id, entry)
+                live.append(entry)
+            yield position, live
+
+    def _newest_first(self, match, limit):
+        # Walk loaded pages newest to oldest, reading older pages only while more rows are needed
+        found = []
+        index = 0
+        while limit is None or len(found) < limit:
+            with self._lock:
+                pages = self._pages[:len(self._pages) - index]
+            for page in reversed(pages):
+                for booking in reversed(page):
+                    if booking is not None and match(booking):
+                        found.append(booking.to_dict())
+                        if len(found) == limit:
+                            return found
+            index += len(pages)
+            if self.fully_loaded:
+                break
+            self.load_older()
+        return found
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._sync_locked()
+
+    def compact(self):
+        # Rewrite the journal from the live entries: temp file, fsync, then atomic rename
+        with self._lock:
+            self._close_locked()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for page in self._pages:
+                    for entry in page:
+                        if entry is not None:
+                            f.write(format_entry(entry))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.dead_lines = 0
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def _read_page_before(self, end):
+        # Read backwards from byte offset end (always a line boundary) until page_size whole lines are found
+        with open(self.path, "rb") as f:
+            pos = end
+            chunks = []
+            newlines = 0
+            while pos > 0 and newlines <= self.page_size:
+                step = min(BLOCK_SIZE, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step)
+                newlines += chunk.count(b"\n")
+                chunks.append(chunk)
+        lines = b"".join(reversed(chunks)).split(b"\n")
+        lines.pop()
+        start = pos
+        if pos > 0:
+            # The first piece may be the tail of an earlier line; leave it for the next page
+            start += len(lines[0]) + 1
+            del lines[0]
+        if len(lines) > self.page_size:
+            extra = len(lines) - self.page_size
+            start += sum(len(line) + 1 for line in lines[:extra])
+            del lines[:extra]
+        return start, [line.decode("utf-8", errors="replace") for line in lines]
+
+    def _sync_locked(self):
+        if self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _close_locked(self):
+        if self._file is not None:
+            self._file.flush()
+            self._sync_locked()
+            self._file.close()
+            self._file = None
+
+    def _repair_tail(self):
+        trim_partial_line(self.path)
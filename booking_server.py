@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import json
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics import Analytics, DIMENSIONS
+from booking_engine import BookingEngine, BookingError
+from metrics import METRICS_PORT, MetricsServer, counter, histogram
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_WORKERS = 8
+
+REQUEST_SECONDS = histogram("illuminado_server_request_seconds", "Time to answer one server request.", ["op"])
+REQUESTS = counter("illuminado_server_requests_total", "Server requests by operation and outcome.", ["op", "result"])
+
+
+def departure_info(name, data):
+    return {
+        'name': name,
+        'destination': data.get('destination', 'Unknown'),
+        'next_departure': data['next_departure'],
+        'price': data['price'],
+        'seats': data['seats'],
+        'type': data['type']
+    }
+
+
+class BookingServer:
+    # One process owns the inventory; terminals send newline-delimited JSON requests
+    # ({"op": "book", "route": ..., "user": ..., "provider": ...}) over a local socket.
+    # Requests for the same route queue on an asyncio lock, so only one of them at a
+    # time occupies a worker thread; different routes book in parallel.
+    def __init__(self, engine, host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, analytics=None):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="booking")
+        self.route_locks = {}
+        self.analytics = analytics if analytics is not None else Analytics(engine.history)
+        self.handlers = {
+            'departures': self.op_departures,
+            'quote': self.op_quote,
+            'login': self.op_login,
+            'hold': self.op_hold,
+            'hold_group': self.op_hold_group,
+            'release_hold': self.op_release_hold,
+            'book': self.op_book,
+            'book_group': self.op_book_group,
+            'cancel': self.op_cancel,
+            'release_seat': self.op_release_seat,
+            'history': self.op_history,
+            'revenue': self.op_revenue,
+        }
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        return self._server
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.run(self.engine.save)
+        self.executor.shutdown(wait=True)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.dispatch(line)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, line):
+        start = time.perf_counter()
+        op = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+            handler = self.handlers.get(request.get('op'))
+            if handler is None:
+                response = {'ok': False, 'error': f"Unknown operation: {request.get('op')}"}
+            else:
+                op = request['op']
+                response = {'ok': True, 'result': await handler(request)}
+        except BookingError as e:
+            response = {'ok': False, 'error': str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            response = {'ok': False, 'error': f"Bad request: {e}"}
+        except Exception as e:
+            # Storage and other server-side failures still get an answer; the connection stays open
+            print(f"Error handling {op or 'request'}: {e}")
+            response = {'ok': False, 'error': f"Server error: {e}"}
+        op = op or "invalid"
+        REQUESTS.inc(op, "ok" if response['ok'] else "error")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, op)
+        return response
+
+    def run(self, func, *args, **kwargs):
+        return asyncio.get_running_loop().run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    def route_lock(self, name):
+        self.engine.route(name)
+        return self.route_locks.setdefault(name, asyncio.Lock())
+
+    # --- Operations ------------------------------------------------------
+
+    # Every engine call goes to the worker pool: even reads take route locks or query SQLite,
+    # and the event loop must stay free for the other connections
+
+    async def op_departures(self, request):
+        # Optional filters: destination, type, min_price, max_price (exclusive),
+        # window ["HH:MM", "HH:MM"] and with_seats
+        window = request.get('window')
+
+        def departures():
+            found = self.engine.list_departures(
+                request.get('destination'), route_type=request.get('type'), min_price=request.get('min_price'),
+                max_price=request.get('max_price'), window=tuple(window) if window else None,
+                with_seats=bool(request.get('with_seats')))
+            return [departure_info(name, data) for name, data in found]
+
+        return await self.run(departures)
+
+    async def op_quote(self, request):
+        return await self.run(self.engine.quote, request['route'], request.get('user', 'guest'),
+                              request.get('luggage', 'small'))
+
+    async def op_login(self, request):
+        return await self.run(self.engine.login, request['user'])
+
+    async def op_hold(self, request):
+        # {"op": "hold", "route": ..., "user": ...}; pass the returned hold_id to book once paid
+        async with self.route_lock(request['route']):
+            return await self.run(self.engine.hold, request['route'], request.get('user', 'guest'),
+                                  seat=request.get('seat'), departure=request.get('departure'))
+
+    async def op_hold_group(self, request):
+        # {"op": "hold_group", "route": ..., "user": ..., "passengers": ...}; pass the returned
+        # hold_ids to book_group as "holds" once paid
+        async with self.route_lock(request['route']):
+            return await self.run(self.engine.hold_group, request['route'], request.get('user', 'guest'),
+                                  int(request['passengers']), departure=request.get('departure'),
+                                  spread=bool(request.get('spread', False)))
+
+    async def op_release_hold(self, request):
+        return await self.run(self.engine.release_hold, request['hold_id'])
+
+    async def op_book(self, request):
+        async with self.route_lock(request['route']):
+            return await self.run(self.engine.book, request['route'], request.get('user', 'guest'),
+                                  request['provider'], luggage=request.get('luggage', 'small'),
+                                  seat=request.get('seat'), departure=request.get('departure'),
+                                  hold=request.get('hold'))
+
+    async def op_book_group(self, request):
+        async with self.route_lock(request['route']):
+            return await self.run(self.engine.book_group, request['route'], request.get('user', 'guest'),
+                                  request['provider'], int(request['passengers']),
+                                  luggage=request.get('luggage', 'small'), departure=request.get('departure'),
+                                  spread=bool(request.get('spread', False)), holds=request.get('holds'))
+
+    async def op_cancel(self, request):
+        entry = await self.run(self.engine.find_ticket, request['ticket_id'])
+        if entry is None:
+            raise BookingError(f"No active booking with ticket ID {request['ticket_id']}")
+        # Not route_lock(): behind the shard router, a ticket is cancelled where it was sold even
+        # after its route moved to another shard
+        async with self.route_locks.setdefault(entry['name'], asyncio.Lock()):
+            return await self.run(self.engine.cancel, request['ticket_id'])
+
+    async def op_release_seat(self, request):
+        # {"op": "release_seat", "route": ..., "departure": ..., "seat": ...}; sent by the shard router
+        async with self.route_lock(request['route']):
+            return await self.run(self.engine.release_seat, request['route'], request['departure'], request['seat'])
+
+    async def op_history(self, request):
+        return await self.run(self.engine.user_history, request['user'], request.get('limit', 20))
+
+    async def op_revenue(self, request):
+        # {"op": "revenue", "by": "route", "from": "2026-01-01", "to": "2026-02-01"}; days are [from, to)
+        dimension = request.get('by', 'route')
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"unknown dimension {dimension}")
+        await self.run(self.analytics.refresh)
+        return await self.run(self.analytics.totals, dimension, request.get('from'), request.get('to'))
+
+
+class BookingClient:
+    # Blocking client for terminals and scripts talking to a BookingServer
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, timeout=10.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile("rwb")
+
+    def call(self, op, **params):
+        params['op'] = op
+        self.file.write(json.dumps(params).encode("utf-8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Booking server closed the connection")
+        response = json.loads(line)
+        if not response['ok']:
+            raise BookingError(response['error'])
+        return response['result']
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Illuminado booking server")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on 127.0.0.1 at this port; 0 disables")
+    args = parser.parse_args()
+
+    engine = BookingEngine()
+    engine.load()
+    server = BookingServer(engine, args.host, args.port, args.workers)
+    metrics_server = MetricsServer(port=args.metrics_port).start() if args.metrics_port else None
+    print(f"Booking server listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
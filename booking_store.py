@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import threading
+
+from booking_journal import HISTORY_FIELDS, SEARCH_FIELDS, SEARCH_PAGE, parse_line
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id TEXT UNIQUE,
+    name TEXT NOT NULL,
+    destination TEXT,
+    departure TEXT,
+    base_price INTEGER,
+    luggage_price INTEGER,
+    total_price INTEGER,
+    payment_method TEXT,
+    date TEXT,
+    user TEXT,
+    seat TEXT,
+    status TEXT,
+    seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS bookings_user ON bookings (user, id);
+CREATE INDEX IF NOT EXISTS bookings_route ON bookings (name, date);
+CREATE INDEX IF NOT EXISTS bookings_route_id ON bookings (name, id);
+CREATE INDEX IF NOT EXISTS bookings_date ON bookings (date);
+"""
+
+# seq is bumped on every insert or update so exports can pick up changed rows after a mark
+COLUMNS = ", ".join(HISTORY_FIELDS)
+INSERT = (f"INSERT INTO bookings ({COLUMNS}, seq) VALUES ({', '.join('?' * len(HISTORY_FIELDS))}, "
+          "(SELECT COALESCE(MAX(seq), 0) + 1 FROM bookings)) "
+          "ON CONFLICT (ticket_id) DO UPDATE SET " +
+          ", ".join(f"{field} = excluded.{field}" for field in HISTORY_FIELDS + ['seq'] if field != 'ticket_id'))
+
+
+def entry_row(entry):
+    return (
+        entry['name'],
+        entry.get('destination', 'Unknown'),
+        entry['departure'],
+        entry['base_price'],
+        entry.get('luggage_price', 0),
+        entry['total_price'],
+        entry.get('payment_method', 'Unknown'),
+        entry['date'],
+        entry['user'],
+        str(entry.get('seat', 'Any')),
+        entry.get('ticket_id') or None,  # legacy bookings have no ticket ID; NULLs don't collide
+        entry.get('status', 'booked')
+    )
+
+
+def row_entry(row):
+    entry = dict(zip(HISTORY_FIELDS, row))
+    entry['ticket_id'] = entry['ticket_id'] or ''
+    return entry
+
+
+class BookingStore:
+    # SQLite booking history indexed by user, route, date and ticket ID.
+    # Nothing is loaded at startup; every query goes through an index.
+    def __init__(self, path, legacy_history=None):
+        self.path = path
+        self.legacy_history = legacy_history
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def load(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                # WAL keeps a commit to one sequential append; fsync happens at checkpoints
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.executescript(SCHEMA)
+                # Databases created before seq existed get it backfilled in insertion order
+                columns = [row[1] for row in self._conn.execute("PRAGMA table_info(bookings)")]
+                if 'seq' not in columns:
+                    with self._conn:
+                        self._conn.execute("ALTER TABLE bookings ADD COLUMN seq INTEGER")
+                        self._conn.execute("UPDATE bookings SET seq = id")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS bookings_seq ON bookings (seq)")
+            empty = self._conn.execute("SELECT 1 FROM bookings LIMIT 1").fetchone() is None
+        if empty and self.legacy_history and os.path.exists(self.legacy_history):
+            self.import_history(self.legacy_history)
+
+    def import_history(self, path):
+        # One-time migration of a pipe-delimited history file, in a single transaction
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            rows = (entry_row(entry) for entry in map(parse_line, f) if entry is not None)
+            with self._lock, self._conn:
+                self._conn.executemany(INSERT, rows)
+
+    def append(self, entry):
+        # A second append for the same ticket (e.g. a cancellation) updates that booking in place
+        with self._lock, self._conn:
+            self._conn.execute(INSERT, entry_row(entry))
+
+    def append_many(self, entries):
+        # One transaction for the whole batch
+        with self._lock, self._conn:
+            self._conn.executemany(INSERT, [entry_row(entry) for entry in entries])
+
+    # --- Queries ---------------------------------------------------------
+
+    def get(self, ticket_id):
+        rows = self._query(f"SELECT {COLUMNS} FROM bookings WHERE ticket_id = ?", (ticket_id,))
+        return rows[0] if rows else None
+
+    def recent(self, limit=20):
+        return self._query(f"SELECT {COLUMNS} FROM bookings ORDER BY id DESC LIMIT ?", (limit,))
+
+    def for_user(self, user, limit=20):
+        return self._query(f"SELECT {COLUMNS} FROM bookings WHERE user = ? ORDER BY id DESC LIMIT ?",
+                           (user, limit if limit is not None else -1))
+
+    def for_route(self, name, day=None):
+        if day is None:
+            return self._query(f"SELECT {COLUMNS} FROM bookings WHERE name = ? ORDER BY date, id", (name,))
+        # Dates are "YYYY-MM-DD HH:MM", so one day is a range scan on the (name, date) index
+        return self._query(f"SELECT {COLUMNS} FROM bookings WHERE name = ? AND date >= ? AND date < ? ORDER BY date, id",
+                           (name, day, day + "~"))
+
+    def between(self, start, end):
+        return self._query(f"SELECT {COLUMNS} FROM bookings WHERE date >= ? AND date < ? ORDER BY date, id",
+                           (start, end))
+
+    def iter_all(self, batch_size=1000):
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(f"SELECT id, {COLUMNS} FROM bookings WHERE id > ? ORDER BY id LIMIT ?",
+                                          (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                yield row_entry(row[1:])
+
+    def search(self, filters, before=None, limit=SEARCH_PAGE):
+        # One page of matching bookings, newest first, and the row id to pass as before for
+        # the next older page (None after the oldest); each page is one indexed range query
+        clauses = []
+        params = []
+        for field in SEARCH_FIELDS:
+            if filters.get(field) is not None:
+                clauses.append(f"{field} = ?")
+                params.append(str(filters[field]))
+        if filters.get('start') is not None:
+            clauses.append("date >= ?")
+            params.append(filters['start'])
+        if filters.get('end') is not None:
+            clauses.append("date < ?")
+            params.append(filters['end'])
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, {COLUMNS} FROM bookings {where}ORDER BY id DESC LIMIT ?",
+                                      params + [limit]).fetchall()
+        cursor = rows[-1][0] if len(rows) == limit else None
+        return [row_entry(row[1:]) for row in rows], cursor
+
+    def scan_origin(self):
+        return f"sqlite:{os.path.abspath(self.path)}"
+
+    def scan(self, position=None, batch_size=1000):
+        # Yield (position, batch) of rows inserted or changed after position, in change order
+        last_seq = position or 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(f"SELECT seq, {COLUMNS} FROM bookings WHERE seq > ? ORDER BY seq LIMIT ?",
+                                          (last_seq, batch_size)).fetchall()
+            if not rows:
+                return
+            last_seq = rows[-1][0]
+            yield last_seq, [row_entry(row[1:]) for row in rows]
+
+    def scan_live(self, batch_size=1000):
+        # Every ticket once, in booking order, as it stands now. The position is the seq the scan
+        # started at; rows changed after that are left to the next incremental scan().
+        with self._lock:
+            position = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM bookings").fetchone()[0]
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(f"SELECT id, {COLUMNS} FROM bookings WHERE id > ? AND seq <= ? "
+                                          "ORDER BY id LIMIT ?", (last_id, position, batch_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield position, [row_entry(row[1:]) for row in rows]
+
+    def sync(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _query(self, sql, params):
+        with self._lock:
+            return [row_entry(row) for row in self._conn.execute(sql, params).fetchall()]
@@ -0,0 +1,416 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from booking_journal import SEARCH_FIELDS, SEARCH_PAGE, SYNC_EVERY, SYNC_INTERVAL, parse_line
+
+MAGIC = b"ILBHIST1"
+# name, destination, departure, base_price, luggage_price, total_price, payment_method, date,
+# user, seat, status (string IDs and prices), ticket_id, flags
+RECORD = struct.Struct("<IIIiiiIIIII16sB3x")
+TICKET = struct.Struct("<44x16s4x")
+FLAGS = struct.Struct("<60xB3x")
+NO_TICKET = bytes(16)
+STRING_LENGTH = struct.Struct("<H")
+STRING_FIELDS = ['name', 'destination', 'departure', None, None, None, 'payment_method', 'date', 'user', 'seat', 'status']
+FIELD_INDEX = {field: i for i, field in enumerate(STRING_FIELDS) if field}
+
+# A record appended to supersede an earlier one for the same ticket. The earlier record is
+# rewritten in place, so readers skip these; scan() still yields them for incremental exports.
+FLAG_UPDATE = 1
+
+def ticket_key(ticket_id):
+    return (ticket_id or '').encode("ascii", errors="replace").ljust(16, b"\0")
+
+
+# Records decoded per chunk when walking the file
+SCAN_CHUNK = 4096
+
+
+class BinaryHistory:
+    # Booking history as fixed-width 64-byte records, read through mmap. Strings are stored once
+    # in a sidecar file (path + ".strings") and referenced by ID, so reading is struct unpacking
+    # and list lookups rather than splitting and int() on every line, and any character is allowed.
+    def __init__(self, path, legacy_history=None, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.strings_path = path + ".strings"
+        self.legacy_history = legacy_history
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._strings = []
+        self._ids = {}
+        self._records = 0
+        self._tickets = None
+        self._file = None
+        self._strings_file = None
+        self._map = None
+        self._mapped = 0
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def load(self):
+        with self._lock:
+            self._close_locked()
+            new = not os.path.exists(self.path)
+            for path in (self.path, self.strings_path):
+                if not os.path.exists(path):
+                    open(path, "wb").close()
+            # Not append mode: records are rewritten in place, and O_APPEND would send those writes to the end
+            self._strings_file = open(self.strings_path, "r+b")
+            self._file = open(self.path, "r+b")
+            self._read_strings()
+            size = os.fstat(self._file.fileno()).st_size
+            if size < len(MAGIC):
+                self._file.truncate(0)
+                self._file.write(MAGIC)
+                self._file.flush()
+                size = len(MAGIC)
+            else:
+                self._file.seek(0)
+                if self._file.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{self.path} is not a booking history file")
+            # A crash mid-append can leave part of a record at the end
+            self._records = (size - len(MAGIC)) // RECORD.size
+            self._file.truncate(len(MAGIC) + self._records * RECORD.size)
+            self._file.seek(0, os.SEEK_END)
+            self._tickets = {} if self._records == 0 else None
+        if new and self.legacy_history and os.path.exists(self.legacy_history):
+            self.import_history(self.legacy_history)
+
+    def import_history(self, path, batch_size=10000):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            batch = []
+            for entry in map(parse_line, f):
+                if entry is not None:
+                    batch.append(entry)
+                if len(batch) >= batch_size:
+                    self.append_many(batch)
+                    batch = []
+            if batch:
+                self.append_many(batch)
+        self.sync()
+
+    def load_all(self):
+        # The ticket index needs one pass over the file; BookingEngine.load_all_history() builds
+        # it off the startup path so the first sale or lookup doesn't
+        self._ticket_index()
+
+    def append(self, entry):
+        self.append_many([entry])
+
+    def append_many(self, entries):
+        with self._lock:
+            tickets = self._ticket_index()
+            new_strings = []
+            records = []
+            rewrites = []
+            for entry in entries:
+                record = self._encode(entry, new_strings)
+                ticket_id = record[11]
+                index = tickets.get(ticket_id) if ticket_id != NO_TICKET else None
+                if index is None:
+                    if ticket_id != NO_TICKET:
+                        tickets[ticket_id] = self._records + len(records)
+                    records.append(record)
+                else:
+                    # Rewrite the original in place and log the change for scan()
+                    rewrites.append((index, record))
+                    records.append(record[:-1] + (FLAG_UPDATE,))
+            if new_strings:
+                # Strings go out before the records that use them
+                self._strings_file.seek(0, os.SEEK_END)
+                self._strings_file.write(b"".join(new_strings))
+                self._strings_file.flush()
+            for index, record in rewrites:
+                self._file.seek(len(MAGIC) + index * RECORD.size)
+                self._file.write(RECORD.pack(*record))
+            self._file.seek(len(MAGIC) + self._records * RECORD.size)
+            self._file.write(b"".join(RECORD.pack(*record) for record in records))
+            self._file.flush()
+            self._records += len(records)
+            self._pending += len(records)
+            if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync_locked()
+
+    # --- Queries ---------------------------------------------------------
+
+    def count(self):
+        view = self._view()
+        updates = sum(flags for (flags,) in FLAGS.iter_unpack(view[len(MAGIC):]))
+        return (len(view) - len(MAGIC)) // RECORD.size - updates
+
+    def get(self, ticket_id):
+        index = self._ticket_index().get(ticket_key(ticket_id))
+        if index is None:
+            return None
+        return self._decode(RECORD.unpack_from(self._view(), len(MAGIC) + index * RECORD.size))
+
+    def recent(self, limit=20):
+        return self._newest_first(None, None, limit)
+
+    def for_user(self, user, limit=20):
+        user_id = self._ids.get(user)
+        if user_id is None:
+            return []
+        return self._newest_first(FIELD_INDEX['user'], user_id, limit)
+
+    def for_route(self, name, day=None):
+        name_id = self._ids.get(name)
+        if name_id is None:
+            return []
+        dates = None if day is None else self._ids_where(lambda s: s.startswith(day))
+        found = [self._decode(record) for record in self._records_where(FIELD_INDEX['name'], name_id)
+                 if dates is None or record[FIELD_INDEX['date']] in dates]
+        found.sort(key=lambda entry: entry['date'])
+        return found
+
+    def between(self, start, end):
+        dates = self._ids_where(lambda s: start <= s < end)
+        found = [self._decode(record) for record in self._records_where(None, None)
+                 if record[FIELD_INDEX['date']] in dates]
+        found.sort(key=lambda entry: entry['date'])
+        return found
+
+    def iter_all(self):
+        for record in self._records_where(None, None):
+            yield self._decode(record)
+
+    def search(self, filters, before=None, limit=SEARCH_PAGE):
+        # One page of matching bookings, newest first, and the record number to pass as before
+        # for the next older page (None after the oldest). Fields are compared as string IDs;
+        # only matches are decoded.
+        wanted = []
+        for field in SEARCH_FIELDS:
+            if filters.get(field) is not None:
+                string_id = self._ids.get(str(filters[field]))
+                if string_id is None:
+                    return [], None
+                wanted.append((FIELD_INDEX[field], string_id))
+        start = filters.get('start')
+        end = filters.get('end')
+        strings = self._strings
+        date = FIELD_INDEX['date']
+        view = self._view()
+        stop = before if before is not None else (len(view) - len(MAGIC)) // RECORD.size
+        found = []
+        while stop > 0:
+            first = max(stop - SCAN_CHUNK, 0)
+            records = list(RECORD.iter_unpack(view[len(MAGIC) + first * RECORD.size:len(MAGIC) + stop * RECORD.size]))
+            for offset in range(len(records) - 1, -1, -1):
+                record = records[offset]
+                if record[12] or any(record[column] != value for column, value in wanted):
+                    continue
+                if (start is not None and strings[record[date]] < start) or (end is not None and strings[record[date]] >= end):
+                    continue
+                found.append(self._decode(record))
+                if len(found) == limit:
+                    return found, first + offset
+            stop = first
+        return found, None
+
+    def record_buffer(self):
+        # (mapped file, record count, string table) for readers that decode columns themselves;
+        # records start after the MAGIC header
+        view = self._view()
+        return view, (len(view) - len(MAGIC)) // RECORD.size, list(self._strings)
+
+    def scan_origin(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return f"binary:{st.st_dev}:{st.st_ino}"
+
+    def scan(self, position=None, batch_size=1000):
+        # Yield (position, batch) of records written after record number position, in file order.
+        # An update record is only yielded when its original was before position (already exported);
+        # otherwise the original, rewritten in place, is in this scan with the current values.
+        first = start = position or 0
+        end = self._records
+        if start > end:
+            raise ValueError(f"Position {start} is past the end of {self.path}")
+        view = self._view()
+        tickets = self._ticket_index() if first else None
+        while start < end:
+            stop = min(start + batch_size, end)
+            chunk = view[len(MAGIC) + start * RECORD.size:len(MAGIC) + stop * RECORD.size]
+            yield stop, [self._decode(record) for record in RECORD.iter_unpack(chunk)
+                         if not record[12] or (tickets is not None and tickets.get(record[11], first) < first)]
+            start = stop
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    # --- Internals -------------------------------------------------------
+
+    def _read_strings(self):
+        self._strings_file.seek(0)
+        data = self._strings_file.read()
+        strings = []
+        pos = 0
+        while pos + STRING_LENGTH.size <= len(data):
+            (length,) = STRING_LENGTH.unpack_from(data, pos)
+            if pos + STRING_LENGTH.size + length > len(data):
+                break
+            start = pos + STRING_LENGTH.size
+            strings.append(data[start:start + length].decode("utf-8"))
+            pos = start + length
+        if pos != len(data):
+            self._strings_file.truncate(pos)
+        self._strings = strings
+        self._ids = {s: i for i, s in enumerate(strings)}
+
+    def _string_id(self, value, new_strings):
+        value = str(value)
+        string_id = self._ids.get(value)
+        if string_id is None:
+            data = value.encode("utf-8")
+            if len(data) > 0xFFFF:
+                raise ValueError(f"String too long for booking history: {value[:40]}...")
+            string_id = len(self._strings)
+            self._strings.append(value)
+            self._ids[value] = string_id
+            new_strings.append(STRING_LENGTH.pack(len(data)) + data)
+        return string_id
+
+    def _encode(self, entry, new_strings):
+        ticket_id = ticket_key(entry.get('ticket_id'))
+        if len(ticket_id) > 16:
+            raise ValueError(f"Ticket ID longer than 16 characters: {entry['ticket_id']}")
+        return (
+            self._string_id(entry['name'], new_strings),
+            self._string_id(entry.get('destination', 'Unknown'), new_strings),
+            self._string_id(entry['departure'], new_strings),
+            int(entry['base_price']),
+            int(entry.get('luggage_price', 0)),
+            int(entry['total_price']),
+            self._string_id(entry.get('payment_method', 'Unknown'), new_strings),
+            self._string_id(entry['date'], new_strings),
+            self._string_id(entry['user'], new_strings),
+            self._string_id(entry.get('seat', 'Any'), new_strings),
+            self._string_id(entry.get('status', 'booked'), new_strings),
+            ticket_id,
+            0
+        )
+
+    def _decode(self, record):
+        strings = self._strings
+        return {
+            'name': strings[record[0]],
+            'destination': strings[record[1]],
+            'departure': strings[record[2]],
+            'base_price': record[3],
+            'luggage_price': record[4],
+            'total_price': record[5],
+            'payment_method': strings[record[6]],
+            'date': strings[record[7]],
+            'user': strings[record[8]],
+            'seat': strings[record[9]],
+            'ticket_id': record[11].rstrip(b"\0").decode("ascii"),
+            'status': strings[record[10]]
+        }
+
+    def _view(self):
+        # The mapping is replaced, not resized, when the file has grown; readers keep the one they got
+        with self._lock:
+            size = len(MAGIC) + self._records * RECORD.size
+            if self._map is None or self._mapped != size:
+                self._file.flush()
+                self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+                self._mapped = size
+            return self._map
+
+    def _ticket_index(self):
+        # Padded ticket ID -> record number of the ticket's first (in-place) record
+        with self._lock:
+            if self._tickets is None:
+                view = self._view()
+                end = len(MAGIC) + self._records * RECORD.size
+                ids = [ticket_id for (ticket_id,) in TICKET.iter_unpack(view[len(MAGIC):end])]
+                # Built from the end, so the first record for each ticket is the one kept
+                tickets = dict(zip(reversed(ids), range(len(ids) - 1, -1, -1)))
+                tickets.pop(NO_TICKET, None)
+                self._tickets = tickets
+            return self._tickets
+
+    def _ids_where(self, match):
+        return {i for i, s in enumerate(self._strings) if match(s)}
+
+    def _records_where(self, column, value):
+        # Live records in file order, optionally only those whose column equals value
+        view = self._view()
+        end = (len(view) - len(MAGIC)) // RECORD.size
+        for start in range(0, end, SCAN_CHUNK):
+            chunk = view[len(MAGIC) + start * RECORD.size:len(MAGIC) + min(start + SCAN_CHUNK, end) * RECORD.size]
+            for record in RECORD.iter_unpack(chunk):
+                if not record[12] and (column is None or record[column] == value):
+                    yield record
+
+    def _newest_first(self, column, value, limit):
+        view = self._view()
+        stop = (len(view) - len(MAGIC)) // RECORD.size
+        found = []
+        while stop > 0 and (limit is None or len(found) < limit):
+            start = max(stop - SCAN_CHUNK, 0)
+            chunk = view[len(MAGIC) + start * RECORD.size:len(MAGIC) + stop * RECORD.size]
+            for record in reversed(list(RECORD.iter_unpack(chunk))):
+                if not record[12] and (column is None or record[column] == value):
+                    found.append(self._decode(record))
+                    if len(found) == limit:
+                        break
+            stop = start
+        return found
+
+    def _sync_locked(self):
+        if self._pending:
+            os.fsync(self._strings_file.fileno())
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _close_locked(self):
+        if self._file is not None:
+            self._file.flush()
+            self._strings_file.flush()
+            self._sync_locked()
+            self._file.close()
+            self._strings_file.close()
+            self._file = None
+            self._strings_file = None
+        self._map = None
+        self._mapped = 0
+
+
+def convert_text_history(text_path, binary_path):
+    # One-off conversion of a pipe-delimited history file; returns the number of bookings
+    if os.path.exists(binary_path):
+        raise ValueError(f"{binary_path} already exists")
+    history = BinaryHistory(binary_path)
+    history.load()
+    history.import_history(text_path)
+    count = history.count()
+    history.close()
+    return count
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: python history_binary.py booking_history.txt booking_history.bin")
+        sys.exit(2)
+    start = time.perf_counter()
+    count = convert_text_history(sys.argv[1], sys.argv[2])
+    print(f"Converted {count:,} bookings in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
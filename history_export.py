@@ -0,0 +1,84 @@
+import csv
+import json
+import os
+import threading
+
+from booking_engine import CSV_FILE, PERSIST_SECONDS
+from booking_journal import HISTORY_FIELDS
+from state_log import atomic_write_json
+
+# Where the last export's high-water mark is kept
+EXPORT_STATE_FILE = "csv_export_state.json"
+EXPORT_CHUNK_SIZE = 5000
+
+
+class CsvExporter:
+    # Streams booking history to CSV in chunks. An incremental export appends only what the
+    # history backend wrote after the stored mark; a full export rewrites the file atomically.
+    def __init__(self, history, path=CSV_FILE, state_file=EXPORT_STATE_FILE, chunk_size=EXPORT_CHUNK_SIZE):
+        self.history = history
+        self.path = path
+        self.state_file = state_file
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+
+    def export(self, incremental=True, progress=None):
+        with self._lock, PERSIST_SECONDS.time("export_full" if not incremental else "export_incremental"):
+            mark = self.load_mark() if incremental else None
+            origin = self.history.scan_origin()
+            if mark and mark.get('origin') == origin and os.path.exists(self.path):
+                try:
+                    return self._write(mark, origin, progress)
+                except ValueError:
+                    pass  # the mark no longer matches the history; fall back to a full export
+            return self._write(None, origin, progress)
+
+    def load_mark(self):
+        if not os.path.exists(self.state_file):
+            return None
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading export state: {e}")
+            return None
+
+    def _write(self, mark, origin, progress):
+        if mark is None:
+            target = self.path + ".tmp"
+            f = open(target, "w", newline='', encoding='utf-8')
+            position = None
+        else:
+            target = self.path
+            f = open(target, "r+", newline='', encoding='utf-8')
+            # Drop anything a crashed export appended after the last recorded mark
+            f.truncate(mark['csv_size'])
+            f.seek(mark['csv_size'])
+            position = mark['position']
+
+        rows = 0
+        with f:
+            writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS)
+            if mark is None:
+                writer.writeheader()
+            # A full export lists each ticket once; incremental ones append the raw change feed
+            if mark is None and hasattr(self.history, 'scan_live'):
+                batches = self.history.scan_live(self.chunk_size)
+            else:
+                batches = self.history.scan(position, self.chunk_size)
+            for position, batch in batches:
+                writer.writerows(batch)
+                rows += len(batch)
+                if progress is not None:
+                    progress(rows)
+            f.flush()
+            os.fsync(f.fileno())
+            csv_size = os.fstat(f.fileno()).st_size
+
+        if mark is None:
+            os.replace(target, self.path)
+        self._save_mark({'origin': origin, 'position': position, 'csv_size': csv_size})
+        return rows
+
+    def _save_mark(self, mark):
+        atomic_write_json(self.state_file, mark)
@@ -1,10 +1,23 @@
+import time
+
+# Cold-start clock: startup stages are measured from here, before anything heavy is imported
+STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, scrolledtext
 import datetime
 import random
-import os
-import json
-import csv
+import threading
+
+from analytics import Analytics
+from booking_engine import BookingEngine, BookingError, CSV_FILE, load_board, LUGGAGE_OPTIONS, MAX_GROUP_SIZE, MOBILE_MONEY_PROVIDERS
+from booking_journal import search_filter
+from history_export import CsvExporter
+from loyalty import RWF_PER_POINT
+from metrics import dump as dump_metrics, histogram
+from payments import PaymentPipeline
+from route_catalog import PRICE_BANDS
+from timetable import departure_label, minute_of
 
 # 🎨 Color and font scheme
 BG_MAIN = "#f0f4fc"
@@ -43,34 +56,26 @@ EMOJI_SAFETY = "🛡️"
 EMOJI_WEATHER = "🌦️"
 EMOJI_SEAT_SELECT = "💺"
 EMOJI_QR = "📱"
+EMOJI_GROUP = "👥"
+EMOJI_REVENUE = "📊"
 
-# Rwanda Transportation Routes
-transport_options = [
-    {'name': 'Illuminado Express', 'start_time': '05:00', 'price': 3500, 'type': 'illuminado', 'destination': 'All Major Cities'},
-    {'name': 'Express A - Kayonza', 'start_time': '05:30', 'price': 2500, 'type': 'normal', 'destination': 'East'},
-    {'name': 'Express B - Rwamagana', 'start_time': '06:00', 'price': 2000, 'type': 'normal', 'destination': 'East'},
-    {'name': 'Express C - Nyagatare', 'start_time': '06:30', 'price': 3000, 'type': 'normal', 'destination': 'East'},
-    {'name': 'Express D - Kirehe', 'start_time': '07:00', 'price': 2800, 'type': 'normal', 'destination': 'East'},
-    {'name': 'Express F - Huye', 'start_time': '05:45', 'price': 2200, 'type': 'normal', 'destination': 'South'},
-    {'name': 'Express G - Muhanga', 'start_time': '06:15', 'price': 1800, 'type': 'normal', 'destination': 'South'},
-    {'name': 'Express K - Rubavu', 'start_time': '05:15', 'price': 3200, 'type': 'normal', 'destination': 'West'},
-    {'name': 'Express L - Karongi', 'start_time': '05:45', 'price': 2900, 'type': 'normal', 'destination': 'West'},
-    {'name': 'Express P - Musanze', 'start_time': '05:20', 'price': 2800, 'type': 'normal', 'destination': 'North'},
-    {'name': 'Express Z - Kigali CBD Shuttle', 'start_time': '04:30', 'price': 500, 'type': 'normal', 'destination': 'Kigali'},
-]
-
-# Configuration files
-STATE_FILE = "transport_state.json"
-HISTORY_FILE = "booking_history.txt"
-CSV_FILE = "booking_history.csv"
-USER_PROFILES_FILE = "user_profiles.json"
-
-# Rwanda Mobile Money Providers
-MOBILE_MONEY_PROVIDERS = {
-    'MTN Mobile Money': "*182*6*1*1*078xxxxxx*{amount}#",
-    'Airtel Money': "*182*1*1*078xxxxxx*{amount}#", 
-    'Tigo Cash': "*188*1*1*078xxxxxx*{amount}#"
-}
+# How often the board moves on to the next departures (ms)
+DEPARTURE_REFRESH_MS = 30000
+
+# How often the Tk thread checks on background work (ms)
+BACKGROUND_POLL_MS = 100
+
+# Bookings per history page, and how many pages the history window keeps at once
+HISTORY_PAGE = 100
+HISTORY_PAGES_KEPT = 5
+
+# Departure time filters: label -> ("HH:MM", "HH:MM") window, or None for any time
+DEPARTURE_WINDOWS = {"Any time": None}
+DEPARTURE_WINDOWS.update({f"{hour:02d}:00–{hour + 1:02d}:00": (f"{hour:02d}:00", f"{(hour + 1) % 24:02d}:00")
+                          for hour in range(24)})
+
+UI_SECONDS = histogram("illuminado_ui_seconds", "Time spent in UI updates.", ["view"])
+STARTUP_SECONDS = histogram("illuminado_startup_seconds", "Time from launch until the board is drawn and until bookings can be taken.", ["stage"])
 
 # Languages supported
 LANGUAGES = {
@@ -80,32 +85,253 @@ LANGUAGES = {
     'sw': "Swahili"
 }
 
-# Luggage options with prices
-LUGGAGE_OPTIONS = {
-    'small': {"name": "Small Bag", "price": 0, "emoji": "🎒"},
-    'medium': {"name": "Medium Bag", "price": 500, "emoji": "🛄"},
-    'large': {"name": "Large Bag", "price": 1000, "emoji": "🧳"},
-    'extra': {"name": "Extra Luggage", "price": 2000, "emoji": "📦"}
-}
+def transport_emoji(typ):
+    return EMOJI_ILLUMINADO if typ == "illuminado" else EMOJI_NORMAL
 
-# Loyalty program tiers
-LOYALTY_TIERS = {
-    'bronze': {"min_rides": 0, "discount": 0, "name": "Bronze"},
-    'silver': {"min_rides": 10, "discount": 5, "name": "Silver"},
-    'gold': {"min_rides": 25, "discount": 10, "name": "Gold"},
-    'platinum': {"min_rides": 50, "discount": 15, "name": "Platinum"}
-}
+def run_in_background(widget, func, on_done, on_progress=None, name="background"):
+    # Runs func(report) on a worker thread and calls on_done(result, error) on the Tk thread once
+    # it returns; values passed to report() reach on_progress(value) on the Tk thread. The worker
+    # only writes to a status dict, which the Tk thread polls with widget.after().
+    status = {'done': False, 'result': None, 'error': None, 'progress': None}
+    
+    def report(value):
+        status['progress'] = value
+    
+    def run():
+        try:
+            status['result'] = func(report)
+        except Exception as e:
+            status['error'] = e
+        status['done'] = True
+    
+    def poll():
+        if not status['done']:
+            if on_progress is not None and status['progress'] is not None:
+                on_progress(status['progress'])
+            widget.after(BACKGROUND_POLL_MS, poll)
+            return
+        on_done(status['result'], status['error'])
+    
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    # First look after a tick, so on_done never runs before the caller has the thread
+    widget.after(BACKGROUND_POLL_MS, poll)
+    return thread
 
-def generate_schedule(start_time_str, count=8):
-    schedule = []
-    start_time = datetime.datetime.strptime(start_time_str, '%H:%M')
-    for i in range(count):
-        time = start_time + datetime.timedelta(minutes=30 * i)
-        schedule.append(time.strftime('%H:%M'))
-    return schedule
+class HistoryBrowser:
+    # Booking history as a searchable list that never holds more than HISTORY_PAGES_KEPT pages.
+    # Pages come from engine.search_history() off the Tk thread as the list nears either end;
+    # a page scrolled far out of view is dropped and fetched again from its cursor on the way back.
+    def __init__(self, root, engine, username):
+        self.root = root
+        self.engine = engine
+        self.username = username
+        self.window = tk.Toplevel(root)
+        self.window.title(EMOJI_HISTORY + " Booking History")
+        self.window.geometry("1100x620")
+        self.filters = {}
+        self.ticket_id = ""
+        self.cursors = [None]  # cursors[i] fetches page i; page 0 is the newest
+        self.pages = {}  # page number -> tree items
+        self.first = 0
+        self.last = -1
+        self.end_page = None  # set once the oldest matching page has been seen
+        self.fetching = None
+        self.generation = 0
+        self.create_widgets()
+        self.search()
 
-def transport_emoji(typ):
-    return EMOJI_ILLUMINADO if typ == "illuminado" else EMOJI_NORMAL
+    def create_widgets(self):
+        filter_frame = tk.Frame(self.window, bg=BG_FRAME)
+        filter_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.route_var = tk.StringVar(value="All")
+        self.provider_var = tk.StringVar(value="All")
+        self.start_var = tk.StringVar()
+        self.end_var = tk.StringVar()
+        self.seat_var = tk.StringVar()
+        self.ticket_var = tk.StringVar()
+        self.mine_var = tk.BooleanVar(value=True)
+        fields = [
+            ("Route", ttk.Combobox(filter_frame, textvariable=self.route_var, width=24, state='readonly',
+                                   values=["All"] + list(self.engine.transport_data))),
+            ("Provider", ttk.Combobox(filter_frame, textvariable=self.provider_var, width=16, state='readonly',
+                                      values=["All"] + list(MOBILE_MONEY_PROVIDERS))),
+            ("From (YYYY-MM-DD)", ttk.Entry(filter_frame, textvariable=self.start_var, width=11)),
+            ("To", ttk.Entry(filter_frame, textvariable=self.end_var, width=11)),
+            ("Seat", ttk.Entry(filter_frame, textvariable=self.seat_var, width=5)),
+            ("Ticket ID", ttk.Entry(filter_frame, textvariable=self.ticket_var, width=14)),
+        ]
+        for i, (label, widget) in enumerate(fields):
+            ttk.Label(filter_frame, text=label, background=BG_FRAME).grid(row=0, column=i, padx=4, sticky='w')
+            widget.grid(row=1, column=i, padx=4)
+        ttk.Checkbutton(filter_frame, text=f"Only {self.username}", variable=self.mine_var).grid(row=1, column=len(fields), padx=4)
+        ttk.Button(filter_frame, text="🔍 Search", style="Accent.TButton",
+                   command=self.search).grid(row=1, column=len(fields) + 1, padx=4)
+        self.window.bind('<Return>', lambda event: self.search())
+        
+        self.status_label = ttk.Label(self.window, text="", font=FONT_NORMAL)
+        self.status_label.pack(anchor='w', padx=10)
+        
+        tree_frame = tk.Frame(self.window)
+        tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        columns = ('Booked', 'Ticket', 'Route', 'Departure', 'Seat', 'Provider', 'Total (RWF)', 'Status', 'User')
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=220 if col == 'Route' else 110, anchor='w' if col == 'Route' else 'center')
+        self.scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+        self.tree.tag_configure('evenrow', background=ROW_EVEN)
+        self.tree.tag_configure('oddrow', background=ROW_ODD)
+        self.tree.tag_configure('cancelled', background=SOLDOUT_BG)
+        self.tree.bind('<Double-1>', self.show_details)
+        self.entries = {}
+
+    def read_filters(self):
+        filters = {}
+        if self.mine_var.get():
+            filters['user'] = self.username
+        if self.route_var.get() != "All":
+            filters['name'] = self.route_var.get()
+        if self.provider_var.get() != "All":
+            filters['payment_method'] = self.provider_var.get()
+        if self.seat_var.get().strip():
+            filters['seat'] = self.seat_var.get().strip()
+        # Dates are "YYYY-MM-DD HH:MM", so a whole "To" day is everything before "YYYY-MM-DD~"
+        for key, var, suffix in (('start', self.start_var, ""), ('end', self.end_var, "~")):
+            day = var.get().strip()
+            if day:
+                datetime.date.fromisoformat(day)
+                filters[key] = day + suffix
+        return filters
+
+    def search(self):
+        try:
+            filters = self.read_filters()
+        except ValueError:
+            messagebox.showerror(EMOJI_FAIL + " Search", "Dates must be YYYY-MM-DD.", parent=self.window)
+            return
+        self.generation += 1
+        self.filters = filters
+        self.cursors = [None]
+        self.pages = {}
+        self.first = 0
+        self.last = -1
+        self.end_page = None
+        self.fetching = None
+        self.entries = {}
+        self.tree.delete(*self.tree.get_children())
+        self.ticket_id = self.ticket_var.get().strip().upper()
+        self.fetch(0)
+
+    def fetch(self, page):
+        if self.fetching is not None or page >= len(self.cursors):
+            return
+        self.fetching = page
+        self.status_label.config(text="Searching...")
+        filters = self.filters
+        before = self.cursors[page]
+        generation = self.generation
+        ticket_id = self.ticket_id
+        # Polled from the root: the history window may be closed before the page arrives
+        run_in_background(self.root, lambda report: self.find(filters, before, ticket_id),
+                          lambda result, error: self.show_page(generation, page, result, error),
+                          name="history-search")
+
+    def find(self, filters, before, ticket_id):
+        # On the search thread: a ticket ID is a direct lookup (one page, no cursor), which may
+        # still read the whole journal for an old ticket; the other filters still have to match
+        if ticket_id:
+            entry = self.engine.find_ticket(ticket_id)
+            return [entry] if entry is not None and search_filter(filters)(entry) else [], None
+        return self.engine.search_history(filters, before, HISTORY_PAGE)
+
+    def show_page(self, generation, page, result, error):
+        if generation != self.generation or not self.window.winfo_exists():
+            return
+        self.fetching = None
+        if error is not None:
+            self.status_label.config(text=f"Search failed: {error}")
+            return
+        rows, cursor = result
+        if page + 1 == len(self.cursors):
+            if cursor is None:
+                self.end_page = page
+            else:
+                self.cursors.append(cursor)
+        self.add_page(page, rows)
+
+    def add_page(self, page, rows):
+        anchor = self.top_item()
+        items = []
+        position = 0 if page < self.first else 'end'
+        for i, entry in enumerate(reversed(rows) if position == 0 else rows):
+            tags = ('cancelled',) if entry.get('status') != 'booked' else ('evenrow' if i % 2 == 0 else 'oddrow',)
+            item = self.tree.insert('', position, values=(
+                entry['date'], entry.get('ticket_id', ''), entry['name'], entry['departure'], entry.get('seat', 'Any'),
+                entry.get('payment_method', 'Unknown'), f"{entry['total_price']:,}", entry.get('status', 'booked'),
+                entry['user']), tags=tags)
+            self.entries[item] = entry
+            items.append(item)
+        self.pages[page] = items
+        if page < self.first:
+            self.first = page
+        else:
+            self.last = page
+        # Keep the window bounded: drop the page furthest from the one just added
+        while len(self.pages) > HISTORY_PAGES_KEPT:
+            dropped = self.last if page == self.first else self.first
+            items = self.pages.pop(dropped)
+            for item in items:
+                del self.entries[item]
+            self.tree.delete(*items)
+            if dropped == self.first:
+                self.first += 1
+            else:
+                self.last -= 1
+        if anchor is not None and self.tree.exists(anchor):
+            self.tree.yview_moveto(self.tree.index(anchor) / max(len(self.entries), 1))
+        shown = len(self.entries)
+        if not shown:
+            self.status_label.config(text="No bookings found.")
+        else:
+            more = "" if self.end_page is not None and self.last == self.end_page else " — scroll for more"
+            self.status_label.config(text=f"Showing {shown:,} bookings{more}")
+        # A short page may not fill the window, so no scroll would ever ask for the next one
+        self.on_scroll(*self.tree.yview())
+
+    def top_item(self):
+        children = self.tree.get_children()
+        if not children:
+            return None
+        return children[min(int(self.tree.yview()[0] * len(children)), len(children) - 1)]
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.fetching is not None:
+            return
+        if float(last) > 0.9 and (self.end_page is None or self.last < self.end_page):
+            self.fetch(self.last + 1)
+        elif float(first) < 0.1 and self.first > 0:
+            self.fetch(self.first - 1)
+
+    def show_details(self, event):
+        entry = self.entries.get(self.tree.focus())
+        if entry is None:
+            return
+        messagebox.showinfo(EMOJI_TICKET + " Booking " + entry.get('ticket_id', ''), f"""Route: {entry['name']}
+Destination: {entry.get('destination', 'Unknown')}
+Departure: {entry['departure']}
+Booked: {entry['date']} by {entry['user']}
+Seat: {entry.get('seat', 'Any')}
+Base Price: RWF {entry['base_price']:,}
+Luggage: RWF {entry.get('luggage_price', 0):,}
+Total Paid: RWF {entry['total_price']:,}
+Payment: {entry.get('payment_method', 'Unknown')}
+Status: {entry.get('status', 'booked')}""", parent=self.window)
 
 class TransportApp:
     def __init__(self, root):
@@ -114,43 +340,99 @@ class TransportApp:
         self.root.configure(bg=BG_MAIN)
         self.root.geometry("1300x800")
         
-        self.transport_data = {}
-        self.booking_history = []
+        self.engine = BookingEngine()
+        self.exporter = CsvExporter(self.engine.history)
+        self.export_status = None
+        self.payments = PaymentPipeline()
+        self.analytics = Analytics(self.engine.history)
+        self.analytics_status = None
+        self.payment_status = None
+        self.hold = None
         self.username = ""
         self.current_language = "en"
-        self.user_profiles = {}
         self.loyalty_points = 0
         self.selected_luggage = 'small'
         self.selected_seat = None
+        self.ready = False
+        self.startup = {}
 
-        # Load data
-        self.load_state()
-        self.load_history()
-        self.load_user_profiles()
-
+        # Staged startup: the board is drawn from the cached snapshot straight away, and
+        # the state, profiles and history load in the background behind a progress bar
+        self.cached_board = load_board()
         self.create_widgets()
-        self.prompt_username()
         self.refresh_treeview()
+        self.root.update_idletasks()
+        self.record_startup("board")
+        self.load_in_background()
         
+        # Flush the booking journal before the window goes away
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.root.after(DEPARTURE_REFRESH_MS, self.tick_departures)
+
         # Show weather alert on startup
         self.show_weather_alert()
 
+    def record_startup(self, stage):
+        self.startup[stage] = time.perf_counter() - STARTED
+        STARTUP_SECONDS.observe(self.startup[stage], stage)
+
+    def load_in_background(self):
+        def on_progress(progress):
+            done, total, stage = progress
+            self.progress_label.config(text=stage + "...")
+            self.progress_bar.config(value=done * 100 // total)
+        
+        def on_done(result, error):
+            if error is not None:
+                messagebox.showerror(EMOJI_FAIL + " Startup", f"Failed to load booking data: {error}")
+            self.finish_startup()
+        
+        self.loader = run_in_background(self.root, lambda report: self.engine.load(lambda *progress: report(progress)),
+                                        on_done, on_progress, name="startup-loader")
+
+    def finish_startup(self):
+        self.ready = True
+        self.refresh_treeview()
+        for button in self.action_buttons:
+            button.state(['!disabled'])
+        self.record_startup("ready")
+        dump_metrics()
+        self.prompt_username()
+        
+        # Only the newest page of history was read so far; page in the rest while the window is usable
+        self.progress_label.config(text="Loading older history...")
+        self.progress_bar.config(mode='indeterminate')
+        self.progress_bar.start(10)
+        run_in_background(self.root, lambda report: self.engine.load_all_history(),
+                          lambda result, error: self.progress_frame.pack_forget(), name="history-loader")
+
+    def tick_departures(self):
+        # Departures that have left drop off the board without user action; the metrics file is refreshed on the same beat
+        if self.ready:
+            self.refresh_treeview()
+        dump_metrics()
+        self.root.after(DEPARTURE_REFRESH_MS, self.tick_departures)
+
+    def on_close(self):
+        self.payments.close(wait=False)
+        # A half-loaded engine must not snapshot over the files it is still reading
+        self.loader.join()
+        self.engine.close()
+        dump_metrics()
+        self.root.destroy()
+
     def prompt_username(self):
         name = simpledialog.askstring("User Login " + EMOJI_USER, "Enter your username " + EMOJI_USER + ":")
         if name and name.strip():
             self.username = name.strip()
-            if self.username not in self.user_profiles:
-                self.user_profiles[self.username] = {
-                    'loyalty_points': 0,
-                    'total_rides': 0,
-                    'preferred_language': 'en',
-                    'preferred_payment': 'MTN Mobile Money'
-                }
+            profile = self.engine.login(self.username)
         else:
             self.username = "guest"
-        
-        self.loyalty_points = self.user_profiles.get(self.username, {}).get('loyalty_points', 0)
-        self.save_user_profiles()
+            profile = {}
+
+        self.loyalty_points = profile.get('loyalty_points', 0)
+        self.loyalty_label.config(text=f"{EMOJI_LOYALTY} Points: {self.loyalty_points}")
 
     def create_widgets(self):
         # Header with loyalty points
@@ -165,6 +447,10 @@ class TransportApp:
                                      text=f"{EMOJI_LOYALTY} Points: {self.loyalty_points}",
                                      font=FONT_LABEL, foreground=LABEL_COLOR)
         self.loyalty_label.pack(side='right', padx=20)
+        
+        # Weather alert banner; shown in place so it never holds up a sale
+        self.weather_label = ttk.Label(header_frame, text="", font=FONT_LABEL, foreground=WARNING_COLOR)
+        self.weather_label.pack(side='right', padx=20)
 
         # Language selector
         lang_frame = tk.Frame(self.root, bg=BG_FRAME)
@@ -177,16 +463,35 @@ class TransportApp:
             ttk.Radiobutton(lang_frame, text=name, variable=self.lang_var, 
                            value=code, command=self.change_language).pack(side='left', padx=5)
 
-        # Destination filter
+        # Route filters; choices come from the route catalog and every search goes through its index
         filter_frame = tk.Frame(self.root, bg=BG_FRAME)
         filter_frame.pack(pady=5, fill='x')
         
         ttk.Label(filter_frame, text="Filter by Destination:", font=FONT_LABEL, background=BG_FRAME).grid(row=0, column=0, padx=5)
         self.destination_var = tk.StringVar(value="All")
-        destinations = ["All", "East", "South", "West", "North", "Kigali"]
+        destinations = ["All"] + self.engine.route_index.values['destination']
         for i, dest in enumerate(destinations):
             ttk.Radiobutton(filter_frame, text=dest, variable=self.destination_var, 
                            value=dest, command=self.refresh_treeview).grid(row=0, column=i+1, padx=5)
+        
+        criteria_frame = tk.Frame(self.root, bg=BG_FRAME)
+        criteria_frame.pack(pady=5, fill='x')
+        self.type_var = tk.StringVar(value="All")
+        self.price_var = tk.StringVar(value=next(iter(PRICE_BANDS)))
+        self.window_var = tk.StringVar(value=next(iter(DEPARTURE_WINDOWS)))
+        self.with_seats_var = tk.BooleanVar(value=False)
+        choices = [
+            ("Type:", self.type_var, ["All"] + self.engine.route_index.values['type']),
+            ("Price:", self.price_var, list(PRICE_BANDS)),
+            ("Leaving:", self.window_var, list(DEPARTURE_WINDOWS)),
+        ]
+        for i, (label, variable, values) in enumerate(choices):
+            ttk.Label(criteria_frame, text=label, font=FONT_LABEL, background=BG_FRAME).grid(row=0, column=2 * i, padx=5)
+            box = ttk.Combobox(criteria_frame, textvariable=variable, values=values, width=14, state='readonly')
+            box.grid(row=0, column=2 * i + 1, padx=5)
+            box.bind("<<ComboboxSelected>>", lambda event: self.refresh_treeview())
+        ttk.Checkbutton(criteria_frame, text=f"{EMOJI_SEAT} With seats", variable=self.with_seats_var,
+                        command=self.refresh_treeview).grid(row=0, column=2 * len(choices), padx=5)
 
         # Main treeview
         columns = ('Name', 'Destination', 'Next Departure', 'Price (RWF)', 'Available Seats', 'Type')
@@ -215,6 +520,10 @@ class TransportApp:
         self.tree.tag_configure('illuminado', background=ILLUMINADO_BG)
         self.tree.tag_configure('soldout', background=SOLDOUT_BG)
 
+        # Per-route cache of the data each row was last drawn from, and the rows currently attached
+        self.row_cache = {}
+        self.visible_rows = set()
+
         # Button styling
         style.configure("Accent.TButton", background=BTN_COLOR, foreground="white", font=FONT_LABEL, borderwidth=0)
         style.map("Accent.TButton", background=[("active", BTN_HOVER)], foreground=[("active", "white")])
@@ -225,19 +534,33 @@ class TransportApp:
         
         buttons = [
             (EMOJI_TICKET + " Buy Ticket", self.buy_ticket),
+            (EMOJI_GROUP + " Group Booking", self.book_group),
             (EMOJI_SEAT_SELECT + " Select Seat", self.select_seat),
             (EMOJI_HISTORY + " History", self.show_history),
             (EMOJI_EXPORT + " Export CSV", self.export_csv),
             (EMOJI_PAYMENT + " Payment", self.show_payment_options),
             (EMOJI_LOYALTY + " Loyalty", self.show_loyalty_info),
+            (EMOJI_REVENUE + " Revenue", self.show_revenue),
             (EMOJI_SAFETY + " Safety", self.show_safety_info),
             (EMOJI_RESET + " Admin Reset", self.reset_seats)
         ]
         
+        # Disabled until the engine has loaded; the board alone comes from the cached snapshot
+        self.action_buttons = []
         for i, (text, command) in enumerate(buttons):
-            ttk.Button(btn_frame, text=text, style="Accent.TButton", 
-                      command=command).grid(row=0, column=i, padx=2, sticky='ew')
+            button = ttk.Button(btn_frame, text=text, style="Accent.TButton", command=command)
+            button.grid(row=0, column=i, padx=2, sticky='ew')
+            button.state(['disabled'])
+            self.action_buttons.append(button)
             btn_frame.columnconfigure(i, weight=1)
+        
+        # Startup progress; removed once the whole history is in
+        self.progress_frame = tk.Frame(self.root, bg=BG_FRAME)
+        self.progress_frame.pack(fill='x', padx=10, pady=5)
+        self.progress_label = ttk.Label(self.progress_frame, text="Starting...", font=FONT_NORMAL, background=BG_FRAME)
+        self.progress_label.pack(side='left', padx=5)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, mode='determinate', length=300, maximum=100)
+        self.progress_bar.pack(side='left', padx=5)
 
     def change_language(self):
         self.current_language = self.lang_var.get()
@@ -245,34 +568,91 @@ class TransportApp:
                           f"Language changed to {LANGUAGES[self.current_language]}")
 
     def refresh_treeview(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        filtered_destination = self.destination_var.get()
-        
-        for idx, (name, data) in enumerate(self.transport_data.items()):
-            if filtered_destination != "All" and data.get('destination', '') != filtered_destination:
-                continue
-                
-            display_name = f"{transport_emoji(data['type'])} {name}"
-            display_type = f"{transport_emoji(data['type'])} {data['type'].capitalize()}"
-            tags = ()
-            if data['seats'] == 0:
-                tags = ('soldout',)
-                display_name += " " + EMOJI_SOLDOUT
-            elif data['type'] == 'illuminado':
-                tags = ('illuminado',)
+        with UI_SECONDS.time("refresh_treeview"):
+            self._refresh_treeview()
+
+    def route_criteria(self):
+        # The filter widgets as find_routes() arguments
+        destination = self.destination_var.get()
+        route_type = self.type_var.get()
+        min_price, max_price = PRICE_BANDS[self.price_var.get()]
+        return {
+            'destination': None if destination == "All" else destination,
+            'route_type': None if route_type == "All" else route_type,
+            'min_price': min_price,
+            'max_price': max_price,
+            'window': DEPARTURE_WINDOWS[self.window_var.get()],
+            'with_seats': self.with_seats_var.get(),
+        }
+
+    def matching_routes(self, board):
+        criteria = self.route_criteria()
+        if self.ready:
+            return self.engine.find_routes(**criteria)
+        # Before the state is loaded seat counts come from the cached board
+        with_seats = criteria.pop('with_seats')
+        names = self.engine.route_index.search(now=minute_of(), **criteria)
+        return [name for name in names if name in board and (not with_seats or board[name]['seats'] > 0)]
+
+    def _refresh_treeview(self):
+        # Only matching routes are visited, in catalog order; rows whose data or visibility changed
+        # touch the tree, and filtered-out rows are detached, not deleted
+        if self.ready:
+            board = self.engine.transport_data
+        else:
+            board = self.cached_board
+        names = self.matching_routes(board)
+        
+        for name in self.row_cache.keys() - board.keys():
+            self.tree.delete(name)
+            del self.row_cache[name]
+            self.visible_rows.discard(name)
+        
+        shown = set(names)
+        hidden = [name for name in self.visible_rows if name not in shown]
+        if hidden:
+            self.tree.detach(*hidden)
+            self.visible_rows.difference_update(hidden)
+        
+        for position, name in enumerate(names):
+            data = board[name]
+            key = (position, data['seats'], data['next_departure'], data['price'], data['type'], data.get('destination'))
+            cached = self.row_cache.get(name)
+            if cached is None:
+                values, tags = self.format_row(position, name, data)
+                self.tree.insert('', position, iid=name, values=values, tags=tags)
+                self.visible_rows.add(name)
+                self.row_cache[name] = key
             else:
-                tags = ('evenrow',) if idx % 2 == 0 else ('oddrow',)
-            
-            self.tree.insert('', 'end', iid=name, values=(
-                display_name,
-                data.get('destination', 'N/A'),
-                data['next_departure'],
-                f"RWF {data['price']:,}",
-                f"{EMOJI_SEAT} {data['seats']}",
-                display_type
-            ), tags=tags)
+                if cached != key:
+                    values, tags = self.format_row(position, name, data)
+                    self.tree.item(name, values=values, tags=tags)
+                    self.row_cache[name] = key
+                if name not in self.visible_rows:
+                    self.tree.move(name, '', position)
+                    self.visible_rows.add(name)
+
+    def format_row(self, idx, name, data):
+        display_name = f"{transport_emoji(data['type'])} {name}"
+        display_type = f"{transport_emoji(data['type'])} {data['type'].capitalize()}"
+        tags = ()
+        if data['seats'] == 0:
+            tags = ('soldout',)
+            display_name += " " + EMOJI_SOLDOUT
+        elif data['type'] == 'illuminado':
+            tags = ('illuminado',)
+        else:
+            tags = ('evenrow',) if idx % 2 == 0 else ('oddrow',)
+        
+        values = (
+            display_name,
+            data.get('destination', 'N/A'),
+            departure_label(data['next_departure']) if data['next_departure'] else "—",
+            f"RWF {data['price']:,}",
+            f"{EMOJI_SEAT} {data['seats']}",
+            display_type
+        )
+        return values, tags
 
     def buy_ticket(self):
         selected_item = self.tree.selection()
@@ -281,17 +661,31 @@ class TransportApp:
             return
         
         name = selected_item[0]
-        data = self.transport_data[name]
+        data = self.engine.transport_data[name]
         
         if data['seats'] <= 0:
             messagebox.showinfo(EMOJI_SOLDOUT + " Sold Out", "No seats available.")
             return
+        if self.payment_status is not None:
+            messagebox.showinfo(EMOJI_PAYMENT + " Payment", "A payment is already in progress.")
+            return
+        
+        # The seat is held from here until it is paid for, the purchase is abandoned, or the hold expires
+        self.release_hold()
+        if not self.take_hold(name):
+            return
 
         # Show luggage options
         luggage_window = tk.Toplevel(self.root)
         luggage_window.title(EMOJI_LUGGAGE + " Luggage Options")
         luggage_window.geometry("400x300")
         
+        def cancel_luggage():
+            luggage_window.destroy()
+            self.release_hold()
+        
+        luggage_window.protocol("WM_DELETE_WINDOW", cancel_luggage)
+        
         ttk.Label(luggage_window, text="Select your luggage option:", font=FONT_LABEL).pack(pady=10)
         
         self.luggage_var = tk.StringVar(value=self.selected_luggage)
@@ -310,102 +704,139 @@ class TransportApp:
         
         ttk.Button(luggage_window, text="Confirm", command=confirm_luggage).pack(pady=10)
 
+    def take_hold(self, name, departure=None, passengers=None, spread=False):
+        # A seat picked on the seat map only applies to the route it was picked for
+        seat = self.selected_seat[1] if self.selected_seat and self.selected_seat[0] == name else None
+        try:
+            if passengers is None:
+                self.hold = self.engine.hold(name, self.username, seat=seat, departure=departure)
+            else:
+                self.hold = self.engine.hold_group(name, self.username, passengers, departure=departure, spread=spread)
+        except BookingError as e:
+            messagebox.showerror(EMOJI_FAIL + " Seat Unavailable", str(e))
+            return False
+        self.refresh_treeview()
+        return True
+
+    def held_ids(self):
+        # A group purchase holds one seat per passenger
+        return self.hold.get('hold_ids', [self.hold.get('hold_id')]) if self.hold is not None else []
+
+    def release_hold(self):
+        if self.hold is not None:
+            for hold_id in self.held_ids():
+                self.engine.release_hold(hold_id)
+            self.hold = None
+            self.refresh_treeview()
+
     def confirm_ticket_purchase(self, name, data):
-        luggage_price = LUGGAGE_OPTIONS[self.selected_luggage]['price']
-        total_price = data['price'] + luggage_price
-        
-        # Apply loyalty discount
-        discount = self.calculate_loyalty_discount()
-        discount_amount = total_price * discount // 100
-        final_price = total_price - discount_amount
+        quote = self.engine.quote(name, self.username, self.selected_luggage)
+        if self.hold is not None:
+            quote['departure'] = self.hold['departure']
+        held = f"Seat {self.hold['seat']} is held for you for {int(self.hold['ttl']) // 60} minutes" if self.hold else ""
         
         confirm_msg = f"""
 Buy ticket for {transport_emoji(data['type'])} {name}
 To: {data.get('destination', 'Unknown')}
-Departure: {data['next_departure']}
+Departure: {departure_label(quote['departure'])}
 
-Base Price: RWF {data['price']:,}
-Luggage: {LUGGAGE_OPTIONS[self.selected_luggage]['name']} - RWF {luggage_price:,}
-Loyalty Discount: {discount}% (-RWF {discount_amount:,})
+Base Price: RWF {quote['base_price']:,}
+Luggage: {LUGGAGE_OPTIONS[quote['luggage']]['name']} - RWF {quote['luggage_price']:,}
+Loyalty Discount: {quote['discount']}% (-RWF {quote['discount_amount']:,})
 ────────────────────────
-TOTAL: RWF {final_price:,}
+TOTAL: RWF {quote['total_price']:,}
 
 Remaining seats: {data['seats']} {EMOJI_SEAT}
+{held}
         """
         
         confirm = messagebox.askyesno(EMOJI_TICKET + " Confirm Purchase", confirm_msg)
         if confirm:
-            self.process_payment(name, data, final_price)
-
-    def calculate_loyalty_discount(self):
-        user_profile = self.user_profiles.get(self.username, {})
-        total_rides = user_profile.get('total_rides', 0)
-        
-        current_discount = 0
-        for tier, info in LOYALTY_TIERS.items():
-            if total_rides >= info['min_rides']:
-                current_discount = info['discount']
-        
-        return current_discount
+            self.process_payment(name, data, quote)
+        else:
+            self.release_hold()
 
-    def process_payment(self, name, data, final_price):
+    def process_payment(self, name, data, quote):
         payment_window = tk.Toplevel(self.root)
         payment_window.title(EMOJI_PAYMENT + " Payment Options")
         payment_window.geometry("500x400")
         
         ttk.Label(payment_window, text="Select payment method:", font=FONT_LABEL).pack(pady=10)
         
+        def cancel_payment():
+            payment_window.destroy()
+            if self.payment_status is None:
+                self.release_hold()
+        
+        payment_window.protocol("WM_DELETE_WINDOW", cancel_payment)
+        
         for provider, ussd_template in MOBILE_MONEY_PROVIDERS.items():
             frame = tk.Frame(payment_window)
             frame.pack(fill='x', padx=20, pady=5)
             
-            ussd_code = ussd_template.format(amount=final_price)
+            ussd_code = ussd_template.format(amount=quote.get('group_total', quote['total_price']))
             
             ttk.Button(frame, text=f"{provider}\n{ussd_code}", 
-                      command=lambda p=provider, u=ussd_code: self.complete_payment(name, data, final_price, p, u),
+                      command=lambda p=provider, u=ussd_code: self.complete_payment(name, data, quote, p, u),
                       width=40).pack(fill='x')
 
-    def complete_payment(self, name, data, final_price, provider, ussd_code):
-        # Simulate payment processing
-        payment_success = random.choice([True, True, True, False])  # 75% success rate
+    def complete_payment(self, name, data, quote, provider, ussd_code):
+        if self.payment_status is not None:
+            messagebox.showinfo(EMOJI_PAYMENT + " Payment", "A payment is already in progress.")
+            return
+        # Seats are held before charging: again after a failed payment released them, or when
+        # the hold expired while the dialogs were open
+        if self.hold is not None and not all(hold_id in self.engine.holds for hold_id in self.held_ids()):
+            self.release_hold()
+        if self.hold is None and not self.take_hold(name, quote['departure'], quote.get('passengers'),
+                                                     quote.get('spread', False)):
+            return
         
-        if payment_success:
-            self.complete_purchase(name, data, final_price, provider)
-        else:
-            messagebox.showerror(EMOJI_FAIL + " Payment Failed", 
-                               f"Payment via {provider} failed. Please try again.")
-
-    def complete_purchase(self, name, data, final_price, provider):
-        # Update seats and schedule
-        data['seats'] -= 1
-        data['schedule_index'] = (data['schedule_index'] + 1) % len(data['schedule'])
-        data['next_departure'] = data['schedule'][data['schedule_index']]
-        
-        # Update loyalty points
-        self.loyalty_points += final_price // 100  # 1 point per 100 RWF
-        if self.username in self.user_profiles:
-            self.user_profiles[self.username]['loyalty_points'] = self.loyalty_points
-            self.user_profiles[self.username]['total_rides'] = self.user_profiles[self.username].get('total_rides', 0) + 1
-        
-        # Save booking
-        entry = {
-            'name': name,
-            'destination': data.get('destination', 'Unknown'),
-            'departure': data['next_departure'],
-            'base_price': data['price'],
-            'luggage_price': LUGGAGE_OPTIONS[self.selected_luggage]['price'],
-            'total_price': final_price,
-            'payment_method': provider,
-            'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-            'user': self.username,
-            'seat': self.selected_seat
-        }
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title(EMOJI_PAYMENT + " Processing Payment")
+        progress_window.geometry("380x130")
+        ttk.Label(progress_window, text=f"Waiting for {provider}...\nConfirm {ussd_code} on your phone.",
+                  font=FONT_NORMAL, justify='center').pack(pady=10)
+        progress_bar = ttk.Progressbar(progress_window, mode='indeterminate', length=300)
+        progress_bar.pack(pady=5)
+        progress_bar.start(10)
+        
+        def on_done(result, error):
+            self.payment_status = None
+            progress_window.destroy()
+            if error is not None:
+                result = {'status': 'failed', 'error': error}
+            if result['status'] == 'approved' and 'passengers' in quote:
+                self.complete_group_purchase(name, data, quote, provider)
+            elif result['status'] == 'approved':
+                self.complete_purchase(name, data, quote, provider)
+            elif result['status'] == 'declined':
+                self.release_hold()
+                messagebox.showerror(EMOJI_FAIL + " Payment Failed", 
+                                   f"Payment via {provider} was declined. Please try again.")
+            else:
+                self.release_hold()
+                messagebox.showerror(EMOJI_FAIL + " Payment Failed", 
+                                   f"Payment via {provider} failed: {result['error']}. Please try again.")
         
-        self.booking_history.append(entry)
-        self.save_history()
-        self.save_state()
-        self.save_user_profiles()
+        amount = quote.get('group_total', quote['total_price'])
+        self.payment_status = run_in_background(self.root, lambda report: self.payments.pay(provider, amount),
+                                                on_done, name="payment")
+
+    def complete_purchase(self, name, data, quote, provider):
+        # The held seat becomes the sale; the seat-map pick is only the fallback if the hold lapsed
+        seat = self.selected_seat[1] if self.selected_seat and self.selected_seat[0] == name else None
+        hold = self.hold['hold_id'] if self.hold is not None else None
+        self.hold = None
+        try:
+            entry = self.engine.book(name, self.username, provider, luggage=quote['luggage'],
+                                     seat=seat, quote=quote, departure=quote['departure'], hold=hold)
+        except BookingError as e:
+            messagebox.showerror(EMOJI_FAIL + " Booking Failed", str(e))
+            return
+        self.selected_seat = None
         
+        self.loyalty_points = (self.engine.profile(self.username) or {}).get('loyalty_points', self.loyalty_points)
         self.refresh_treeview()
         self.loyalty_label.config(text=f"{EMOJI_LOYALTY} Points: {self.loyalty_points}")
         
@@ -413,50 +844,144 @@ Remaining seats: {data['seats']} {EMOJI_SEAT}
         qr_info = f"""
 {EMOJI_QR} ILLUMINADO E-TICKET {EMOJI_QR}
 Route: {name}
-Destination: {data.get('destination', 'Unknown')}
-Departure: {data['next_departure']}
-Seat: {self.selected_seat or 'Any'}
+Destination: {entry['destination']}
+Departure: {entry['departure']}
+Seat: {entry['seat']}
 Passenger: {self.username}
-Ticket ID: {random.randint(100000, 999999)}
+Ticket ID: {entry['ticket_id']}
         """
         
         messagebox.showinfo(EMOJI_SUCCESS + " Booking Complete", 
                           f"Payment successful via {provider}!\n\n{qr_info}")
 
+    def book_group(self):
+        selected_item = self.tree.selection()
+        if not selected_item:
+            messagebox.showwarning(EMOJI_FAIL + " No selection", "Please select a transport option.")
+            return
+        
+        name = selected_item[0]
+        data = self.engine.transport_data[name]
+        if self.payment_status is not None:
+            messagebox.showinfo(EMOJI_PAYMENT + " Payment", "A payment is already in progress.")
+            return
+        passengers = simpledialog.askinteger(EMOJI_GROUP + " Group Booking", "Number of passengers:",
+                                             minvalue=1, maxvalue=MAX_GROUP_SIZE)
+        if not passengers:
+            return
+        
+        spread = False
+        if data['seats'] < passengers:
+            spread = messagebox.askyesno(EMOJI_GROUP + " Group Booking",
+                                         f"Only {data['seats']} seats left on the next departure.\n\n"
+                                         "Spread the group over the following departures?")
+            if not spread:
+                return
+        
+        try:
+            quote = self.engine.group_quote(name, self.username, passengers, self.selected_luggage)
+        except BookingError as e:
+            messagebox.showerror(EMOJI_FAIL + " Group Booking", str(e))
+            return
+        quote['spread'] = spread
+        # The group's seats are held from here, as for a single ticket
+        self.release_hold()
+        if not self.take_hold(name, quote['departure'], passengers, spread):
+            return
+        
+        confirm_msg = f"""
+Group booking for {transport_emoji(data['type'])} {name}
+To: {data.get('destination', 'Unknown')}
+Passengers: {passengers}
+Departure: {departure_label(quote['departure'])}{' and following' if spread else ''}
+
+Per ticket: RWF {quote['base_price'] + quote['luggage_price']:,}
+Discount: {quote['discount']}% (-RWF {quote['discount_amount']:,} each)
+────────────────────────
+TOTAL: RWF {quote['group_total']:,}
+
+{passengers} seats are held for you for {int(self.hold['ttl']) // 60} minutes
+        """
+        if messagebox.askyesno(EMOJI_GROUP + " Confirm Group Booking", confirm_msg):
+            self.process_payment(name, data, quote)
+        else:
+            self.release_hold()
+
+    def complete_group_purchase(self, name, data, quote, provider):
+        holds = self.held_ids()
+        self.hold = None
+        try:
+            entries = self.engine.book_group(name, self.username, provider, quote['passengers'],
+                                             luggage=quote['luggage'], departure=quote['departure'],
+                                             spread=quote['spread'], quote=quote, holds=holds)
+        except BookingError as e:
+            messagebox.showerror(EMOJI_FAIL + " Booking Failed", str(e))
+            return
+        
+        self.loyalty_points = (self.engine.profile(self.username) or {}).get('loyalty_points', self.loyalty_points)
+        self.refresh_treeview()
+        self.loyalty_label.config(text=f"{EMOJI_LOYALTY} Points: {self.loyalty_points}")
+        
+        per_departure = {}
+        for entry in entries:
+            per_departure.setdefault(entry['departure'], []).append(entry)
+        lines = []
+        for departure, group in per_departure.items():
+            seats = ", ".join(str(entry['seat']) for entry in group)
+            lines.append(f"{departure_label(departure)}: seats {seats}")
+        summary = "\n".join(lines)
+        messagebox.showinfo(EMOJI_SUCCESS + " Group Booking Complete",
+                            f"Payment successful via {provider}!\n\n"
+                            f"{len(entries)} tickets booked on {name}\n{summary}\n\n"
+                            f"First ticket ID: {entries[0]['ticket_id']}")
+
     def select_seat(self):
         selected_item = self.tree.selection()
         if not selected_item:
             messagebox.showwarning(EMOJI_FAIL + " No selection", "Please select a transport option first.")
             return
+        
+        name = selected_item[0]
+        data = self.engine.transport_data[name]
+        seat_map = self.engine.seat_map(name)
+        if seat_map is None:
+            messagebox.showinfo(EMOJI_SOLDOUT + " No departures", "No more departures on this route.")
+            return
+        rows = -(-seat_map.capacity // seat_map.seats_per_row)
             
         seat_window = tk.Toplevel(self.root)
         seat_window.title(EMOJI_SEAT_SELECT + " Select Your Seat")
-        seat_window.geometry("400x500")
+        seat_window.geometry(f"400x{200 + rows * 60}")
         
-        ttk.Label(seat_window, text="Choose your preferred seat:", font=FONT_LABEL).pack(pady=10)
+        ttk.Label(seat_window, text=f"Choose your preferred seat ({departure_label(data['next_departure'])} departure):",
+                  font=FONT_LABEL).pack(pady=10)
         
-        # Create seat map (5 rows, 4 columns)
+        # Seat map for the departure on sale; taken seats are disabled, free window seats shaded
         seat_frame = tk.Frame(seat_window)
         seat_frame.pack(pady=10)
         
-        seats = []
-        for row in range(5):
+        for row in range(rows):
             row_frame = tk.Frame(seat_frame)
             row_frame.pack()
-            for col in range(4):
-                seat_num = row * 4 + col + 1
+            for col in range(seat_map.seats_per_row):
+                seat_num = row * seat_map.seats_per_row + col + 1
+                if seat_num > seat_map.capacity:
+                    break
                 seat_btn = tk.Button(row_frame, text=str(seat_num), width=4, height=2,
-                                   command=lambda sn=seat_num: self.confirm_seat(sn, seat_window))
+                                   command=lambda sn=seat_num: self.confirm_seat(name, sn, seat_window))
                 seat_btn.grid(row=row, column=col, padx=2, pady=2)
-                seats.append(seat_btn)
+                if seat_map.is_taken(seat_num):
+                    seat_btn.config(text="X", state="disabled", bg="red")
+                elif seat_map.is_window(seat_num):
+                    seat_btn.config(bg="lightblue")
         
-        # Mark some seats as occupied
-        occupied_seats = random.sample(range(1, 21), 5)
-        for seat_num in occupied_seats:
-            seats[seat_num-1].config(text="X", state="disabled", bg="red")
+        window_seat = seat_map.first_free_window()
+        if window_seat is not None:
+            ttk.Button(seat_window, text=f"First free window seat ({window_seat})",
+                       command=lambda: self.confirm_seat(name, window_seat, seat_window)).pack(pady=5)
 
-    def confirm_seat(self, seat_num, window):
-        self.selected_seat = seat_num
+    def confirm_seat(self, name, seat_num, window):
+        self.selected_seat = (name, seat_num)
         window.destroy()
         messagebox.showinfo(EMOJI_SEAT_SELECT + " Seat Selected", 
                           f"Seat {seat_num} has been selected!")
@@ -473,18 +998,58 @@ All payments are secure and encrypted.
         """
         messagebox.showinfo(EMOJI_PAYMENT + " Payment Methods", payment_info)
 
+    def show_revenue(self):
+        if self.analytics_status is not None:
+            return
+        # Rollups catch up on bookings since the last look off the Tk thread
+        def on_done(result, error):
+            self.analytics_status = None
+            if error is not None:
+                messagebox.showerror(EMOJI_FAIL + " Revenue", f"Failed to update revenue figures: {error}")
+                return
+            self.show_revenue_window()
+        
+        self.analytics_status = run_in_background(self.root, lambda report: self.analytics.refresh(), on_done,
+                                                  name="analytics")
+
+    def show_revenue_window(self):
+        revenue_window = tk.Toplevel(self.root)
+        revenue_window.title(EMOJI_REVENUE + " Revenue & Ridership")
+        revenue_window.geometry("760x600")
+        
+        text_area = scrolledtext.ScrolledText(revenue_window, wrap=tk.WORD, width=90, height=34, font=("Courier", 11))
+        text_area.pack(padx=10, pady=10)
+        
+        report = ""
+        for title, totals in (("TODAY", self.analytics.today), ("ALL TIME", self.analytics.totals)):
+            report += f"{'═' * 20} {title} {'═' * 20}\n"
+            for dimension, heading in (('route', "Route"), ('destination', "Destination"),
+                                       ('provider', "Provider"), ('hour', "Hour booked")):
+                groups = totals(dimension)
+                if not groups:
+                    continue
+                report += f"\n{heading:<32}{'Tickets':>8}{'Revenue':>14}{'Luggage':>12}{'Discounts':>12}\n"
+                ordered = sorted(groups.items()) if dimension == 'hour' else \
+                    sorted(groups.items(), key=lambda item: -item[1][1])
+                for key, (tickets, revenue, luggage, discount) in ordered:
+                    report += f"{key[:31]:<32}{tickets:>8,}{revenue:>14,}{luggage:>12,}{discount:>12,}\n"
+            report += "\n"
+        
+        text_area.insert(tk.INSERT, report)
+        text_area.config(state=tk.DISABLED)
+
     def show_loyalty_info(self):
-        user_profile = self.user_profiles.get(self.username, {})
+        user_profile = self.engine.profile(self.username) or {}
         total_rides = user_profile.get('total_rides', 0)
         points = user_profile.get('loyalty_points', 0)
         
         # Calculate current tier
-        current_tier = "Bronze"
-        current_discount = 0
-        for tier, info in LOYALTY_TIERS.items():
-            if total_rides >= info['min_rides']:
-                current_tier = info['name']
-                current_discount = info['discount']
+        tier = self.engine.loyalty_tier(self.username)
+        current_tier = tier['name']
+        current_discount = tier['discount']
+        
+        tiers = "\n".join(f"• {info['name']} ({info['min_rides']}+ rides) - {info['discount']}% discount"
+                          for info in self.engine.loyalty.tiers)
         
         loyalty_info = f"""
 {EMOJI_LOYALTY} LOYALTY PROGRAM {EMOJI_LOYALTY}
@@ -495,12 +1060,9 @@ Loyalty Points: {points}
 Current Discount: {current_discount}%
 
 Tiers:
-• Bronze (0+ rides) - 0% discount
-• Silver (10+ rides) - 5% discount  
-• Gold (25+ rides) - 10% discount
-• Platinum (50+ rides) - 15% discount
+{tiers}
 
-Earn 1 point for every 100 RWF spent!
+Earn 1 point for every {RWF_PER_POINT} RWF spent!
         """
         messagebox.showinfo(EMOJI_LOYALTY + " Loyalty Program", loyalty_info)
 
@@ -540,169 +1102,52 @@ Your safety is our priority!
         
         alert = random.choice(weather_conditions)
         if alert != "Sunny day - Safe travels!":
-            messagebox.showwarning(EMOJI_WEATHER + " Weather Alert", alert)
+            self.weather_label.config(text=f"{EMOJI_WEATHER} {alert}")
 
     def show_history(self):
-        if not self.booking_history:
-            messagebox.showinfo(EMOJI_HISTORY + " Booking History", "No bookings yet.")
-            return
-        
-        history_window = tk.Toplevel(self.root)
-        history_window.title(EMOJI_HISTORY + " Booking History")
-        history_window.geometry("800x600")
-        
-        text_area = scrolledtext.ScrolledText(history_window, wrap=tk.WORD, width=80, height=30)
-        text_area.pack(padx=10, pady=10, fill='both', expand=True)
-        
-        history_text = f"{EMOJI_HISTORY} Booking History for {self.username}\n{'='*50}\n\n"
-        
-        for idx, entry in enumerate(reversed(self.booking_history[-20:]), 1):  # Show last 20 bookings
-            history_text += f"""Booking {idx}:
-Route: {entry['name']}
-Destination: {entry.get('destination', 'Unknown')}
-Departure: {entry['departure']}
-Date: {entry['date']}
-Seat: {entry.get('seat', 'Any')}
-Base Price: RWF {entry['base_price']:,}
-Luggage: RWF {entry.get('luggage_price', 0):,}
-Total Paid: RWF {entry['total_price']:,}
-Payment: {entry.get('payment_method', 'Unknown')}
-{'─'*40}\n
-"""
-        
-        text_area.insert(tk.INSERT, history_text)
-        text_area.config(state=tk.DISABLED)
-
-    def save_history(self):
-        try:
-            with open(HISTORY_FILE, "w") as f:
-                for entry in self.booking_history:
-                    line = f"{entry['name']}|{entry.get('destination', 'Unknown')}|{entry['departure']}|{entry['base_price']}|{entry.get('luggage_price', 0)}|{entry['total_price']}|{entry.get('payment_method', 'Unknown')}|{entry['date']}|{entry['user']}|{entry.get('seat', 'Any')}\n"
-                    f.write(line)
-        except Exception as e:
-            print(f"Error saving history: {e}")
-
-    def load_history(self):
-        if not os.path.exists(HISTORY_FILE):
-            return
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                for line in f:
-                    parts = line.strip().split("|")
-                    if len(parts) >= 9:
-                        try:
-                            self.booking_history.append({
-                                'name': parts[0],
-                                'destination': parts[1],
-                                'departure': parts[2],
-                                'base_price': int(parts[3]),
-                                'luggage_price': int(parts[4]),
-                                'total_price': int(parts[5]),
-                                'payment_method': parts[6],
-                                'date': parts[7],
-                                'user': parts[8],
-                                'seat': parts[9] if len(parts) > 9 else 'Any'
-                            })
-                        except ValueError:
-                            continue
-        except Exception as e:
-            print(f"Error loading history: {e}")
-
-    def save_user_profiles(self):
-        try:
-            with open(USER_PROFILES_FILE, "w") as f:
-                json.dump(self.user_profiles, f)
-        except Exception as e:
-            print(f"Error saving user profiles: {e}")
-
-    def load_user_profiles(self):
-        if not os.path.exists(USER_PROFILES_FILE):
-            self.user_profiles = {}
-            return
-        try:
-            with open(USER_PROFILES_FILE, "r") as f:
-                self.user_profiles = json.load(f)
-        except Exception as e:
-            print(f"Error loading user profiles: {e}")
-            self.user_profiles = {}
-
-    def save_state(self):
-        try:
-            state = {}
-            for name, data in self.transport_data.items():
-                state[name] = {
-                    'seats': data['seats'],
-                    'schedule_index': data['schedule_index']
-                }
-            with open(STATE_FILE, "w") as f:
-                json.dump(state, f)
-        except Exception as e:
-            print(f"Error saving state: {e}")
-
-    def load_state(self):
-        state = {}
-        if os.path.exists(STATE_FILE):
-            try:
-                with open(STATE_FILE, "r") as f:
-                    state = json.load(f)
-            except Exception as e:
-                print(f"Error loading state: {e}")
-        for option in transport_options:
-            schedule = generate_schedule(option['start_time'])
-            seats = 20
-            schedule_index = 0
-            name = option['name']
-            if name in state:
-                seats = state[name].get('seats', 20)
-                schedule_index = state[name].get('schedule_index', 0)
-                if not isinstance(schedule_index, int) or schedule_index < 0 or schedule_index >= len(schedule):
-                    schedule_index = 0
-            next_departure = schedule[schedule_index]
-            self.transport_data[name] = {
-                'seats': seats,
-                'price': option['price'],
-                'next_departure': next_departure,
-                'type': option['type'],
-                'destination': option.get('destination', 'Unknown'),
-                'schedule': schedule,
-                'schedule_index': schedule_index
-            }
+        HistoryBrowser(self.root, self.engine, self.username)
 
     def reset_seats(self):
         confirm = messagebox.askyesno(EMOJI_RESET + " Reset All Seats", 
-                                    "Are you sure you want to reset all seats to 20 and schedules to the start?")
+                                    "Are you sure you want to free every seat on upcoming departures?")
         if confirm:
-            for option in transport_options:
-                schedule = generate_schedule(option['start_time'])
-                next_departure = schedule[0]
-                seats = 20
-                self.transport_data[option['name']] = {
-                    'seats': seats,
-                    'price': option['price'],
-                    'next_departure': next_departure,
-                    'type': option['type'],
-                    'destination': option.get('destination', 'Unknown'),
-                    'schedule': schedule,
-                    'schedule_index': 0
-                }
-            self.save_state()
+            self.engine.reset_seats()
             self.refresh_treeview()
-            messagebox.showinfo(EMOJI_RESET + " Reset Complete", "All seats and schedules have been reset!")
+            messagebox.showinfo(EMOJI_RESET + " Reset Complete", "All seats have been reset!")
 
     def export_csv(self):
-        if not self.booking_history:
+        if not self.engine.history.recent(1):
             messagebox.showinfo(EMOJI_EXPORT + " Export CSV", "No bookings to export.")
             return
-        try:
-            with open(CSV_FILE, "w", newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['name', 'destination', 'departure', 'base_price', 'luggage_price', 'total_price', 'payment_method', 'date', 'user', 'seat']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                for entry in self.booking_history:
-                    writer.writerow(entry)
-            messagebox.showinfo(EMOJI_EXPORT + " Export CSV", f"Booking history exported to {CSV_FILE}")
-        except Exception as e:
-            messagebox.showerror(EMOJI_FAIL + " Export CSV", f"Failed to export CSV: {e}")
+        if self.export_status is not None:
+            messagebox.showinfo(EMOJI_EXPORT + " Export CSV", "An export is already running.")
+            return
+        incremental = messagebox.askyesno(EMOJI_EXPORT + " Export CSV",
+                                          "Export only bookings added since the last export?\n\n"
+                                          "Choose No to export the full history.")
+        
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title(EMOJI_EXPORT + " Exporting")
+        progress_window.geometry("350x120")
+        progress_label = ttk.Label(progress_window, text="Starting export...", font=FONT_NORMAL)
+        progress_label.pack(pady=10)
+        progress_bar = ttk.Progressbar(progress_window, mode='indeterminate', length=280)
+        progress_bar.pack(pady=5)
+        progress_bar.start(10)
+        
+        def on_progress(rows):
+            progress_label.config(text=f"Exported {rows:,} bookings...")
+        
+        def on_done(rows, error):
+            self.export_status = None
+            progress_window.destroy()
+            if error is not None:
+                messagebox.showerror(EMOJI_FAIL + " Export CSV", f"Failed to export CSV: {error}")
+            else:
+                messagebox.showinfo(EMOJI_EXPORT + " Export CSV", f"{rows:,} bookings exported to {CSV_FILE}")
+        
+        self.export_status = run_in_background(self.root, lambda report: self.exporter.export(incremental, report),
+                                               on_done, on_progress, name="csv-export")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,65 @@
+import bisect
+
+# 1 loyalty point per this many RWF paid
+RWF_PER_POINT = 100
+
+
+def points_for(amount):
+    return amount // RWF_PER_POINT
+
+
+class LoyaltyProgram:
+    # Tiers sorted by 'min_rides' so a tier is one bisect over the thresholds. Each user's tier
+    # is cached with the range of ride counts it holds for; it is only looked up again once
+    # total_rides leaves that range, i.e. crosses a threshold either way.
+    def __init__(self, tiers):
+        self.set_tiers(tiers)
+
+    def set_tiers(self, tiers):
+        ordered = sorted(tiers.items(), key=lambda item: item[1]['min_rides'])
+        self.keys = [key for key, _ in ordered]
+        self.tiers = [info for _, info in ordered]
+        self.thresholds = [info['min_rides'] for info in self.tiers]
+        self._cache = {}
+
+    def tier_index(self, rides):
+        # Below the lowest threshold still counts as the lowest tier
+        return max(bisect.bisect_right(self.thresholds, rides) - 1, 0)
+
+    def tier(self, username, rides):
+        cached = self._cache.get(username)
+        if cached is not None and cached[1] <= rides < cached[2]:
+            return self.tiers[cached[0]]
+        index = self.tier_index(rides)
+        low = self.thresholds[index] if index else 0
+        high = self.thresholds[index + 1] if index + 1 < len(self.thresholds) else float('inf')
+        self._cache[username] = (index, low, high)
+        return self.tiers[index]
+
+    def recompute(self, profiles, tiers=None, bookings=None):
+        # Batch pass after a tier-table change: switches to tiers (if given), drops the cache
+        # and tiers every profile again. Given bookings (the full history), each profile's rides
+        # and points are first rebuilt from its booked tickets.
+        # Returns {username: (old tier key, new tier key)} for profiles whose tier changed.
+        old = {username: self.keys[self.tier_index(profile.get('total_rides', 0))]
+               for username, profile in profiles.items()}
+        if tiers is not None:
+            self.set_tiers(tiers)
+        self._cache = {}
+        if bookings is not None:
+            rides = dict.fromkeys(profiles, 0)
+            points = dict.fromkeys(profiles, 0)
+            for entry in bookings:
+                username = entry.get('user')
+                if username in rides and entry.get('status', 'booked') == 'booked':
+                    rides[username] += 1
+                    points[username] += points_for(entry['total_price'])
+            for username, profile in profiles.items():
+                profile['total_rides'] = rides[username]
+                profile['loyalty_points'] = points[username]
+        changed = {}
+        for username, profile in profiles.items():
+            key = self.keys[self.tier_index(profile.get('total_rides', 0))]
+            if old[username] != key:
+                changed[username] = (old[username], key)
+        return changed
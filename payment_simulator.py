@@ -0,0 +1,132 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SIMULATOR_HOST = "127.0.0.1"
+SIMULATOR_PORT = 8766
+
+
+class SimulatorSettings:
+    # Latency is latency +/- jitter seconds per request. Of the requests that get an answer,
+    # error_rate return 503 (retryable) and decline_rate of the rest are declined.
+    def __init__(self, latency=0.2, jitter=0.1, decline_rate=0.1, error_rate=0.05, timeout_rate=0.0,
+                 provider_latency=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.decline_rate = decline_rate
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        # Per-provider latency overrides, e.g. {"Airtel Money": 2.0} to model one slow provider
+        self.provider_latency = provider_latency or {}
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/pay":
+            self.send_error(404)
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            provider = request['provider']
+            reference = request['reference']
+        except (ValueError, KeyError) as e:
+            self.reply(400, {'error': f"Bad request: {e}"})
+            return
+
+        settings = self.server.settings
+        latency = settings.provider_latency.get(provider, settings.latency)
+        time.sleep(max(latency + random.uniform(-settings.jitter, settings.jitter), 0))
+        if random.random() < settings.timeout_rate:
+            time.sleep(60)  # no answer in time; the client's timeout fires
+            return
+        if random.random() < settings.error_rate:
+            self.reply(503, {'error': f"{provider} temporarily unavailable"})
+            return
+
+        # A retried reference gets the answer it got the first time
+        with self.server.lock:
+            status = self.server.outcomes.get(reference)
+            if status is None:
+                status = 'declined' if random.random() < settings.decline_rate else 'approved'
+                self.server.outcomes[reference] = status
+            self.server.requests += 1
+        self.reply(200, {'reference': reference, 'status': status})
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except ConnectionError:
+            pass  # the client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PaymentSimulator:
+    # Local stand-in for the mobile-money providers, for measuring the payment pipeline offline
+    def __init__(self, settings=None, host=SIMULATOR_HOST, port=SIMULATOR_PORT):
+        self.httpd = ThreadingHTTPServer((host, port), SimulatorHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = settings or SimulatorSettings()
+        self.httpd.outcomes = {}
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/pay"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="payment-simulator", daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mobile-money provider simulator")
+    parser.add_argument("--host", default=SIMULATOR_HOST)
+    parser.add_argument("--port", type=int, default=SIMULATOR_PORT)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--decline-rate", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of requests answered with 503")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests never answered")
+    parser.add_argument("--slow", action="append", default=[], metavar="PROVIDER=SECONDS",
+                        help="latency override for one provider")
+    args = parser.parse_args()
+
+    provider_latency = {}
+    for item in args.slow:
+        provider, _, seconds = item.rpartition("=")
+        provider_latency[provider] = float(seconds)
+    settings = SimulatorSettings(args.latency, args.jitter, args.decline_rate, args.error_rate,
+                                 args.timeout_rate, provider_latency)
+    simulator = PaymentSimulator(settings, args.host, args.port)
+    print(f"Payment simulator listening on {simulator.url}")
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
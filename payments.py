@@ -0,0 +1,137 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import counter, histogram
+
+# None charges through the in-process simulator; point this at payment_simulator.py
+# (e.g. "http://127.0.0.1:8766/pay") or a real gateway to go over HTTP
+PAYMENT_GATEWAY_URL = None
+PAYMENT_WORKERS = 4
+# Seconds allowed per attempt, and for the whole payment including retries and backoff
+PAYMENT_TIMEOUT = 10.0
+PAYMENT_DEADLINE = 30.0
+# Attempts after the first on timeouts and provider errors; declines are final
+PAYMENT_RETRIES = 3
+PAYMENT_BACKOFF = 0.5
+PAYMENT_BACKOFF_MAX = 4.0
+
+PAYMENT_SECONDS = histogram("illuminado_payment_seconds", "Time from payment submission to outcome.", ["provider"])
+PAYMENTS = counter("illuminado_payments_total", "Payments by provider and outcome.", ["provider", "result"])
+PAYMENT_RETRIES_TOTAL = counter("illuminado_payment_retries_total", "Payment attempts retried.", ["provider"])
+
+
+class PaymentError(Exception):
+    # A provider call that did not produce an answer (timeout, connection failure, 5xx); safe to retry
+    pass
+
+
+class SimulatedGateway:
+    # Stands in for the providers in-process: approves approve_rate of payments after latency seconds
+    def __init__(self, approve_rate=0.75, latency=0.0):
+        self.approve_rate = approve_rate
+        self.latency = latency
+
+    def charge(self, provider, amount, reference, timeout):
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+            if self.latency > timeout:
+                raise PaymentError(f"{provider} did not answer within {timeout:g}s")
+        return random.random() < self.approve_rate
+
+
+class HttpGateway:
+    # POSTs {"provider", "amount", "reference"} as JSON; the reply's "status" is "approved" or "declined".
+    # The reference is the same on every retry, so the gateway can answer a repeat without charging twice.
+    def __init__(self, url):
+        self.url = url
+
+    def charge(self, provider, amount, reference, timeout):
+        body = json.dumps({'provider': provider, 'amount': amount, 'reference': reference}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                reply = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code >= 500:
+                raise PaymentError(f"{provider} error {e.code}")
+            return False
+        except (urllib.error.URLError, TimeoutError, ConnectionError, ValueError) as e:
+            raise PaymentError(f"{provider} unreachable: {e}")
+        return reply.get('status') == 'approved'
+
+
+def open_gateway(url=PAYMENT_GATEWAY_URL):
+    return HttpGateway(url) if url else SimulatedGateway()
+
+
+class PaymentPipeline:
+    # Charges run on a worker pool so a slow provider never blocks the caller. Each payment is
+    # retried with exponential backoff and jitter on timeouts and provider errors, within an
+    # overall deadline. on_done(result) is called from the worker thread with a dict:
+    # {'provider', 'amount', 'reference', 'status': approved|declined|failed, 'attempts', 'error', 'seconds'}
+    def __init__(self, gateway=None, workers=PAYMENT_WORKERS, timeout=PAYMENT_TIMEOUT,
+                 deadline=PAYMENT_DEADLINE, retries=PAYMENT_RETRIES, backoff=PAYMENT_BACKOFF):
+        self.gateway = gateway if gateway is not None else open_gateway()
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="payment")
+        self._closing = threading.Event()
+
+    def submit(self, provider, amount, on_done=None, reference=None):
+        reference = reference or uuid.uuid4().hex[:16].upper()
+        return self.executor.submit(self._run, provider, amount, reference, on_done)
+
+    def pay(self, provider, amount, reference=None):
+        # Blocking form for scripts and the booking server's worker threads
+        return self.submit(provider, amount, reference=reference).result()
+
+    def close(self, wait=True):
+        # Sleeping retries wake up and give up; charges already on the wire finish
+        self._closing.set()
+        self.executor.shutdown(wait=wait)
+
+    def _run(self, provider, amount, reference, on_done):
+        start = time.monotonic()
+        result = {'provider': provider, 'amount': amount, 'reference': reference,
+                  'status': 'failed', 'attempts': 0, 'error': None}
+        delay = self.backoff
+        while True:
+            remaining = self.deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                result['error'] = result['error'] or "Payment timed out"
+                break
+            result['attempts'] += 1
+            try:
+                approved = self.gateway.charge(provider, amount, reference, min(self.timeout, remaining))
+            except PaymentError as e:
+                result['error'] = str(e)
+            except Exception as e:
+                result['error'] = f"Payment error: {e}"
+                break
+            else:
+                result['status'] = 'approved' if approved else 'declined'
+                result['error'] = None
+                break
+            if result['attempts'] > self.retries:
+                break
+            PAYMENT_RETRIES_TOTAL.inc(provider)
+            # Full jitter keeps terminals that failed together from retrying together
+            pause = min(random.uniform(0, delay), self.deadline - (time.monotonic() - start))
+            if pause > 0 and self._closing.wait(pause):
+                break
+            delay = min(delay * 2, PAYMENT_BACKOFF_MAX)
+
+        result['seconds'] = time.monotonic() - start
+        PAYMENT_SECONDS.observe(result['seconds'], provider)
+        PAYMENTS.inc(provider, result['status'])
+        if on_done is not None:
+            on_done(result)
+        return result
@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user TEXT PRIMARY KEY,
+    loyalty_points INTEGER NOT NULL DEFAULT 0,
+    total_rides INTEGER NOT NULL DEFAULT 0,
+    preferred_language TEXT,
+    preferred_payment TEXT
+) WITHOUT ROWID;
+"""
+
+PROFILE_FIELDS = ['loyalty_points', 'total_rides', 'preferred_language', 'preferred_payment']
+COLUMNS = ", ".join(PROFILE_FIELDS)
+UPSERT = (f"INSERT INTO profiles (user, {COLUMNS}) VALUES (?, {', '.join('?' * len(PROFILE_FIELDS))}) "
+          "ON CONFLICT (user) DO UPDATE SET " + ", ".join(f"{field} = excluded.{field}" for field in PROFILE_FIELDS))
+
+
+def profile_row(user, profile):
+    return (user,) + tuple(profile.get(field) for field in PROFILE_FIELDS)
+
+
+class ProfileStore:
+    # One SQLite row per passenger, keyed by username. A login or a points change reads or
+    # writes only that row, and points and rides change by increments inside SQLite, so
+    # terminals sharing the database never overwrite each other's updates.
+    def __init__(self, path, legacy_profiles=None):
+        self.path = path
+        self.legacy_profiles = legacy_profiles
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def load(self):
+        with self._lock:
+            if self._conn is None:
+                # Other terminals may hold the write lock for a moment; wait rather than fail
+                self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.executescript(SCHEMA)
+            empty = self._conn.execute("SELECT 1 FROM profiles LIMIT 1").fetchone() is None
+        if empty and self.legacy_profiles and os.path.exists(self.legacy_profiles):
+            self.import_profiles(self.legacy_profiles)
+
+    def import_profiles(self, path):
+        # One-time migration of user_profiles.json, in a single transaction
+        with open(path, "r") as f:
+            profiles = json.load(f)
+        self.put_many(profiles)
+
+    def get(self, user):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {COLUMNS} FROM profiles WHERE user = ?", (user,)).fetchone()
+        return dict(zip(PROFILE_FIELDS, row)) if row is not None else None
+
+    def login(self, user, profile):
+        # Creates the user with profile unless they exist; returns the stored profile
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR IGNORE INTO profiles (user, {COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                               profile_row(user, profile))
+            row = self._conn.execute(f"SELECT {COLUMNS} FROM profiles WHERE user = ?", (user,)).fetchone()
+        return dict(zip(PROFILE_FIELDS, row))
+
+    def credit(self, user, points, rides):
+        # Adds (or with negative values, takes back) points and rides, never below zero.
+        # Returns the updated profile, or None for an unknown user.
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "UPDATE profiles SET loyalty_points = MAX(loyalty_points + ?, 0), "
+                f"total_rides = MAX(total_rides + ?, 0) WHERE user = ? RETURNING {COLUMNS}",
+                (points, rides, user)).fetchone()
+        return dict(zip(PROFILE_FIELDS, row)) if row is not None else None
+
+    def put(self, user, profile):
+        with self._lock, self._conn:
+            self._conn.execute(UPSERT, profile_row(user, profile))
+
+    def put_many(self, profiles):
+        with self._lock, self._conn:
+            self._conn.executemany(UPSERT, [profile_row(user, profile) for user, profile in profiles.items()])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def items(self, batch_size=1000):
+        # (user, profile) for every passenger, a batch at a time in username order
+        last_user = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(f"SELECT user, {COLUMNS} FROM profiles WHERE user > ? ORDER BY user LIMIT ?",
+                                          (last_user, batch_size)).fetchall()
+            if not rows:
+                return
+            last_user = rows[-1][0]
+            for row in rows:
+                yield row[0], dict(zip(PROFILE_FIELDS, row[1:]))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,190 @@
+import json
+import os
+from bisect import bisect_left
+
+from state_log import atomic_write_json
+from timetable import MINUTES_PER_DAY, SERVICE_PATTERNS, parse_time
+
+# Routes are read from this file when it exists; without it the built-in routes are used
+CATALOG_FILE = "routes.json"
+
+REQUIRED_FIELDS = ('name', 'start_time', 'price', 'type', 'destination')
+
+# Optional fields that must be a positive whole number when given
+COUNT_FIELDS = ('capacity', 'headway', 'trips')
+
+# Fields a route can be looked up by exactly
+INDEXED_FIELDS = ('destination', 'type')
+
+# Price filters offered to passengers: label -> (lowest price, price it stays under), RWF
+PRICE_BANDS = {
+    'Any price': (None, None),
+    'Under 1,000': (None, 1000),
+    'Under 2,000': (None, 2000),
+    'Under 3,000': (None, 3000),
+    '3,000 and over': (3000, None),
+}
+
+
+def check_route(option):
+    missing = [field for field in REQUIRED_FIELDS if field not in option]
+    if missing:
+        raise ValueError(f"route {option.get('name', '?')} is missing {', '.join(missing)}")
+    # Anything that would fail later in Timetable or RouteIndex is rejected here, so a bad
+    # catalog falls back to the built-in routes instead of stopping BookingEngine
+    if not valid_time(option['start_time']):
+        raise ValueError(f"route {option['name']} has an invalid start_time: {option['start_time']!r}")
+    if not isinstance(option['price'], int) or option['price'] < 0:
+        raise ValueError(f"route {option['name']} has an invalid price: {option['price']!r}")
+    patterns = option.get('pattern', 'daily')
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not isinstance(patterns, list) or not patterns or \
+            not all(isinstance(pattern, str) and pattern in SERVICE_PATTERNS for pattern in patterns):
+        raise ValueError(f"route {option['name']} has an unknown pattern: {option['pattern']!r}")
+    for field in COUNT_FIELDS:
+        value = option.get(field, 1)
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            raise ValueError(f"route {option['name']} has an invalid {field}: {value!r}")
+
+
+def valid_time(hhmm):
+    # "HH:MM" from 00:00 to 23:59
+    try:
+        hours, minutes = hhmm.split(":")
+        return 0 <= int(hours) < 24 and 0 <= int(minutes) < 60
+    except (AttributeError, ValueError):
+        return False
+
+
+def load_catalog(path=CATALOG_FILE, default=None):
+    # The routes in path, a JSON list of route objects (same fields as transport_options), or
+    # default when there is no such file. Raises ValueError for a malformed catalog.
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        routes = json.load(f)
+    if not isinstance(routes, list):
+        raise ValueError("the catalog must be a list of routes")
+    names = set()
+    for option in routes:
+        check_route(option)
+        if option['name'] in names:
+            raise ValueError(f"route {option['name']} is listed twice")
+        names.add(option['name'])
+    return routes
+
+
+def save_catalog(routes, path=CATALOG_FILE):
+    atomic_write_json(path, routes)
+
+
+def window_minutes(window):
+    # ("HH:MM", "HH:MM") -> (start, end) minutes of the day; a window past midnight ends after 1440
+    start, end = parse_time(window[0]), parse_time(window[1])
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+class RouteIndex:
+    # Every route is one bit, numbered in price order: a destination or type is a bitmask of its
+    # routes, a price range is the run of bits between two bisects, and departures are an OR
+    # segment tree of masks over the timetable's minutes, so a departure window is O(log n)
+    # mask ORs. A compound search ANDs the masks and only then looks at the routes that match.
+    def __init__(self, routes, timetable=None):
+        self.names = [option['name'] for option in routes]
+        self.by_price = sorted(range(len(routes)), key=lambda position: routes[position]['price'])
+        self.prices = [routes[position]['price'] for position in self.by_price]
+        self.bit = {routes[position]['name']: i for i, position in enumerate(self.by_price)}
+        self.all = (1 << len(routes)) - 1
+        self.masks = {field: {} for field in INDEXED_FIELDS}
+        for i, position in enumerate(self.by_price):
+            for field in INDEXED_FIELDS:
+                value = routes[position].get(field, 'Unknown')
+                self.masks[field][value] = self.masks[field].get(value, 0) | 1 << i
+        # Values in catalog order, for filter choices
+        self.values = {field: list(dict.fromkeys(option.get(field, 'Unknown') for option in routes)) for field in INDEXED_FIELDS}
+        self.first_minute = None
+        self.tree = []
+        if timetable is not None:
+            self.index_departures(timetable)
+
+    def index_departures(self, timetable):
+        # Call again whenever the timetable is rebuilt; the new tree replaces the old one whole
+        first_minute = timetable.first_day * MINUTES_PER_DAY
+        # A late start's trips run past midnight of the last day; the tree covers those too
+        last = max((departures[-1] for departures in timetable.departures.values() if departures), default=first_minute)
+        size = max(timetable.days * MINUTES_PER_DAY, last - first_minute + 1)
+        tree = [0] * (2 * size)
+        for name, departures in timetable.departures.items():
+            i = self.bit.get(name)
+            if i is None:
+                continue
+            bit = 1 << i
+            for minute in departures:
+                tree[size + minute - first_minute] |= bit
+        for node in range(size - 1, 0, -1):
+            tree[node] = tree[2 * node] | tree[2 * node + 1]
+        self.tree, self.first_minute = tree, first_minute
+
+    def window_range(self, window, now):
+        # Absolute minutes [low, high) of the next time window ("HH:MM", "HH:MM") comes round
+        # that has not completely passed at minute now
+        start, end = window_minutes(window)
+        day = now // MINUTES_PER_DAY * MINUTES_PER_DAY
+        if day + end <= now:
+            day += MINUTES_PER_DAY
+        return max(day + start, now), day + end
+
+    def departing(self, low, high):
+        # Mask of routes with a departure in [low, high) absolute minutes
+        tree, first_minute = self.tree, self.first_minute
+        if first_minute is None:
+            return 0
+        size = len(tree) // 2
+        low = max(low - first_minute, 0) + size
+        high = min(high - first_minute, size) + size
+        mask = 0
+        while low < high:
+            if low & 1:
+                mask |= tree[low]
+                low += 1
+            if high & 1:
+                high -= 1
+                mask |= tree[high]
+            low //= 2
+            high //= 2
+        return mask
+
+    def price_mask(self, min_price=None, max_price=None):
+        # Routes priced in [min_price, max_price)
+        low = bisect_left(self.prices, min_price) if min_price is not None else 0
+        high = bisect_left(self.prices, max_price) if max_price is not None else len(self.prices)
+        return ((1 << high) - 1) ^ ((1 << low) - 1) if high > low else 0
+
+    def search(self, destination=None, route_type=None, min_price=None, max_price=None, window=None, now=None):
+        # Names of matching routes in catalog order. A window needs now (absolute minute) and
+        # matches routes with a departure in that window's next occurrence.
+        mask = self.all
+        if destination is not None:
+            mask &= self.masks['destination'].get(destination, 0)
+        if route_type is not None:
+            mask &= self.masks['type'].get(route_type, 0)
+        if mask and (min_price is not None or max_price is not None):
+            mask &= self.price_mask(min_price, max_price)
+        if mask and window is not None:
+            mask &= self.departing(*self.window_range(window, now))
+        return self.members(mask)
+
+    def members(self, mask):
+        if mask == self.all:
+            return list(self.names)
+        bits = bin(mask)[:1:-1]  # lowest bit first
+        positions = []
+        i = bits.find('1')
+        while i >= 0:
+            positions.append(self.by_price[i])
+            i = bits.find('1', i + 1)
+        positions.sort()
+        return [self.names[position] for position in positions]
@@ -0,0 +1,67 @@
+import heapq
+import threading
+import time
+
+# Seconds a seat stays off sale for a purchase in progress before it goes back on sale
+HOLD_TTL = 300.0
+
+
+class ExpiryHeap:
+    # Calls expire(key) from a background thread once the key's deadline passes. Scheduling is
+    # one heap push; cancelling only forgets the deadline, and the stale heap entry is skipped
+    # when it reaches the top, so thousands of short-lived holds cost O(log n) each.
+    def __init__(self, expire):
+        self.expire = expire
+        self._heap = []
+        self._deadlines = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def schedule(self, key, seconds):
+        deadline = time.monotonic() + seconds
+        with self._cond:
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, key))
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="hold-expiry", daemon=True)
+                self._thread.start()
+            elif self._heap[0][1] == key:
+                self._cond.notify()  # new earliest deadline; the thread is sleeping for a later one
+
+    def cancel(self, key):
+        with self._cond:
+            return self._deadlines.pop(key, None) is not None
+
+    def pending(self):
+        return len(self._deadlines)
+
+    def close(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            expired = []
+            with self._cond:
+                while not self._stopping:
+                    now = time.monotonic()
+                    while self._heap and self._heap[0][0] <= now:
+                        deadline, key = heapq.heappop(self._heap)
+                        if self._deadlines.get(key) == deadline:
+                            del self._deadlines[key]
+                            expired.append(key)
+                    if expired:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._stopping:
+                    return
+            for key in expired:
+                try:
+                    self.expire(key)
+                except Exception as e:
+                    print(f"Error expiring hold: {e}")
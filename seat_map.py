@@ -0,0 +1,66 @@
+SEATS_PER_ROW = 4
+
+_masks = {}
+
+
+def seat_masks(capacity, seats_per_row=SEATS_PER_ROW):
+    # (all seats, window seats) as bitmasks; bit n is seat n + 1. Cached per bus layout.
+    key = (capacity, seats_per_row)
+    if key not in _masks:
+        full = (1 << capacity) - 1
+        window = 0
+        for seat in range(capacity):
+            if seat % seats_per_row in (0, seats_per_row - 1):
+                window |= 1 << seat
+        _masks[key] = (full, window)
+    return _masks[key]
+
+
+class SeatMap:
+    # Occupancy of one departure as an int bitset, with the free count kept alongside,
+    # so availability checks and first-free lookups never walk the seats.
+    __slots__ = ('capacity', 'seats_per_row', 'taken', 'free')
+
+    def __init__(self, capacity, seats_per_row=SEATS_PER_ROW, taken=0):
+        self.capacity = capacity
+        self.seats_per_row = seats_per_row
+        self.load(taken)
+
+    def load(self, taken):
+        self.taken = taken & seat_masks(self.capacity, self.seats_per_row)[0]
+        self.free = self.capacity - bin(self.taken).count("1")
+
+    def is_taken(self, seat):
+        return bool(self.taken >> (seat - 1) & 1)
+
+    def is_window(self, seat):
+        return bool(seat_masks(self.capacity, self.seats_per_row)[1] >> (seat - 1) & 1)
+
+    def take(self, seat=None):
+        # Take the given seat, or the lowest free one; returns the seat number or None if unavailable
+        if seat is None:
+            seat = self.first_free()
+            if seat is None:
+                return None
+        elif not 1 <= seat <= self.capacity or self.is_taken(seat):
+            return None
+        self.taken |= 1 << (seat - 1)
+        self.free -= 1
+        return seat
+
+    def release(self, seat):
+        if 1 <= seat <= self.capacity and self.is_taken(seat):
+            self.taken &= ~(1 << (seat - 1))
+            self.free += 1
+            return True
+        return False
+
+    def first_free(self, mask=None):
+        full = seat_masks(self.capacity, self.seats_per_row)[0]
+        available = ~self.taken & (full if mask is None else mask)
+        if not available:
+            return None
+        return (available & -available).bit_length()
+
+    def first_free_window(self):
+        return self.first_free(seat_masks(self.capacity, self.seats_per_row)[1])
@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from bisect import bisect
+
+from analytics import ROLLUP_FILE, Analytics, merge_groups
+from booking_engine import (BOARD_FILE, HISTORY_BIN, HISTORY_DB, HISTORY_FILE, STATE_FILE, STATE_LOG_FILE,
+                            USER_PROFILES_FILE, BookingEngine, open_catalog, open_history, open_profiles)
+from booking_server import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, BookingServer
+from metrics import METRICS_PORT, MetricsServer, counter, histogram
+
+# Shard processes (one per core by default), the port of the first one, and where each keeps its files
+SHARD_COUNT = os.cpu_count() or 2
+SHARD_BASE_PORT = 8800
+SHARD_DIR = "shards"
+# Routes each shard owned when the pool last ran, so a changed shard count can move seat state
+LAYOUT_FILE = "layout.json"
+# Points per shard on the hash ring; more points spread routes more evenly
+RING_REPLICAS = 128
+SHARD_START_TIMEOUT = 30.0
+
+ROUTER_SECONDS = histogram("illuminado_router_request_seconds", "Time for the router to answer one request.", ["op"])
+ROUTED = counter("illuminado_router_requests_total", "Requests forwarded by the router, by shard.", ["shard"])
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    # Consistent hash of route names onto shards: each shard owns RING_REPLICAS points and a
+    # route belongs to the first point at or after its hash. Adding or removing a shard only
+    # moves the routes whose points change hands, about 1/N of them.
+    def __init__(self, shards, replicas=RING_REPLICAS):
+        points = sorted((ring_hash(f"{shard}#{i}"), shard) for shard in range(shards) for i in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        index = bisect(self.hashes, ring_hash(key))
+        return self.owners[index % len(self.owners)]
+
+    def partition(self, routes, shards):
+        # [routes of shard 0, routes of shard 1, ...], each in catalog order
+        parts = [[] for _ in range(shards)]
+        for option in routes:
+            parts[self.shard_for(option['name'])].append(option)
+        return parts
+
+
+def shard_directory(root, shard):
+    return os.path.join(root, f"shard-{shard:02d}")
+
+
+def shard_engine(routes, directory):
+    # Seats, state log, history and analytics are per shard. Profiles follow PROFILE_BACKEND:
+    # the SQLite store is shared by every shard (it takes concurrent increments), the JSON
+    # file is per shard.
+    os.makedirs(directory, exist_ok=True)
+
+    def path(name):
+        return os.path.join(directory, name)
+
+    return BookingEngine(routes=routes, state_file=path(STATE_FILE), profiles_file=path(USER_PROFILES_FILE),
+                         state_log_file=path(STATE_LOG_FILE), board_file=path(BOARD_FILE),
+                         history=open_history(history_file=path(HISTORY_FILE), history_db=path(HISTORY_DB),
+                                              history_bin=path(HISTORY_BIN)),
+                         profile_store=open_profiles())
+
+
+def run_shard(routes, directory, port, workers):
+    # Process entry point: one BookingServer over this shard's routes; SIGTERM shuts it down cleanly
+    engine = shard_engine(routes, directory)
+    engine.load()
+    server = BookingServer(engine, SERVER_HOST, port, workers,
+                           analytics=Analytics(engine.history, os.path.join(directory, ROLLUP_FILE)))
+
+    async def serve():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        engine.close()
+
+
+def rebalance(routes, shards, root):
+    # When the shard count changed since the last run, seat state of every route that moved is
+    # copied from its old shard's files into its new shard's. Booking history stays with the
+    # shard that sold it; the router cancels a ticket there and frees its seat on the new shard.
+    layout_path = os.path.join(root, LAYOUT_FILE)
+    ring = HashRing(shards)
+    layout = {option['name']: ring.shard_for(option['name']) for option in routes}
+    try:
+        with open(layout_path, "r") as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = {}
+    except Exception as e:
+        print(f"Error loading shard layout: {e}")
+        previous = {}
+    moved = {name: shard for name, shard in previous.items() if name in layout and layout[name] != shard}
+    if moved:
+        by_name = {option['name']: option for option in routes}
+        saved = {}
+        for old in sorted(set(moved.values())):
+            names = [name for name, shard in moved.items() if shard == old]
+            # Opened with everything it owned before, so its snapshot on close keeps all of it
+            owned = [by_name[name] for name, shard in previous.items() if shard == old and name in by_name]
+            engine = shard_engine(owned, shard_directory(root, old))
+            engine.load()
+            for name in names:
+                saved[name] = engine.route_state(engine.transport_data[name])
+            engine.close()
+        for new in sorted({layout[name] for name in moved}):
+            names = [name for name in moved if layout[name] == new]
+            engine = shard_engine([option for option in routes if layout[option['name']] == new], shard_directory(root, new))
+            engine.load()
+            for name in names:
+                with engine.route_lock(name):
+                    engine.restore_route(name, engine.transport_data[name], saved[name])
+            engine.save()
+            engine.close()
+        print(f"Moved {len(moved)} routes to their new shards")
+    os.makedirs(root, exist_ok=True)
+    with open(layout_path, "w") as f:
+        json.dump(layout, f)
+    return ring
+
+
+class ShardPool:
+    # Starts one shard process per partition of the routes and waits until each is listening
+    def __init__(self, routes=None, shards=SHARD_COUNT, root=SHARD_DIR, base_port=SHARD_BASE_PORT,
+                 workers=SERVER_WORKERS):
+        self.routes = routes if routes is not None else open_catalog()
+        self.shards = shards
+        self.root = root
+        self.ports = [base_port + shard for shard in range(shards)]
+        self.workers = workers
+        self.ring = None
+        self.processes = []
+
+    def start(self):
+        self.ring = rebalance(self.routes, self.shards, self.root)
+        context = multiprocessing.get_context("spawn")
+        for shard, routes in enumerate(self.ring.partition(self.routes, self.shards)):
+            process = context.Process(target=run_shard, name=f"shard-{shard}",
+                                      args=(routes, shard_directory(self.root, shard), self.ports[shard], self.workers))
+            process.start()
+            self.processes.append(process)
+        deadline = time.monotonic() + SHARD_START_TIMEOUT
+        for shard, port in enumerate(self.ports):
+            while True:
+                try:
+                    socket.create_connection((SERVER_HOST, port), timeout=1.0).close()
+                    break
+                except OSError:
+                    if not self.processes[shard].is_alive() or time.monotonic() > deadline:
+                        self.stop()
+                        raise RuntimeError(f"Shard {shard} did not start")
+                    time.sleep(0.05)
+        return self
+
+    def stop(self):
+        # SIGTERM lets each shard finish in-flight requests and snapshot its state
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+
+class ShardRouter:
+    # Front end speaking the BookingServer protocol. Requests naming a route (quote, hold,
+    # hold_group, book, book_group, release_seat) are forwarded line-for-line to the shard that
+    # owns it; the rest are sent to every shard and the answers merged. Each terminal connection
+    # gets its own connection to each shard, so its requests stay in order and different
+    # terminals proceed in parallel.
+    ROUTED_OPS = ('quote', 'hold', 'hold_group', 'book', 'book_group', 'release_seat')
+
+    def __init__(self, pool, host=SERVER_HOST, port=SERVER_PORT):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.order = {option['name']: i for i, option in enumerate(pool.routes)}
+        self.merges = {
+            'departures': self.merge_departures,
+            'login': self.merge_first,
+            'release_hold': self.merge_any,
+            'history': self.merge_history,
+            'revenue': self.merge_revenue,
+        }
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        return self._server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        upstreams = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.dispatch(line, upstreams)
+                writer.write(response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for _, upstream in upstreams.values():
+                upstream.close()
+            writer.close()
+
+    async def dispatch(self, line, upstreams):
+        start = time.perf_counter()
+        op = "invalid"
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+            op = request.get('op')
+            if op in self.ROUTED_OPS:
+                if not isinstance(request['route'], str):
+                    raise ValueError(f"route must be a route name, not {request['route']!r}")
+                response = await self.forward(self.pool.ring.shard_for(request['route']), line, upstreams)
+            elif op == 'cancel':
+                response = await self.cancel(line, upstreams)
+            elif op in self.merges:
+                answers = await asyncio.gather(*(self.forward(shard, line, upstreams)
+                                                 for shard in range(self.pool.shards)))
+                response = json.dumps(self.merges[op](request, [json.loads(answer) for answer in answers]))
+                response = response.encode("utf-8") + b"\n"
+            else:
+                op = "invalid"
+                response = json.dumps({'ok': False, 'error': f"Unknown operation: {request.get('op')}"}).encode("utf-8") + b"\n"
+        except (ValueError, KeyError, TypeError) as e:
+            response = json.dumps({'ok': False, 'error': f"Bad request: {e}"}).encode("utf-8") + b"\n"
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            response = json.dumps({'ok': False, 'error': f"Shard unavailable: {e}"}).encode("utf-8") + b"\n"
+        except Exception as e:
+            # As in BookingServer.dispatch: every request gets an answer and the connection stays open
+            print(f"Error routing {op if isinstance(op, str) else 'request'}: {e}")
+            response = json.dumps({'ok': False, 'error': f"Router error: {e}"}).encode("utf-8") + b"\n"
+        if not isinstance(op, str):
+            op = "invalid"
+        ROUTER_SECONDS.observe(time.perf_counter() - start, op)
+        return response
+
+    async def forward(self, shard, line, upstreams):
+        upstream = upstreams.get(shard)
+        if upstream is None:
+            upstream = upstreams[shard] = await asyncio.open_connection(SERVER_HOST, self.pool.ports[shard])
+        reader, writer = upstream
+        writer.write(line if line.endswith(b"\n") else line + b"\n")
+        await writer.drain()
+        response = await reader.readline()
+        if not response:
+            del upstreams[shard]
+            raise ConnectionError(f"shard {shard} closed the connection")
+        ROUTED.inc(shard)
+        return response
+
+    async def cancel(self, line, upstreams):
+        # Only the shard that sold a ticket has its history, so that shard cancels it. If the route
+        # has moved to another shard since (see rebalance), the seat is put back on sale there.
+        answers = await asyncio.gather(*(self.forward(shard, line, upstreams) for shard in range(self.pool.shards)))
+        for shard, answer in enumerate(answers):
+            cancelled = json.loads(answer)
+            if not cancelled['ok']:
+                continue
+            entry = cancelled['result']
+            owner = self.pool.ring.shard_for(entry['name'])
+            if owner != shard:
+                release = {'op': 'release_seat', 'route': entry['name'], 'departure': entry['departure'],
+                           'seat': entry['seat']}
+                released = json.loads(await self.forward(owner, json.dumps(release).encode("utf-8"), upstreams))
+                if not released['ok']:
+                    print(f"Error releasing seat of cancelled ticket {entry['ticket_id']}: {released['error']}")
+            return answer
+        return answers[0]
+
+    # --- Merging fanned-out answers --------------------------------------
+
+    def merge_departures(self, request, answers):
+        failed = [answer for answer in answers if not answer['ok']]
+        if failed:
+            return failed[0]
+        rows = [row for answer in answers for row in answer['result']]
+        rows.sort(key=lambda row: self.order.get(row['name'], len(self.order)))
+        return {'ok': True, 'result': rows}
+
+    def merge_first(self, request, answers):
+        # Login creates the profile everywhere; any shard's answer will do
+        for answer in answers:
+            if answer['ok']:
+                return answer
+        return answers[0]
+
+    def merge_any(self, request, answers):
+        # Only the shard holding it can release a hold
+        return {'ok': True, 'result': any(answer['ok'] and answer['result'] for answer in answers)}
+
+    def merge_history(self, request, answers):
+        rows = [row for answer in answers if answer['ok'] for row in answer['result']]
+        rows.sort(key=lambda row: row['date'], reverse=True)
+        return {'ok': True, 'result': rows[:request.get('limit', 20)]}
+
+    def merge_revenue(self, request, answers):
+        failed = [answer for answer in answers if not answer['ok']]
+        if failed:
+            return failed[0]
+        totals = {}
+        for answer in answers:
+            merge_groups(totals, answer['result'])
+        return {'ok': True, 'result': totals}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Illuminado booking server with route inventory sharded across processes")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT)
+    parser.add_argument("--shard-port", type=int, default=SHARD_BASE_PORT, help="port of shard 0; shard n listens on this + n")
+    parser.add_argument("--shard-dir", default=SHARD_DIR)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="booking threads per shard")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve the router's Prometheus metrics on 127.0.0.1 at this port; 0 disables")
+    args = parser.parse_args()
+
+    pool = ShardPool(shards=args.shards, root=args.shard_dir, base_port=args.shard_port, workers=args.workers).start()
+    router = ShardRouter(pool, args.host, args.port)
+    metrics_server = MetricsServer(port=args.metrics_port).start() if args.metrics_port else None
+    print(f"Routing {len(pool.routes)} routes over {args.shards} shards on {args.host}:{args.port}")
+    try:
+        asyncio.run(router.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Engines write their state, history and profile files to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,62 @@
+import pytest
+
+from analytics import DIMENSIONS, Analytics, BookingColumns
+from booking_engine import BookingEngine, open_history
+
+ROUTES = ["Express A - Kayonza", "Express B - Rwamagana"]
+
+
+@pytest.fixture(params=["journal", "sqlite", "binary"])
+def engine(workdir, request):
+    engine = BookingEngine(history=open_history(request.param))
+    engine.load()
+    yield engine
+    engine.close()
+
+
+def sell(engine, count, start=0):
+    return [engine.book(ROUTES[i % 2], f"user{i % 3}", 'MTN Mobile Money' if i % 2 else 'Airtel Money',
+                        luggage='large' if i % 4 == 0 else 'small')['ticket_id']
+            for i in range(start, start + count)]
+
+
+def totals(analytics):
+    return {dimension: analytics.totals(dimension) for dimension in DIMENSIONS}
+
+
+def test_incremental_refresh_matches_a_fresh_recompute(engine):
+    tickets = sell(engine, 6)
+    engine.history.sync()
+    analytics = Analytics(engine.history, "rollups.json")
+    analytics.refresh()
+    assert analytics.totals('route')[ROUTES[0]][0] == 3
+
+    engine.cancel(tickets[0])
+    engine.cancel(tickets[3])
+    sell(engine, 4, start=6)
+    engine.history.sync()
+    analytics.refresh()
+
+    fresh = Analytics(engine.history, "fresh.json")
+    fresh.refresh()
+    assert totals(analytics) == totals(fresh)
+    # 10 sold, 2 cancelled
+    assert sum(tickets for tickets, _, _, _ in analytics.totals('route').values()) == 8
+
+    # Rollups and mark survive a restart, and a refresh with nothing new changes nothing
+    reloaded = Analytics(engine.history, "rollups.json")
+    reloaded.refresh()
+    assert totals(reloaded) == totals(fresh)
+
+
+def test_columns_aggregate_booked_tickets_only(engine):
+    tickets = sell(engine, 4)
+    engine.cancel(tickets[1])
+    engine.history.sync()
+    columns = BookingColumns.load(engine.history)
+    by_route = columns.aggregate('route')
+    entries = [engine.history.get(ticket_id) for ticket_id in tickets]
+    for route in ROUTES:
+        booked = [entry for entry in entries if entry['name'] == route and entry['status'] == 'booked']
+        assert by_route[route][:3] == [len(booked), sum(entry['total_price'] for entry in booked),
+                                       sum(entry['luggage_price'] for entry in booked)]
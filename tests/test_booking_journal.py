@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+from booking_journal import BookingJournal
+
+
+def booking(i, status='booked'):
+    return {'name': "Express A - Kayonza", 'destination': "East", 'departure': "2026-10-18 05:00",
+            'base_price': 1500, 'luggage_price': 0, 'total_price': 1500, 'payment_method': "MTN Mobile Money",
+            'date': f"2026-10-18 {i // 60:02d}:{i % 60:02d}", 'user': f"user{i % 5}", 'seat': str(i % 40 + 1),
+            'ticket_id': f"T{i:04d}", 'status': status}
+
+
+@pytest.fixture
+def journal(workdir):
+    journal = BookingJournal("history.txt", page_size=10)
+    journal.load()
+    yield journal
+    journal.close()
+
+
+def reopen(journal):
+    journal.close()
+    journal.load()
+    return journal
+
+
+def lines():
+    with open("history.txt", encoding="utf-8") as f:
+        return f.readlines()
+
+
+def test_startup_reads_only_the_newest_page(journal):
+    journal.append_many([booking(i) for i in range(25)])
+    reopen(journal)
+    assert journal.count() == 10
+    assert not journal.fully_loaded
+    assert [entry['ticket_id'] for entry in journal.recent(3)] == ["T0024", "T0023", "T0022"]
+    assert journal.count() == 10
+    # An old ticket pages in just as much as it needs
+    assert journal.get("T0012")['ticket_id'] == "T0012"
+    assert journal.count() == 20
+    journal.load_all()
+    assert journal.fully_loaded
+    assert journal.count() == 25
+
+
+def test_search_pages_through_older_history(journal):
+    journal.append_many([booking(i) for i in range(25)])
+    reopen(journal)
+    found = []
+    cursor = None
+    while True:
+        page, cursor = journal.search({'user': "user0"}, before=cursor, limit=2)
+        found.extend(entry['ticket_id'] for entry in page)
+        # Sales while paging land in the newest page and don't move the cursor
+        journal.append(booking(100 + len(found)))
+        if cursor is None:
+            break
+    assert found == [f"T{i:04d}" for i in range(20, -1, -5)]
+
+
+@pytest.mark.parametrize("fully_loaded", [False, True])
+def test_cancellation_in_a_newer_page_keeps_the_booking_in_place(journal, fully_loaded):
+    journal.append_many([booking(i) for i in range(15)])
+    journal.append(booking(2, status='cancelled'))
+    reopen(journal)
+    assert journal.get("T0002")['status'] == 'cancelled'
+    if fully_loaded:
+        journal.load_all()
+    assert [(entry['ticket_id'], entry['status']) for entry in journal.iter_all()] == [
+        (f"T{i:04d}", 'cancelled' if i == 2 else 'booked') for i in range(15)]
+    assert journal.count() == 15
+    assert [entry['ticket_id'] for entry in journal.search({'status': 'cancelled'})[0]] == ["T0002"]
+
+
+def test_sales_append_one_line_each(journal):
+    journal.append(booking(0))
+    journal.append_many([booking(1), booking(2)])
+    assert len(lines()) == 3
+    reopen(journal)
+    assert [entry['ticket_id'] for entry in journal.iter_all()] == ["T0000", "T0001", "T0002"]
+    assert journal.get("T0001")['total_price'] == 1500
+
+
+def test_partial_last_line_is_dropped(journal):
+    journal.append_many([booking(0), booking(1)])
+    journal.close()
+    with open("history.txt", "a", encoding="utf-8") as f:
+        f.write("Express A - Kayonza|East|2026-10")
+    reopen(journal)
+    assert journal.count() == 2
+    journal.append(booking(2))
+    assert [line.split("|")[10] for line in lines()] == ["T0000", "T0001", "T0002"]
+
+
+def test_compaction_drops_superseded_lines(journal):
+    journal.append_many([booking(i) for i in range(8)])
+    journal.append_many([booking(i, status='cancelled') for i in range(4)])
+    assert len(lines()) == 12
+    # On a full load, 4 dead lines for 8 live entries is over COMPACT_RATIO
+    reopen(journal)
+    journal.load_all()
+    assert len(lines()) == 8
+    assert journal.dead_lines == 0
+    reopen(journal)
+    assert [(entry['ticket_id'], entry['status']) for entry in journal.iter_all()] == [
+        (f"T{i:04d}", 'cancelled' if i < 4 else 'booked') for i in range(8)]
+    assert not os.path.exists("history.txt.tmp")
+
+
+def test_cancellations_are_folded_into_one_record_on_reload(journal):
+    journal.append_many([booking(i) for i in range(4)])
+    journal.append(booking(1, status='cancelled'))
+    journal.append(booking(1, status='booked'))
+    journal.append(booking(3, status='cancelled'))
+    reopen(journal)
+    assert journal.count() == 4
+    # Three superseded lines for four tickets: the reload compacted the file too
+    assert len(lines()) == 4
+    assert [(entry['ticket_id'], entry['status']) for entry in journal.iter_all()] == [
+        ("T0000", 'booked'), ("T0001", 'booked'), ("T0002", 'booked'), ("T0003", 'cancelled')]
+    assert [entry['ticket_id'] for entry in journal.for_user("user3")] == ["T0003"]
+
+
+def test_queries_hand_out_copies(journal):
+    journal.append(booking(0))
+    entry = journal.get("T0000")
+    assert isinstance(entry, dict)
+    entry['status'] = 'cancelled'
+    assert journal.get("T0000")['status'] == 'booked'
+    assert journal.recent(1)[0] == dict(booking(0), seat='1')
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+from booking_engine import BookingEngine, BookingError
+from booking_server import BookingClient, BookingServer
+
+ROUTE = {'name': 'Test Route', 'start_time': '05:00', 'price': 1000, 'type': 'normal',
+         'destination': 'East', 'capacity': 40}
+
+
+@pytest.fixture
+def server(workdir):
+    engine = BookingEngine(routes=[ROUTE])
+    engine.load()
+    server = BookingServer(engine, port=0)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait(10)
+    server.address = server._server.sockets[0].getsockname()[:2]
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    engine.close()
+
+
+def test_concurrent_clients_never_oversell(server):
+    departure = server.engine.route(ROUTE['name'])['next_departure']
+    sold = []
+    refused = []
+
+    def terminal(i):
+        client = BookingClient(*server.address)
+        try:
+            for _ in range(4):
+                try:
+                    ticket = client.call('book', route=ROUTE['name'], user=f"user{i}",
+                                         provider='MTN Mobile Money', departure=departure)
+                    sold.append(ticket['seat'])
+                except BookingError:
+                    refused.append(i)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=terminal, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert len(sold) == 40
+    assert len(set(sold)) == 40
+    assert len(refused) == 40
+    assert server.engine.route(ROUTE['name'])['seat_maps'][departure].free == 0
+
+
+def test_malformed_requests_get_an_answer(server):
+    with socket.create_connection(server.address, timeout=10) as sock:
+        stream = sock.makefile("rwb")
+        for line in (b"[]\n", b"not json\n", b'{"op": "quote"}\n', b'{"op": "nope"}\n'):
+            stream.write(line)
+            stream.flush()
+            assert json.loads(stream.readline())['ok'] is False
+        # The connection is still usable afterwards
+        stream.write(b'{"op": "departures"}\n')
+        stream.flush()
+        assert json.loads(stream.readline())['result'][0]['name'] == ROUTE['name']
+
+
+def test_storage_errors_get_an_answer(server, monkeypatch):
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(server.engine, 'user_history', broken)
+    client = BookingClient(*server.address)
+    try:
+        with pytest.raises(BookingError, match="disk full"):
+            client.call('history', user='someone')
+        assert client.call('departures')[0]['name'] == ROUTE['name']
+    finally:
+        client.close()
+
+
+def test_group_hold_over_the_network(server):
+    client = BookingClient(*server.address)
+    try:
+        hold = client.call('hold_group', route=ROUTE['name'], user='leader', passengers=3)
+        assert server.engine.route(ROUTE['name'])['seats'] == ROUTE['capacity'] - 3
+        entries = client.call('book_group', route=ROUTE['name'], user='leader', provider='MTN Mobile Money',
+                              passengers=3, holds=hold['hold_ids'])
+        assert sorted(entry['seat'] for entry in entries) == sorted(seat for _, seat in hold['seats'])
+        assert server.engine.route(ROUTE['name'])['seats'] == ROUTE['capacity'] - 3
+    finally:
+        client.close()
@@ -0,0 +1,56 @@
+import pytest
+
+from booking_engine import MAX_GROUP_SIZE, BookingEngine, BookingError
+
+ROUTE = {'name': 'Test Route', 'start_time': '05:00', 'price': 1000, 'type': 'normal',
+         'destination': 'East', 'capacity': 30}
+
+
+@pytest.fixture
+def engine(workdir):
+    engine = BookingEngine(routes=[ROUTE])
+    engine.load()
+    engine.login("leader")
+    yield engine
+    engine.close()
+
+
+def test_group_is_seated_all_or_none(engine):
+    name = ROUTE['name']
+    departure = engine.route(name)['next_departure']
+    engine.book_group(name, "leader", 'MTN Mobile Money', 25)
+    points = engine.profile("leader")['loyalty_points']
+    history = len(engine.user_history("leader", limit=100))
+
+    with pytest.raises(BookingError, match="Only 5 seats"):
+        engine.book_group(name, "leader", 'MTN Mobile Money', 10)
+    assert engine.route(name)['seat_maps'][departure].free == 5
+    assert engine.profile("leader")['loyalty_points'] == points
+    assert len(engine.user_history("leader", limit=100)) == history
+
+    # Spread over the following departures instead
+    entries = engine.book_group(name, "leader", 'MTN Mobile Money', 10, spread=True)
+    by_departure = {}
+    for entry in entries:
+        by_departure[entry['departure']] = by_departure.get(entry['departure'], 0) + 1
+    assert by_departure[departure] == 5
+    assert sum(by_departure.values()) == 10
+    assert engine.route(name)['seat_maps'][departure].free == 0
+    assert len({entry['ticket_id'] for entry in entries}) == 10
+
+
+@pytest.mark.parametrize("passengers, discount", [(1, 0), (9, 0), (10, 10), (20, 15), (40, 20)])
+def test_group_discount(engine, passengers, discount):
+    quote = engine.group_quote(ROUTE['name'], "leader", passengers)
+    price = quote['base_price'] + quote['luggage_price']
+    assert quote['discount'] == discount
+    assert quote['total_price'] == price - price * discount // 100
+    assert quote['group_total'] == quote['total_price'] * passengers
+
+
+def test_group_size_limits(engine):
+    for passengers in (0, MAX_GROUP_SIZE + 1):
+        with pytest.raises(BookingError):
+            engine.group_quote(ROUTE['name'], "leader", passengers)
+        with pytest.raises(BookingError):
+            engine.book_group(ROUTE['name'], "leader", 'MTN Mobile Money', passengers)
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from history_binary import MAGIC, RECORD, BinaryHistory
+
+
+def booking(i, status='booked'):
+    return {'name': "Express A - Kayonza", 'destination': "East", 'departure': "2026-10-18 05:00",
+            'base_price': 1500, 'luggage_price': 0, 'total_price': 1500, 'payment_method': "MTN Mobile Money",
+            'date': f"2026-10-18 04:{i:02d}", 'user': f"user{i}", 'seat': str(i + 1),
+            'ticket_id': f"T{i:03d}", 'status': status}
+
+
+@pytest.fixture
+def history(workdir):
+    history = BinaryHistory("history.bin")
+    history.load()
+    yield history
+    history.close()
+
+
+def records_on_disk():
+    return (os.path.getsize("history.bin") - len(MAGIC)) // RECORD.size
+
+
+def test_cancellation_rewrites_the_record_in_place(history):
+    history.append_many([booking(i) for i in range(3)])
+    history.append(booking(1, status='cancelled'))
+
+    assert history.get("T001")['status'] == 'cancelled'
+    assert history.count() == 3
+    # The original is rewritten and an update record is appended for the change feed
+    assert records_on_disk() == 4
+    assert [(entry['ticket_id'], entry['status']) for entry in history.iter_all()] == [
+        ("T000", 'booked'), ("T001", 'cancelled'), ("T002", 'booked')]
+    assert [entry['ticket_id'] for entry in history.search({'user': "user1"})[0]] == ["T001"]
+
+
+def test_scan_after_updates(history):
+    history.append_many([booking(i) for i in range(3)])
+    position = None
+    for position, _ in history.scan():
+        pass
+    assert position == 3
+
+    history.append(booking(0, status='cancelled'))
+    history.append(booking(3))
+    # Changes since the mark: the cancellation of an exported ticket, then the new sale
+    changes = [entry for _, batch in history.scan(position) for entry in batch]
+    assert [(entry['ticket_id'], entry['status']) for entry in changes] == [("T000", 'cancelled'), ("T003", 'booked')]
+
+    # From the start, each ticket comes once with its current values
+    everything = [entry for _, batch in history.scan() for entry in batch]
+    assert [(entry['ticket_id'], entry['status']) for entry in everything] == [
+        ("T000", 'cancelled'), ("T001", 'booked'), ("T002", 'booked'), ("T003", 'booked')]
+
+    with pytest.raises(ValueError):
+        list(history.scan(100))
+
+
+def test_updates_survive_a_reload(history):
+    history.append_many([booking(i) for i in range(3)])
+    history.append(booking(2, status='cancelled'))
+    history.close()
+
+    # A crash mid-append leaves part of a record behind; load() drops it
+    with open("history.bin", "ab") as f:
+        f.write(b"\1" * (RECORD.size // 2))
+    history.load()
+    history.load_all()
+    assert history.count() == 3
+    assert history.get("T002")['status'] == 'cancelled'
+    history.append(booking(2, status='booked'))
+    assert history.get("T002")['status'] == 'booked'
+    assert records_on_disk() == 5
@@ -0,0 +1,60 @@
+import csv
+import json
+
+import pytest
+
+from booking_engine import BookingEngine, open_history
+from history_export import CsvExporter
+
+ROUTE = "Express A - Kayonza"
+
+
+@pytest.fixture(params=["journal", "sqlite", "binary"])
+def engine(workdir, request):
+    engine = BookingEngine(history=open_history(request.param))
+    engine.load()
+    yield engine
+    engine.close()
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_full_and_incremental_exports(engine, workdir):
+    exporter = CsvExporter(engine.history, path="export.csv", state_file="export_state.json")
+    tickets = [engine.book(ROUTE, f"user{i}", 'MTN Mobile Money')['ticket_id'] for i in range(3)]
+    engine.history.sync()
+
+    assert exporter.export(incremental=False) == 3
+    assert [row['ticket_id'] for row in read_rows("export.csv")] == tickets
+    with open("export_state.json") as f:
+        assert json.load(f)['csv_size'] == (workdir / "export.csv").stat().st_size
+
+    # Nothing new since the mark
+    assert exporter.export(incremental=True) == 0
+
+    # An incremental export appends the change feed: the new sale and the cancellation
+    engine.cancel(tickets[0])
+    tickets.append(engine.book(ROUTE, "user3", 'MTN Mobile Money')['ticket_id'])
+    engine.history.sync()
+    assert exporter.export(incremental=True) == 2
+    rows = read_rows("export.csv")
+    assert len(rows) == 5
+    assert {(row['ticket_id'], row['status']) for row in rows[3:]} == {(tickets[0], 'cancelled'),
+                                                                       (tickets[3], 'booked')}
+
+    # A full export lists every ticket once, as it stands now
+    assert exporter.export(incremental=False) == 4
+    rows = read_rows("export.csv")
+    assert [row['ticket_id'] for row in rows] == tickets
+    assert [row['status'] for row in rows] == ['cancelled', 'booked', 'booked', 'booked']
+
+
+def test_incremental_export_without_a_file_starts_over(engine):
+    exporter = CsvExporter(engine.history, path="export.csv", state_file="export_state.json")
+    engine.book(ROUTE, "alice", 'MTN Mobile Money')
+    engine.history.sync()
+    assert exporter.export(incremental=True) == 1
+    assert len(read_rows("export.csv")) == 1
@@ -0,0 +1,49 @@
+import pytest
+
+from booking_engine import BookingEngine, open_history
+
+ROUTES = ["Express A - Kayonza", "Express B - Rwamagana"]
+
+
+@pytest.fixture(params=["journal", "sqlite", "binary"])
+def engine(workdir, request):
+    engine = BookingEngine(history=open_history(request.param))
+    engine.load()
+    yield engine
+    engine.close()
+
+
+def search_all(engine, filters, limit):
+    # Every page of a search, following the cursors
+    found = []
+    cursor = None
+    while True:
+        page, cursor = engine.search_history(filters, cursor, limit)
+        assert len(page) <= limit
+        found.extend(entry['ticket_id'] for entry in page)
+        if cursor is None:
+            return found
+
+
+def test_search_cursors_page_through_every_match(engine):
+    tickets = [engine.book(ROUTES[i % 2], f"user{i % 3}", 'MTN Mobile Money')['ticket_id'] for i in range(23)]
+    for ticket_id in tickets[::5]:
+        engine.cancel(ticket_id)
+    newest_first = tickets[::-1]
+
+    for limit in (1, 4, 100):
+        assert search_all(engine, {}, limit) == newest_first
+        assert search_all(engine, {'user': "user1"}, limit) == [t for i, t in enumerate(tickets) if i % 3 == 1][::-1]
+        assert search_all(engine, {'name': ROUTES[0], 'status': 'cancelled'}, limit) == \
+            [t for i, t in enumerate(tickets) if i % 2 == 0 and i % 5 == 0][::-1]
+    date = engine.find_ticket(tickets[0])['date']
+    assert search_all(engine, {'start': date[:10], 'end': date[:10] + "~"}, 7) == newest_first
+    assert search_all(engine, {'user': "nobody"}, 5) == []
+
+
+def test_find_ticket(engine):
+    ticket = engine.book(ROUTES[0], "alice", 'MTN Mobile Money')
+    assert str(engine.find_ticket(ticket['ticket_id'])['seat']) == str(ticket['seat'])
+    engine.cancel(ticket['ticket_id'])
+    assert engine.find_ticket(ticket['ticket_id'])['status'] == 'cancelled'
+    assert engine.find_ticket("NOSUCHTICKET") is None
@@ -0,0 +1,34 @@
+import pytest
+
+from booking_engine import LOYALTY_TIERS
+from loyalty import LoyaltyProgram, points_for
+
+
+@pytest.mark.parametrize("rides, key", [(0, 'bronze'), (9, 'bronze'), (10, 'silver'), (24, 'silver'),
+                                        (25, 'gold'), (49, 'gold'), (50, 'platinum'), (500, 'platinum')])
+def test_tier_thresholds(rides, key):
+    assert LoyaltyProgram(LOYALTY_TIERS).tier("alice", rides) is LOYALTY_TIERS[key]
+
+
+def test_cached_tier_follows_rides_across_thresholds():
+    loyalty = LoyaltyProgram(LOYALTY_TIERS)
+    tiers = [loyalty.tier("alice", rides)['name'] for rides in (9, 10, 24, 25, 24, 9)]
+    assert tiers == ["Bronze", "Silver", "Silver", "Gold", "Silver", "Bronze"]
+    # Another passenger's count never comes from alice's cache entry
+    assert loyalty.tier("bob", 60)['name'] == "Platinum"
+    assert loyalty.tier("alice", 9)['name'] == "Bronze"
+
+
+def test_recompute_after_a_tier_change():
+    loyalty = LoyaltyProgram(LOYALTY_TIERS)
+    profiles = {'alice': {'total_rides': 12, 'loyalty_points': 0}, 'bob': {'total_rides': 3, 'loyalty_points': 0}}
+    assert loyalty.tier("alice", 12)['name'] == "Silver"
+    tiers = dict(LOYALTY_TIERS, silver=dict(LOYALTY_TIERS['silver'], min_rides=15))
+    assert loyalty.recompute(profiles, tiers) == {'alice': ('silver', 'bronze')}
+    assert loyalty.tier("alice", 12)['name'] == "Bronze"
+
+    bookings = [{'user': 'bob', 'total_price': 2500, 'status': 'booked'}] * 16 + \
+               [{'user': 'bob', 'total_price': 2500, 'status': 'cancelled'}]
+    assert loyalty.recompute(profiles, bookings=bookings) == {'bob': ('bronze', 'silver')}
+    assert profiles['bob'] == {'total_rides': 16, 'loyalty_points': 16 * points_for(2500)}
+    assert profiles['alice'] == {'total_rides': 0, 'loyalty_points': 0}
@@ -0,0 +1,49 @@
+import urllib.request
+
+from booking_engine import BookingEngine
+from metrics import REGISTRY, Counter, Histogram, MetricsServer, Registry
+
+
+def test_rendered_exposition_format():
+    registry = Registry()
+    sales = registry.register(Counter("test_sales_total", "Sales.", ["route", "result"]))
+    latency = registry.register(Histogram("test_seconds", "Latency.", ["op"], buckets=(0.1, 1.0)))
+    sales.inc("Kigali", "ok")
+    sales.inc("Kigali", "ok", amount=2)
+    sales.inc('Say "hi"\n', "error")
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, "book")
+    assert registry.register(Counter("test_sales_total", "Again.")) is sales
+
+    assert registry.render().splitlines() == [
+        "# HELP test_sales_total Sales.",
+        "# TYPE test_sales_total counter",
+        'test_sales_total{route="Kigali",result="ok"} 3',
+        'test_sales_total{route="Say \\"hi\\"\\n",result="error"} 1',
+        "# HELP test_seconds Latency.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{op="book",le="0.1"} 1',
+        'test_seconds_bucket{op="book",le="1.0"} 3',
+        'test_seconds_bucket{op="book",le="+Inf"} 4',
+        'test_seconds_sum{op="book"} 4.05',
+        'test_seconds_count{op="book"} 4',
+    ]
+
+
+def test_engine_calls_show_up_in_the_served_metrics(workdir):
+    engine = BookingEngine()
+    engine.load()
+    before = REGISTRY.get("illuminado_bookings_total").value("booked")
+    engine.book("Express A - Kayonza", "alice", 'MTN Mobile Money')
+    engine.close()
+
+    server = MetricsServer(port=0).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=10) as response:
+            assert response.headers['Content-Type'].startswith("text/plain; version=0.0.4")
+            text = response.read().decode("utf-8")
+    finally:
+        server.stop()
+    assert f'illuminado_bookings_total{{result="booked"}} {before + 1}' in text.splitlines()
+    assert "# TYPE illuminado_booking_phase_seconds histogram" in text
+    assert 'illuminado_booking_phase_seconds_count{phase="seat"}' in text
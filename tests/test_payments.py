@@ -0,0 +1,103 @@
+import time
+
+from payment_simulator import PaymentSimulator, SimulatorSettings
+from payments import HttpGateway, PaymentError, PaymentPipeline
+
+
+class ScriptedGateway:
+    # Answers each charge with the next outcome: True/False, or an exception to raise
+    def __init__(self, *outcomes, latency=0.0):
+        self.outcomes = list(outcomes)
+        self.latency = latency
+        self.calls = []
+
+    def charge(self, provider, amount, reference, timeout):
+        self.calls.append((reference, timeout))
+        if self.latency:
+            time.sleep(self.latency)
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def pipeline(gateway, **kwargs):
+    kwargs.setdefault('backoff', 0.01)
+    return PaymentPipeline(gateway, workers=1, **kwargs)
+
+
+def test_provider_errors_are_retried_with_the_same_reference():
+    gateway = ScriptedGateway(PaymentError("busy"), PaymentError("busy"), True)
+    payments = pipeline(gateway)
+    result = payments.pay('MTN Mobile Money', 1000)
+    payments.close()
+    assert result['status'] == 'approved'
+    assert result['attempts'] == 3
+    assert result['error'] is None
+    assert len({reference for reference, _ in gateway.calls}) == 1
+
+
+def test_declines_are_final():
+    gateway = ScriptedGateway(False)
+    payments = pipeline(gateway)
+    result = payments.pay('MTN Mobile Money', 1000)
+    payments.close()
+    assert result['status'] == 'declined'
+    assert result['attempts'] == 1
+
+
+def test_retries_run_out():
+    gateway = ScriptedGateway(PaymentError("busy"))
+    payments = pipeline(gateway, retries=2)
+    result = payments.pay('MTN Mobile Money', 1000)
+    payments.close()
+    assert result['status'] == 'failed'
+    assert result['attempts'] == 3
+    assert result['error'] == "busy"
+
+
+def test_unexpected_errors_are_not_retried():
+    gateway = ScriptedGateway(RuntimeError("bad reply"))
+    payments = pipeline(gateway)
+    result = payments.pay('MTN Mobile Money', 1000)
+    payments.close()
+    assert result['status'] == 'failed'
+    assert result['attempts'] == 1
+
+
+def test_deadline_bounds_retries_and_backoff():
+    gateway = ScriptedGateway(PaymentError("timeout"), latency=0.05)
+    payments = pipeline(gateway, deadline=0.3, retries=100, backoff=0.1, timeout=1.0)
+    result = payments.pay('MTN Mobile Money', 1000)
+    payments.close()
+    assert result['status'] == 'failed'
+    assert result['seconds'] < 0.3 + 0.1
+    # No attempt is given more time than is left before the deadline
+    assert all(timeout <= 0.3 for _, timeout in gateway.calls)
+
+
+def test_close_wakes_a_payment_waiting_to_retry():
+    gateway = ScriptedGateway(PaymentError("busy"))
+    payments = pipeline(gateway, backoff=30.0, deadline=60.0)
+    future = payments.submit('MTN Mobile Money', 1000)
+    time.sleep(0.1)
+    payments.close(wait=False)
+    assert future.result(5)['status'] == 'failed'
+
+
+def test_http_gateway_against_the_simulator():
+    simulator = PaymentSimulator(SimulatorSettings(latency=0, jitter=0, decline_rate=0, error_rate=0),
+                                 port=0).start()
+    try:
+        payments = pipeline(HttpGateway(simulator.url))
+        assert payments.pay('MTN Mobile Money', 1000)['status'] == 'approved'
+        payments.close()
+
+        simulator.httpd.settings.error_rate = 1.0
+        payments = pipeline(HttpGateway(simulator.url), retries=2)
+        result = payments.pay('MTN Mobile Money', 1000)
+        payments.close()
+        assert result['status'] == 'failed'
+        assert result['attempts'] == 3
+    finally:
+        simulator.stop()
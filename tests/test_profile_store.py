@@ -0,0 +1,55 @@
+import json
+import threading
+
+from profile_store import ProfileStore
+
+
+def open_store(path="profiles.db", legacy_profiles=None):
+    store = ProfileStore(path, legacy_profiles)
+    store.load()
+    return store
+
+
+def test_concurrent_credits_from_several_terminals_all_count(workdir):
+    # Each terminal has its own connection to the shared database
+    stores = [open_store() for _ in range(4)]
+    stores[0].login("alice", {'loyalty_points': 0, 'total_rides': 0})
+
+    def terminal(store):
+        for _ in range(50):
+            store.credit("alice", 25, 1)
+
+    threads = [threading.Thread(target=terminal, args=(store,)) for store in stores for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    profile = stores[1].get("alice")
+    assert profile['total_rides'] == 400
+    assert profile['loyalty_points'] == 400 * 25
+    for store in stores:
+        store.close()
+
+
+def test_credit_never_goes_below_zero(workdir):
+    store = open_store()
+    store.login("alice", {'loyalty_points': 10, 'total_rides': 1})
+    assert store.credit("alice", -25, -2)['loyalty_points'] == 0
+    assert store.get("alice")['total_rides'] == 0
+    assert store.credit("nobody", 10, 1) is None
+    # Logging in again keeps the stored profile
+    assert store.login("alice", {'loyalty_points': 999, 'total_rides': 9})['loyalty_points'] == 0
+    store.close()
+
+
+def test_legacy_profiles_are_imported_once(workdir):
+    with open("user_profiles.json", "w") as f:
+        json.dump({'alice': {'loyalty_points': 40, 'total_rides': 3, 'preferred_language': 'rw'}}, f)
+    store = open_store(legacy_profiles="user_profiles.json")
+    assert store.get("alice")['preferred_language'] == 'rw'
+    store.credit("alice", 10, 1)
+    store.close()
+    store = open_store(legacy_profiles="user_profiles.json")
+    assert store.get("alice")['loyalty_points'] == 50
+    assert dict(store.items()) == {'alice': store.get("alice")}
+    store.close()
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from booking_engine import BookingEngine, open_catalog, transport_options
+
+ROUTE = {'name': 'Test Route', 'start_time': '05:00', 'price': 1000, 'type': 'normal', 'destination': 'East'}
+
+
+@pytest.mark.parametrize("broken", [
+    {'pattern': 'weekly'},
+    {'pattern': ['daily', 'fortnightly']},
+    {'pattern': []},
+    {'start_time': '25:99'},
+    {'start_time': '05:60'},
+    {'start_time': 500},
+    {'capacity': 0},
+    {'headway': -30},
+    {'trips': 2.5},
+    {'trips': True},
+])
+def test_broken_catalog_falls_back_to_built_in_routes(workdir, broken):
+    path = workdir / "routes.json"
+    path.write_text(json.dumps([dict(ROUTE, **broken)]))
+    routes = open_catalog(str(path))
+    assert routes is transport_options
+    engine = BookingEngine(routes=routes)
+    engine.close()
+
+
+def test_valid_catalog_is_used(workdir):
+    path = workdir / "routes.json"
+    path.write_text(json.dumps([dict(ROUTE, pattern=['weekday', 'weekend'], start_time='23:59', capacity=12)]))
+    routes = open_catalog(str(path))
+    assert [option['name'] for option in routes] == [ROUTE['name']]
+    engine = BookingEngine(routes=routes)
+    engine.close()
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from booking_engine import BookingEngine, BookingError
+
+ROUTE = {'name': 'Test Route', 'start_time': '05:00', 'price': 1000, 'type': 'normal',
+         'destination': 'East', 'capacity': 4}
+
+
+@pytest.fixture
+def engine(workdir):
+    engine = BookingEngine(routes=[ROUTE])
+    engine.load()
+    yield engine
+    engine.close()
+
+
+def test_group_hold_keeps_seats_until_paid(engine):
+    name = ROUTE['name']
+    hold = engine.hold_group(name, "leader", 3)
+    assert len(hold['hold_ids']) == 3
+    engine.book(name, "other", 'MTN Mobile Money')
+    with pytest.raises(BookingError):
+        engine.book(name, "other", 'MTN Mobile Money')
+    entries = engine.book_group(name, "leader", 'MTN Mobile Money', 3, holds=hold['hold_ids'])
+    assert sorted(entry['seat'] for entry in entries) == sorted(seat for _, seat in hold['seats'])
+    assert not engine.holds
+
+
+def test_group_hold_is_all_or_none(engine):
+    engine.book(ROUTE['name'], "other", 'MTN Mobile Money')
+    with pytest.raises(BookingError):
+        engine.hold_group(ROUTE['name'], "leader", 4)
+    assert not engine.holds
+    assert engine.route(ROUTE['name'])['seats'] == 3
+
+
+def test_lapsed_group_hold_is_not_sold_twice(engine):
+    name = ROUTE['name']
+    hold = engine.hold_group(name, "leader", 3, ttl=0.05)
+    time.sleep(0.5)
+    assert not engine.holds
+    engine.book(name, "other", 'MTN Mobile Money')
+    engine.book(name, "other", 'MTN Mobile Money')
+    with pytest.raises(BookingError):
+        engine.book_group(name, "leader", 'MTN Mobile Money', 3, holds=hold['hold_ids'])
+    assert engine.route(name)['seats'] == 2
+
+
+def test_failed_group_sale_puts_held_seats_back(engine):
+    name = ROUTE['name']
+    hold = engine.hold_group(name, "leader", 3)
+    engine.release_hold(hold['hold_ids'][0])
+    engine.book(name, "other", 'MTN Mobile Money')
+    engine.book(name, "other", 'MTN Mobile Money')
+    with pytest.raises(BookingError):
+        engine.book_group(name, "leader", 'MTN Mobile Money', 3, holds=hold['hold_ids'])
+    assert engine.route(name)['seats'] == 2
+
+
+def test_more_holds_than_passengers_is_refused(engine):
+    name = ROUTE['name']
+    hold = engine.hold_group(name, "leader", 4)
+    with pytest.raises(BookingError):
+        engine.book_group(name, "leader", 'MTN Mobile Money', 2, holds=hold['hold_ids'])
+    assert len(engine.holds) == 4
+    for hold_id in hold['hold_ids']:
+        engine.release_hold(hold_id)
+    assert engine.route(name)['seats'] == ROUTE['capacity']
+
+
+def test_hold_is_only_sold_to_its_owner(engine):
+    name = ROUTE['name']
+    hold = engine.hold(name, "alice", seat=2)
+    entry = engine.book(name, "mallory", 'MTN Mobile Money', hold=hold['hold_id'])
+    assert entry['seat'] != 2
+    assert hold['hold_id'] in engine.holds
+    assert engine.book(name, "alice", 'MTN Mobile Money', hold=hold['hold_id'])['seat'] == 2
@@ -0,0 +1,44 @@
+from seat_map import SeatMap
+
+
+def test_take_and_release():
+    seats = SeatMap(10)
+    assert seats.take() == 1
+    assert seats.take(5) == 5
+    assert seats.take(5) is None
+    assert seats.take(11) is None
+    assert seats.take(0) is None
+    assert seats.free == 8
+    assert seats.first_free() == 2
+    assert seats.release(1)
+    assert not seats.release(1)
+    assert not seats.release(11)
+    assert seats.free == 9
+    assert seats.first_free() == 1
+    assert seats.is_taken(5) and not seats.is_taken(1)
+
+
+def test_sold_out():
+    seats = SeatMap(3)
+    assert [seats.take() for _ in range(4)] == [1, 2, 3, None]
+    assert seats.free == 0
+    assert seats.first_free() is None
+    assert seats.first_free_window() is None
+
+
+def test_window_seats():
+    # Four to a row: the first and last seat of each row are at the window
+    seats = SeatMap(10)
+    assert [seat for seat in range(1, 11) if seats.is_window(seat)] == [1, 4, 5, 8, 9]
+    seats.take(1)
+    seats.take(4)
+    assert seats.first_free_window() == 5
+    assert SeatMap(9, seats_per_row=3).first_free_window() == 1
+
+
+def test_load_ignores_seats_past_capacity():
+    seats = SeatMap(4, taken=0b110101)
+    assert seats.taken == 0b0101
+    assert seats.free == 2
+    seats.load(0)
+    assert seats.free == 4
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+from booking_engine import transport_options
+from booking_server import BookingClient
+from sharding import HashRing, ShardPool, ShardRouter
+
+
+def free_ports(count):
+    # First of count consecutive ports nothing is listening on
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    base = probe.getsockname()[1]
+    probe.close()
+    for base in range(base, base + 1000):
+        sockets = []
+        try:
+            for port in range(base, base + count):
+                sock = socket.socket()
+                sockets.append(sock)
+                sock.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+        finally:
+            for sock in sockets:
+                sock.close()
+    raise RuntimeError("no free ports")
+
+
+@pytest.fixture
+def run_pool(workdir):
+    # run_pool(shards) starts the shards and a router over them; everything is stopped afterwards
+    running = []
+
+    def start(shards):
+        pool = ShardPool(transport_options, shards=shards, root=str(workdir / "shards"),
+                         base_port=free_ports(shards), workers=2).start()
+        router = ShardRouter(pool, port=0)
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(router.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        running.append((pool, server, loop, thread))
+        return BookingClient(*server.sockets[0].getsockname()[:2])
+
+    def stop():
+        pool, server, loop, thread = running.pop()
+
+        async def shutdown():
+            server.close()
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(10)
+        loop.close()
+        pool.stop()
+
+    start.stop = stop
+    yield start
+    while running:
+        stop()
+
+
+def seats_left(client):
+    return {route['name']: route['seats'] for route in client.call('departures')}
+
+
+def test_cancel_after_shard_count_changes(run_pool):
+    moved = [option['name'] for option in transport_options
+             if HashRing(2).shard_for(option['name']) != HashRing(3).shard_for(option['name'])]
+    assert moved
+
+    client = run_pool(2)
+    before = seats_left(client)
+    tickets = []
+    for option in transport_options:
+        quote = client.call('quote', route=option['name'])
+        tickets.append(client.call('book', route=option['name'], user="rider", provider='MTN Mobile Money',
+                                   departure=quote['departure'])['ticket_id'])
+    client.close()
+    run_pool.stop()
+
+    client = run_pool(3)
+    assert all(seats_left(client)[name] == before[name] - 1 for name in before)
+    for ticket_id in tickets:
+        assert client.call('cancel', ticket_id=ticket_id)['status'] == 'cancelled'
+    assert seats_left(client) == before
+    client.close()
+
+
+def test_router_answers_malformed_requests(run_pool):
+    client = run_pool(2)
+    for line in (b"[]", b'"x"', b"not json", b'{"op": "quote"}', b'{"op": "quote", "route": 5}',
+                 b'{"op": ["book"]}', b'{"op": "nope"}'):
+        client.file.write(line + b"\n")
+        client.file.flush()
+        assert json.loads(client.file.readline())['ok'] is False
+    # The connection is still usable afterwards
+    assert len(client.call('departures')) == len(transport_options)
+    client.close()
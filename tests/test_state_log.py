@@ -0,0 +1,64 @@
+import os
+
+from booking_engine import BookingEngine
+from state_log import StateLog
+
+ROUTE = "Express A - Kayonza"
+
+
+def test_replay_returns_records_in_order_and_stops_at_a_torn_tail(workdir):
+    log = StateLog("state.log")
+    for i in range(3):
+        log.append({'op': 'route', 'i': i})
+    log.close()
+    with open("state.log", "a") as f:
+        f.write('{"op": "rou')
+    assert [record['i'] for record in log.replay()] == [0, 1, 2]
+    assert log.records == 3
+    # The next append trims the torn line first
+    log.append({'op': 'route', 'i': 3})
+    log.close()
+    assert [record['i'] for record in log.replay()] == [0, 1, 2, 3]
+
+
+def test_rotation_keeps_records_until_discarded(workdir):
+    log = StateLog("state.log")
+    log.append({'i': 0})
+    log.rotate()
+    assert log.records == 0
+    assert not os.path.exists("state.log")
+    log.append({'i': 1})
+    # A second rotation before the first was discarded (a failed snapshot) keeps both, oldest first
+    log.rotate()
+    log.append({'i': 2})
+    log.close()
+    assert [record['i'] for record in log.replay()] == [0, 1, 2]
+    log.discard_rotated()
+    assert [record['i'] for record in log.replay()] == [2]
+
+
+def test_changes_survive_a_failed_snapshot(workdir, monkeypatch):
+    engine = BookingEngine()
+    engine.load()
+    departure = engine.route(ROUTE)['next_departure']
+    engine.book(ROUTE, "alice", 'MTN Mobile Money', seat=5)
+
+    def broken():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(engine, 'save_state', broken)
+    engine.save()
+    assert os.path.exists(engine.state_log.rotated_path)
+    engine.book(ROUTE, "bob", 'MTN Mobile Money', seat=6)
+    engine.state_log.sync()
+
+    # A restart now replays the rotated log and then the live one
+    restarted = BookingEngine()
+    restarted.load()
+    seats = restarted.route(ROUTE)['seat_maps'][departure]
+    assert seats.is_taken(5) and seats.is_taken(6)
+    # ...and folds them into a snapshot, after which the logs are gone
+    assert not os.path.exists(restarted.state_log.rotated_path)
+    restarted.close()
+    del engine.save_state
+    engine.close()
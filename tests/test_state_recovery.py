@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import booking_engine
+from booking_engine import BookingEngine, BookingError, HISTORY_BACKEND, open_history
+
+REPO = os.path.dirname(os.path.abspath(booking_engine.__file__))
+CRASHED = 3
+
+ROUTE = "Express A - Kayonza"
+
+
+def run_until_crash(workdir, code):
+    # Runs code in a fresh interpreter in workdir, ending it with os._exit so no flush or close runs
+    script = textwrap.dedent(code) + f"\nos._exit({CRASHED})\n"
+    done = subprocess.run([sys.executable, "-c", script], cwd=workdir, env=dict(os.environ, PYTHONPATH=REPO),
+                          capture_output=True, text=True, timeout=60)
+    assert done.returncode == CRASHED, done.stderr
+
+
+@pytest.mark.parametrize("backend", ["journal", "sqlite", "binary"])
+def test_sold_seat_survives_a_crash(workdir, backend):
+    run_until_crash(workdir, f"""
+        import os
+        from booking_engine import BookingEngine, open_history
+        engine = BookingEngine(history=open_history({backend!r}))
+        engine.load()
+        ticket = engine.book({ROUTE!r}, "alice", "MTN Mobile Money", seat=5)
+        print(ticket['departure'])
+    """)
+    engine = BookingEngine(history=open_history(backend))
+    engine.load()
+    try:
+        sold = engine.search_history({'user': 'alice'})[0]
+        assert len(sold) == 1
+        departure = sold[0]['departure']
+        assert engine.route(ROUTE)['seat_maps'][departure].is_taken(5)
+        with pytest.raises(BookingError):
+            engine.book(ROUTE, "bob", "MTN Mobile Money", seat=5, departure=departure)
+    finally:
+        engine.close()
+
+
+def test_cancelled_seat_survives_a_crash(workdir):
+    run_until_crash(workdir, f"""
+        import os
+        from booking_engine import BookingEngine
+        engine = BookingEngine()
+        engine.load()
+        ticket = engine.book({ROUTE!r}, "alice", "MTN Mobile Money", seat=5)
+        engine.save()
+        engine.cancel(ticket['ticket_id'])
+    """)
+    engine = BookingEngine(history=open_history(HISTORY_BACKEND))
+    engine.load()
+    try:
+        departure = engine.route(ROUTE)['next_departure']
+        assert engine.book(ROUTE, "bob", "MTN Mobile Money", seat=5, departure=departure)['seat'] == 5
+    finally:
+        engine.close()
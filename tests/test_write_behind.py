@@ -0,0 +1,44 @@
+import threading
+
+from write_behind import WriteBehind
+
+
+class Recorder:
+    def __init__(self):
+        self.flushes = []
+        self.flushed = threading.Event()
+
+    def __call__(self, keys):
+        self.flushes.append(set(keys))
+        self.flushed.set()
+
+
+def test_close_flushes_pending_writes():
+    recorder = Recorder()
+    writer = WriteBehind(recorder, interval=60.0)
+    writer.mark(('profile', "alice"))
+    writer.mark(('profile', "bob"))
+    assert writer.pending() == 2
+    writer.close()
+    assert recorder.flushes == [{('profile', "alice"), ('profile', "bob")}]
+    assert writer.pending() == 0
+
+
+def test_repeated_marks_are_written_once():
+    recorder = Recorder()
+    writer = WriteBehind(recorder, interval=0.05)
+    for _ in range(100):
+        writer.mark(('profile', "alice"))
+    assert recorder.flushed.wait(5)
+    writer.close()
+    assert recorder.flushes == [{('profile', "alice")}]
+
+
+def test_a_full_batch_is_flushed_without_waiting():
+    recorder = Recorder()
+    writer = WriteBehind(recorder, interval=60.0, batch=3)
+    for user in ("a", "b", "c"):
+        writer.mark(('profile', user))
+    assert recorder.flushed.wait(5)
+    assert recorder.flushes[0] == {('profile', "a"), ('profile', "b"), ('profile', "c")}
+    writer.close()
@@ -0,0 +1,117 @@
+import datetime
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+MINUTES_PER_DAY = 24 * 60
+
+# Days of departures kept ahead, starting today
+TIMETABLE_DAYS = 2
+
+# Service patterns: weekdays served (Monday is 0), minutes between trips, trips per day.
+# A route picks one or more with 'pattern'; 'headway' and 'trips' on the route override them.
+SERVICE_PATTERNS = {
+    'daily': {'days': (0, 1, 2, 3, 4, 5, 6), 'headway': 30, 'trips': 8},
+    'weekday': {'days': (0, 1, 2, 3, 4), 'headway': 30, 'trips': 8},
+    'weekend': {'days': (5, 6), 'headway': 60, 'trips': 4},
+}
+
+HHMM = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(MINUTES_PER_DAY)]
+
+
+def parse_time(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def minute_of(when=None):
+    # Absolute minute: days since 0001-01-01 * 1440 + minute of the day
+    when = when or datetime.datetime.now()
+    return when.toordinal() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+@lru_cache(maxsize=64)
+def day_string(day):
+    return datetime.date.fromordinal(day).isoformat()
+
+
+@lru_cache(maxsize=64)
+def day_label(day):
+    return datetime.date.fromordinal(day).strftime("%a")
+
+
+def departure_key(minute):
+    # "YYYY-MM-DD HH:MM": sorts like the minute it names and is what bookings and seat maps are keyed by
+    day, minute_of_day = divmod(minute, MINUTES_PER_DAY)
+    return f"{day_string(day)} {HHMM[minute_of_day]}"
+
+
+def parse_departure_key(key):
+    day = datetime.date.fromisoformat(key[:10]).toordinal()
+    return day * MINUTES_PER_DAY + parse_time(key[11:16])
+
+
+def departure_label(key, now=None):
+    # "HH:MM" for today's departures, "Tue 05:00" for later days
+    minute = parse_departure_key(key)
+    day = minute // MINUTES_PER_DAY
+    if day == (now if now is not None else minute_of()) // MINUTES_PER_DAY:
+        return HHMM[minute % MINUTES_PER_DAY]
+    return f"{day_label(day)} {HHMM[minute % MINUTES_PER_DAY]}"
+
+
+class Timetable:
+    # Departures per route as sorted arrays of absolute minutes covering TIMETABLE_DAYS days.
+    # Finding the next departure for a given time is one bisect.
+    def __init__(self, days=TIMETABLE_DAYS):
+        self.days = days
+        self.first_day = None
+        self.departures = {}
+
+    def build(self, routes, now=None):
+        self.first_day = (now if now is not None else minute_of()) // MINUTES_PER_DAY
+        self.departures = {option['name']: self.route_departures(option) for option in routes}
+
+    def route_departures(self, option):
+        patterns = option.get('pattern', 'daily')
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        start = parse_time(option['start_time'])
+        minutes = []
+        for day in range(self.first_day, self.first_day + self.days):
+            weekday = (day - 1) % 7  # date.fromordinal(1) is a Monday
+            for name in patterns:
+                pattern = SERVICE_PATTERNS[name]
+                if weekday not in pattern['days']:
+                    continue
+                headway = option.get('headway', pattern['headway'])
+                trips = option.get('trips', pattern['trips'])
+                first = day * MINUTES_PER_DAY + start
+                minutes.extend(range(first, first + trips * headway, headway))
+        return array('l', sorted(set(minutes)))
+
+    def covers(self, now):
+        # Rebuild once today is the last day held, so tomorrow's departures are always known
+        return self.first_day is not None and now // MINUTES_PER_DAY < self.first_day + self.days - 1
+
+    def next_departure(self, name, now):
+        departures = self.departures.get(name)
+        if not departures:
+            return None
+        index = bisect_left(departures, now)
+        return departures[index] if index < len(departures) else None
+
+    def upcoming(self, name, now, limit=8):
+        departures = self.departures.get(name, ())
+        index = bisect_left(departures, now)
+        return list(departures[index:index + limit])
+
+    def between(self, name, low, high):
+        # Departures in [low, high)
+        departures = self.departures.get(name, ())
+        return departures[bisect_left(departures, low):bisect_left(departures, high)]
+
+    def is_departure(self, name, minute):
+        departures = self.departures.get(name, ())
+        index = bisect_left(departures, minute)
+        return index < len(departures) and departures[index] == minute
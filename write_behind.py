@@ -0,0 +1,84 @@
+# In BookingEngine this now carries only two things: profile records when profiles live in the
+# JSON file (PROFILE_BACKEND = "json"), and the check for whether the state log is due a
+# snapshot. Seat changes are logged synchronously, and the SQLite profile and history backends
+# commit their own writes, so with the default backends little passes through here.
+import atexit
+import threading
+import time
+
+# Flush dirty keys this many seconds after the first one is marked, or as soon as this many are dirty
+FLUSH_INTERVAL = 0.2
+FLUSH_BATCH = 256
+
+
+class WriteBehind:
+    # Collects dirty keys and hands them to flush(keys) from a background thread. Marking a key
+    # that is already dirty costs nothing, so a burst of changes to one profile is written once.
+    # flush() also runs on close() and at interpreter exit, but a crash loses what is still
+    # marked: only use it for state that may lag by FLUSH_INTERVAL, never for sold seats.
+    def __init__(self, flush, interval=FLUSH_INTERVAL, batch=FLUSH_BATCH):
+        self.flush_callback = flush
+        self.interval = interval
+        self.batch = batch
+        self._dirty = set()
+        self._dirty_since = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def mark(self, key):
+        with self._cond:
+            if not self._dirty:
+                self._dirty_since = time.monotonic()
+            self._dirty.add(key)
+            if self._thread is None and not self._stopping:
+                self._start_locked()
+            if len(self._dirty) >= self.batch:
+                self._cond.notify()
+
+    def pending(self):
+        return len(self._dirty)
+
+    def flush(self):
+        # Writes everything marked so far before returning; safe to call from any thread
+        with self._flush_lock:
+            with self._cond:
+                dirty = self._dirty
+                self._dirty = set()
+                self._dirty_since = None
+            if dirty:
+                self.flush_callback(dirty)
+
+    def close(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+            atexit.unregister(self.flush)
+        self.flush()
+
+    def _start_locked(self):
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._dirty:
+                        wait = self._dirty_since + self.interval - time.monotonic()
+                        if wait <= 0 or len(self._dirty) >= self.batch:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing changes: {e}")